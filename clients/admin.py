@@ -1,9 +1,23 @@
+import io
+import json
+
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import (
+    HttpResponseBadRequest,
+    HttpResponseNotAllowed,
+    StreamingHttpResponse,
+)
+from django.urls import path
+
+from mysite.pagination import KeysetPaginationMixin
+from mysite.search import IndexedSearchMixin
 
+from .bulk_import import FORMATS, file_format, import_users, read_records
 from .models import ClientUser
 
 
-class ClientUserAdmin(admin.ModelAdmin):
+class ClientUserAdmin(KeysetPaginationMixin, IndexedSearchMixin, admin.ModelAdmin):
     list_display = (
         "id",
         "name",
@@ -16,6 +30,53 @@ class ClientUserAdmin(admin.ModelAdmin):
     )
     list_filter = ("date_joined",)
     search_fields = ("name", "email", "id")
+    search_by_id = True
+    keyset_field = "date_joined"
+
+    def get_urls(self):
+        # ex: POST /admin/clients/clientuser/import/ with file=users.csv
+        return [
+            path(
+                "import/",
+                self.admin_site.admin_view(self.import_view),
+                name="clients_clientuser_import",
+            ),
+        ] + super().get_urls()
+
+    def import_view(self, request):
+        """Create the users of the uploaded `file`, see clients.bulk_import.
+
+        Streams the result of every record as NDJSON, records only get one
+        once their chunk is committed. To resume an import that broke off,
+        post the file again with `start` set to the number of results
+        received.
+        """
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        if request.method != "POST":
+            return HttpResponseNotAllowed(["POST"])
+        upload = request.FILES.get("file")
+        if upload is None:
+            return HttpResponseBadRequest("A CSV or JSONL file is required.")
+        record_format = request.POST.get("format") or file_format(upload.name)
+        if record_format not in FORMATS:
+            return HttpResponseBadRequest(
+                f"Unknown format, expected one of {', '.join(FORMATS)}."
+            )
+        try:
+            start = int(request.POST.get("start", 0))
+        except ValueError:
+            return HttpResponseBadRequest("start must be a number of records.")
+
+        lines = io.TextIOWrapper(upload, encoding="utf-8-sig", newline="")
+        results = import_users(read_records(lines, record_format), start=start)
+        response = StreamingHttpResponse(
+            (json.dumps(result) + "\n" for result in results),
+            content_type="application/x-ndjson",
+        )
+        # Keep proxies from holding the stream back until it ends.
+        response["X-Accel-Buffering"] = "no"
+        return response
 
 
 admin.site.register(ClientUser, ClientUserAdmin)
@@ -1,4 +1,5 @@
 from django.contrib.auth.backends import BaseBackend
+from . import user_cache
 from .models import ClientUser
 
 
@@ -6,13 +7,13 @@ class ClientUserBackend(BaseBackend):
     def authenticate(self, request, email=None, password=None, **kwargs):
         try:
             user = ClientUser.objects.get(email=email)
-            if user.check_password(password):
+            if user.check_password(password) and user.is_active:
                 return user
         except ClientUser.DoesNotExist:
             return None
 
     def get_user(self, user_id):
-        try:
-            return ClientUser.objects.get(pk=user_id)
-        except ClientUser.DoesNotExist:
-            return None
+        # Served from user_cache, the signals keep it current. Deactivated
+        # users are logged out on their next request.
+        user = user_cache.get_user(user_id)
+        return user if user is not None and user.is_active else None
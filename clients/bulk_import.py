@@ -0,0 +1,179 @@
+"""Creating many client users at once, for onboarding customers.
+
+Records come as CSV with a header row, or as JSONL, one object per line.
+Each has an email and a name, optionally a password and is_active. Users
+imported without a password get an unusable one, to be set through a
+password reset.
+
+Records are handled CHUNK_SIZE at a time:
+1. they are checked like ClientUserImportForm says, and their emails
+   normalized;
+2. emails already seen earlier in the file are reported as duplicates, and
+   those of existing users found with one query on the upper-case email
+   index, which is how the admin compares them;
+3. only then are the passwords of the users left hashed, across a pool of
+   processes since PBKDF2 is slow on purpose;
+4. the users are inserted with bulk_create() and the chunk committed.
+
+Every record gets a result. An import that was interrupted resumes by
+skipping the records it got through (`start`); users whose chunk was
+committed after that count was last saved are reported as existing.
+"""
+
+import csv
+import json
+import os
+
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Upper
+
+from .forms import ClientUserImportForm
+from .hashing import PasswordHasher
+from .models import ClientUser
+
+CHUNK_SIZE = 500
+
+FORMATS = ("csv", "jsonl")
+
+CREATED = "created"
+EXISTS = "exists"
+DUPLICATE = "duplicate"
+INVALID = "invalid"
+
+
+def file_format(filename):
+    """Return the format a file name's extension stands for, None if unknown."""
+    extension = os.path.splitext(filename)[1].lower().lstrip(".")
+    extension = {"ndjson": "jsonl", "json": "jsonl"}.get(extension, extension)
+    return extension if extension in FORMATS else None
+
+
+def read_records(lines, record_format):
+    """Yield (line number, record) from an iterable of text lines.
+
+    Lines that are not valid JSON give None records, blank ones are skipped.
+    """
+    if record_format == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, None
+
+
+def _clean(record):
+    """Return (cleaned data, None) for a valid record, (None, errors) otherwise."""
+    if record is None:
+        return None, {"__all__": ["Invalid JSON."]}
+    if not isinstance(record, dict):
+        return None, {"__all__": ["Expected a JSON object."]}
+    form = ClientUserImportForm(record)
+    if not form.is_valid():
+        return None, form.errors.get_json_data()
+    data = form.cleaned_data
+    data["email"] = ClientUser.objects.normalize_email(data["email"])
+    return data, None
+
+
+def _existing(emails):
+    """Return the upper-cased emails, out of `emails`, users already have."""
+    return set(
+        ClientUser.objects.annotate(upper_email=Upper("email"))
+        .filter(upper_email__in=[email.upper() for email in emails])
+        .values_list("upper_email", flat=True)
+    )
+
+
+def _import_chunk(chunk, seen, hasher):
+    results = []
+    new = []
+    for line, record in chunk:
+        data, errors = _clean(record)
+        email = record.get("email") if isinstance(record, dict) else None
+        result = {"line": line, "email": email}
+        results.append(result)
+        if errors is not None:
+            result.update(status=INVALID, errors=errors)
+            continue
+        result["email"] = data["email"]
+        key = data["email"].upper()
+        if key in seen:
+            result["status"] = DUPLICATE
+            continue
+        seen.add(key)
+        new.append((result, data))
+
+    existing = _existing(data["email"] for _, data in new)
+    pending = [data for _, data in new if data["email"].upper() not in existing]
+    hashes = iter(
+        hasher.hash([data["password"] for data in pending if data["password"]])
+    )
+    for data in pending:
+        data["password"] = next(hashes) if data["password"] else make_password(None)
+
+    for attempt in range(2):
+        users = []
+        for result, data in new:
+            if data["email"].upper() in existing:
+                result["status"] = EXISTS
+                continue
+            user = ClientUser(
+                email=data["email"],
+                name=data["name"],
+                is_active=data["is_active"] is not False,
+                password=data["password"],
+            )
+            users.append((result, user))
+        try:
+            with transaction.atomic():
+                ClientUser.objects.bulk_create(user for _, user in users)
+            break
+        except IntegrityError:
+            # Someone signed up with one of the emails meanwhile.
+            if attempt:
+                raise
+            existing = _existing(data["email"] for _, data in new)
+    for result, user in users:
+        result.update(status=CREATED, id=user.pk)
+    return results
+
+
+def import_users(records, start=0, processes=None, chunk_size=CHUNK_SIZE, done=None):
+    """Create users from (line, record) pairs, yield each record's result.
+
+    Results have the record's line, email and status, the id of the user
+    created, or the errors of an invalid record. The first `start` records
+    are skipped. `done(count)` is called with the number of records gone
+    through once each chunk is committed.
+    """
+    hasher = PasswordHasher(processes)
+    seen = set()
+    count = start
+    chunk = []
+    try:
+        for index, item in enumerate(records):
+            if index < start:
+                continue
+            chunk.append(item)
+            if len(chunk) < chunk_size:
+                continue
+            yield from _import_chunk(chunk, seen, hasher)
+            count += len(chunk)
+            chunk = []
+            if done is not None:
+                done(count)
+        if chunk:
+            yield from _import_chunk(chunk, seen, hasher)
+            count += len(chunk)
+            if done is not None:
+                done(count)
+    finally:
+        hasher.close()
@@ -15,3 +15,13 @@ class ClientUserSignupForm(forms.ModelForm):
         if commit:
             user.save()
         return user
+
+
+class ClientUserImportForm(forms.Form):
+    """One record of a bulk import, see clients.bulk_import."""
+
+    email = forms.EmailField(max_length=254)
+    name = forms.CharField(max_length=150)
+    password = forms.CharField(required=False, strip=False)
+    # Active unless told otherwise.
+    is_active = forms.NullBooleanField(required=False)
@@ -0,0 +1,47 @@
+"""Password hashing spread over a pool of processes.
+
+Kept apart from the models: spawned workers import this module, and they
+only get the password hashers configured, no app loaded.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+
+def _configure_worker(password_hashers):
+    if not settings.configured:
+        settings.configure(PASSWORD_HASHERS=password_hashers)
+
+
+class PasswordHasher:
+    """Hashes batches of passwords across a pool of processes.
+
+    The pool is started on the first batch of more than one. Workers are
+    spawned rather than forked, forking a threaded server is not safe.
+    """
+
+    def __init__(self, processes=None):
+        self.processes = processes or os.cpu_count() or 1
+        self._pool = None
+
+    def hash(self, passwords):
+        if self.processes == 1 or len(passwords) < 2:
+            return [make_password(password) for password in passwords]
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_configure_worker,
+                initargs=(settings.PASSWORD_HASHERS,),
+            )
+        chunksize = max(1, len(passwords) // (self.processes * 4))
+        return list(self._pool.map(make_password, passwords, chunksize=chunksize))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
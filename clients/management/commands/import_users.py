@@ -0,0 +1,98 @@
+import json
+import os
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from clients.bulk_import import (
+    CHUNK_SIZE,
+    CREATED,
+    FORMATS,
+    file_format,
+    import_users,
+    read_records,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create client users from a CSV or JSONL file, hashing passwords on "
+        "all cores. Resumes where an interrupted run of the same file stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV (with a header row) or JSONL file.")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="Format of the file, guessed from its extension by default.",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            help="Processes hashing passwords (default: one per core).",
+        )
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+        parser.add_argument(
+            "--checkpoint",
+            help="File recording how far the import got (default: <path>.progress).",
+        )
+        parser.add_argument(
+            "--restart",
+            action="store_true",
+            help="Start from the first record, even if a checkpoint says otherwise.",
+        )
+        parser.add_argument(
+            "--report",
+            help="Write the result of every record not created to this JSONL file "
+            "(default: stderr).",
+        )
+
+    def handle(self, *args, **options):
+        record_format = options["format"] or file_format(options["path"])
+        if record_format is None:
+            raise CommandError("Cannot tell the format of the file, pass --format.")
+        checkpoint = options["checkpoint"] or f"{options['path']}.progress"
+
+        start = 0
+        if not options["restart"] and os.path.exists(checkpoint):
+            with open(checkpoint, encoding="utf-8") as f:
+                start = json.load(f)["done"]
+            self.stdout.write(f"Resuming after record {start}.")
+
+        def done(count):
+            # Written aside and renamed, a crash never leaves half a checkpoint
+            with open(f"{checkpoint}.tmp", "w", encoding="utf-8") as f:
+                json.dump({"done": count}, f)
+            os.replace(f"{checkpoint}.tmp", checkpoint)
+
+        report = (
+            open(options["report"], "w", encoding="utf-8")
+            if options["report"]
+            else self.stderr
+        )
+        counts = Counter()
+        try:
+            with open(options["path"], encoding="utf-8-sig", newline="") as f:
+                for result in import_users(
+                    read_records(f, record_format),
+                    start=start,
+                    processes=options["processes"],
+                    chunk_size=options["chunk_size"],
+                    done=done,
+                ):
+                    counts[result["status"]] += 1
+                    if result["status"] != CREATED:
+                        report.write(json.dumps(result) + "\n")
+        finally:
+            if report is not self.stderr:
+                report.close()
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(
+            self.style.SUCCESS(
+                ", ".join(f"{status}: {count}" for status, count in counts.items())
+                or "No records."
+            )
+        )
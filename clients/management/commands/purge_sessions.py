@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from mysite.sessions import CLEAR_CHUNK_SIZE, SessionStore
+
+
+class Command(BaseCommand):
+    help = "Delete expired sessions in chunks, without long-held locks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CLEAR_CHUNK_SIZE,
+            help="Sessions deleted per statement.",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0,
+            help="Seconds to wait between chunks.",
+        )
+
+    def handle(self, *args, **options):
+        deleted = SessionStore.clear_expired(
+            chunk_size=options["chunk_size"], pause=options["pause"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} session(s)."))
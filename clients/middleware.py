@@ -1,12 +0,0 @@
-from django.shortcuts import redirect
-from django.urls import reverse
-
-
-class RedirectLoggedInMiddleware:
-    def __init__(self, get_response):
-        self.get_response = get_response
-
-    def __call__(self, request):
-        if request.path == "/" and request.user.is_authenticated:
-            return redirect(reverse("polls:index"))  # Redirect to polls if logged in
-        return self.get_response(request)
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:50
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+import mysite.search
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("clients", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="clientuser",
+            index=models.Index(
+                django.db.models.functions.text.Upper("email"),
+                name="clients_user_email_upper",
+            ),
+        ),
+        mysite.search.CreateSearchIndex(
+            model_name="clientuser", fields=["name", "email"]
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("clients", "0002_search"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="clientuser",
+            index=models.Index(
+                fields=["date_joined", "id"], name="clients_user_joined"
+            ),
+        ),
+    ]
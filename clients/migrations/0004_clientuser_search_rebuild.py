@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 18:40
+
+from django.db import migrations
+
+import mysite.search
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clients", "0003_keyset_indexes"),
+    ]
+
+    operations = [
+        mysite.search.RebuildSearchIndex(
+            model_name="clientuser", fields=["name", "email"]
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Upper
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
@@ -64,5 +65,21 @@ class ClientUser(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["name"]
 
+    class Meta:
+        indexes = [
+            # For the admin's exact email lookups, which compare upper case.
+            models.Index(Upper("email"), name="clients_user_email_upper"),
+            # Keyset pagination of the admin changelist, see mysite.pagination.
+            models.Index(fields=["date_joined", "id"], name="clients_user_joined"),
+        ]
+
     def __str__(self):
         return self.email
+
+    def get_session_auth_hash(self):
+        # Users loaded by clients.user_cache come without their password
+        # hash, and with the session hash that was computed from it.
+        cached = getattr(self, "cached_session_auth_hash", None)
+        if cached is not None and "password" not in self.__dict__:
+            return cached
+        return super().get_session_auth_hash()
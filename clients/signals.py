@@ -0,0 +1,16 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import user_cache
+from .models import ClientUser
+
+
+@receiver([post_save, post_delete], sender=ClientUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Right away for this process, and again once committed: a request
+    # reading the row before then would cache the old one. The id is read
+    # now, deleting clears it.
+    user_id = instance.pk
+    user_cache.invalidate(user_id)
+    transaction.on_commit(lambda: user_cache.invalidate(user_id))
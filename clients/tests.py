@@ -1,3 +1,354 @@
-from django.test import TestCase
+import datetime
+import io
+import json
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from mysite.middleware import RoutePolicyMiddleware
+from mysite.query_budget import QueryBudgetTestMixin
+from mysite.sessions import SessionStore, get_expiry_refresher
+
+from . import tokens, user_cache
+
+from . import urls
+from .bulk_import import import_users, read_records
+from .models import ClientUser
+
+
+class ClientsQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        ClientUser.objects.create_user(
+            email="member@example.com", password="secret", name="Member"
+        )
+
+    def test_views_stay_within_query_budget(self):
+        self.assertUrlsWithinBudget(
+            urls,
+            {},
+            post_data={
+                "signup": {
+                    "email": "new@example.com",
+                    "name": "New",
+                    "password": "secret",
+                },
+                "login": {"email": "member@example.com", "password": "secret"},
+                "apiToken": {"email": "member@example.com", "password": "secret"},
+            },
+        )
+
+
+class CachedUserTests(TestCase):
+    def setUp(self):
+        self.user = ClientUser.objects.create_user(
+            email="cached@example.com", password="secret", name="Cached"
+        )
+        self.client.force_login(
+            self.user, backend="clients.auth_backends.ClientUserBackend"
+        )
+
+    def test_user_is_loaded_without_queries_once_cached(self):
+        self.assertEqual(self.client.get("/polls/").status_code, 200)
+        request = self.client.get("/polls/").wsgi_request
+        with self.assertNumQueries(0):
+            self.assertEqual(request.user.email, "cached@example.com")
+
+    def test_password_hash_is_kept_out_of_the_cache(self):
+        self.client.get("/polls/")
+        snapshot = cache.get(user_cache.snapshot_key(self.user.pk))
+        self.assertNotIn("password", snapshot)
+        self.assertNotIn(self.user.password, json.dumps(snapshot, default=str))
+
+    def test_password_change_logs_other_sessions_out(self):
+        self.assertEqual(self.client.get("/polls/").status_code, 200)
+        self.user.set_password("changed")
+        self.user.save()
+        self.assertRedirects(self.client.get("/polls/"), "/clients/login/")
+
+    def test_deactivated_user_is_logged_out(self):
+        self.client.get("/polls/")
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get("/polls/")
+        self.assertRedirects(response, "/clients/login/")
+
+
+class AdminSearchTests(TestCase):
+    def setUp(self):
+        ClientUser.objects.create_user(
+            email="jane.smith@example.com", password="secret", name="Jane"
+        )
+        ClientUser.objects.create_user(
+            email="bob@gmail.com", password="secret", name="Bob"
+        )
+        admin = User.objects.create_superuser("admin", "admin@example.org", "secret")
+        self.client.force_login(
+            admin, backend="django.contrib.auth.backends.ModelBackend"
+        )
+
+    def search(self, term):
+        response = self.client.get("/admin/clients/clientuser/", {"q": term})
+        return sorted(user.name for user in response.context["cl"].result_list)
+
+    def test_finds_users_by_email_parts(self):
+        self.assertEqual(self.search("example.com"), ["Jane"])
+        self.assertEqual(self.search("gmail"), ["Bob"])
+        self.assertEqual(self.search("smith"), ["Jane"])
+        self.assertEqual(self.search("bob@gmail.com"), ["Bob"])
+        self.assertEqual(self.search("com"), ["Bob", "Jane"])
+
+
+class SessionStoreTests(TestCase):
+    def test_saved_session_loads_without_queries(self):
+        session = SessionStore()
+        session["answer"] = 42
+        session.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(SessionStore(session.session_key)["answer"], 42)
+
+    def test_expiry_refresh_is_written_in_batch(self):
+        session = SessionStore()
+        session["answer"] = 42
+        session.save()
+        session.expire_date -= datetime.timedelta(hours=2)
+        Session.objects.filter(pk=session.session_key).update(
+            expire_date=session.expire_date
+        )
+        self.assertTrue(session.refresh_expiry(60 * 60))
+        self.assertFalse(session.refresh_expiry(60 * 60))
+        get_expiry_refresher().flush()
+        self.assertEqual(
+            Session.objects.get(pk=session.session_key).expire_date,
+            session.expire_date,
+        )
+
+    def test_clear_expired_deletes_in_chunks(self):
+        past = timezone.now() - datetime.timedelta(days=1)
+        Session.objects.bulk_create(
+            Session(session_key=f"expired{i:05}", session_data="", expire_date=past)
+            for i in range(5)
+        )
+        live = SessionStore()
+        live["answer"] = 42
+        live.save()
+        self.assertEqual(SessionStore.clear_expired(chunk_size=2), 5)
+        self.assertEqual(Session.objects.get().pk, live.session_key)
+
+    def test_purged_session_is_not_served_from_the_cache(self):
+        session = SessionStore()
+        session["answer"] = 42
+        session.save()
+        # Refreshed in the cache, but the expiry written lags behind.
+        past = timezone.now() - datetime.timedelta(days=1)
+        Session.objects.filter(pk=session.session_key).update(expire_date=past)
+        self.assertEqual(SessionStore.clear_expired(), 1)
+        self.assertNotIn("answer", SessionStore(session.session_key))
+
+    def test_purge_sessions_command(self):
+        past = timezone.now() - datetime.timedelta(days=1)
+        Session.objects.create(session_key="expired", session_data="", expire_date=past)
+        out = io.StringIO()
+        call_command("purge_sessions", chunk_size=1, stdout=out)
+        self.assertEqual(out.getvalue().strip(), "Deleted 1 session(s).")
+        self.assertFalse(Session.objects.exists())
+
+
+class ApiTokenTests(TestCase):
+    def setUp(self):
+        self.user = ClientUser.objects.create_user(
+            email="api@example.com", password="secret", name="Api"
+        )
+
+    def post_contact(self, token=None):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        return self.client.post(
+            "/polls/api/contact/",
+            {"name": "Api", "email": "api@example.com", "message": "Hello"},
+            headers=headers,
+        )
+
+    def test_issued_token_authenticates_contact_api(self):
+        response = self.client.post(
+            "/clients/api/token/", {"email": "api@example.com", "password": "secret"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.post_contact(response.json()["token"]).status_code, 202)
+        self.assertEqual(self.post_contact().status_code, 401)
+
+    def test_invalid_tokens_are_rejected(self):
+        token, _ = tokens.issue_token(self.user)
+        self.assertEqual(self.post_contact(token + "0").status_code, 401)
+        expired, _ = tokens.issue_token(self.user, max_age=-1)
+        self.assertEqual(self.post_contact(expired).status_code, 401)
+
+    def test_keys_can_be_rotated(self):
+        with override_settings(API_TOKEN_KEYS=["old:first-secret"]):
+            token, _ = tokens.issue_token(self.user)
+        with override_settings(API_TOKEN_KEYS=["new:second", "old:first-secret"]):
+            self.assertEqual(tokens.verify_token(token)["sub"], self.user.pk)
+            self.assertTrue(tokens.issue_token(self.user)[0].startswith("new."))
+        with override_settings(API_TOKEN_KEYS=["new:second"]):
+            with self.assertRaises(tokens.InvalidToken):
+                tokens.verify_token(token)
+
+
+class BulkImportTests(TestCase):
+    def setUp(self):
+        ClientUser.objects.create_user(
+            email="existing@example.com", password="secret", name="Existing"
+        )
+
+    def test_every_record_gets_a_result(self):
+        lines = [
+            '{"email": "ann@Example.COM", "name": "Ann", "password": "first"}',
+            '{"email": "bob@example.com", "name": "Bob", "password": "second"}',
+            '{"email": "cid@example.com", "name": "Cid", "is_active": false}',
+            "",
+            '{"email": "ANN@example.com", "name": "Ann again"}',
+            '{"email": "Existing@example.com", "name": "Existing"}',
+            '{"email": "not an email", "name": "Bad"}',
+            "{not json",
+        ]
+        results = list(
+            import_users(read_records(lines, "jsonl"), processes=2, chunk_size=3)
+        )
+
+        self.assertEqual(
+            [(r["line"], r["status"]) for r in results],
+            [
+                (1, "created"),
+                (2, "created"),
+                (3, "created"),
+                (5, "duplicate"),
+                (6, "exists"),
+                (7, "invalid"),
+                (8, "invalid"),
+            ],
+        )
+        self.assertTrue(
+            ClientUser.objects.get(email="ann@example.com").check_password("first")
+        )
+        self.assertTrue(
+            ClientUser.objects.get(email="bob@example.com").check_password("second")
+        )
+        cid = ClientUser.objects.get(email="cid@example.com")
+        self.assertFalse(cid.is_active)
+        self.assertFalse(cid.has_usable_password())
+
+    def test_admin_import_resumes_from_start(self):
+        admin = User.objects.create_superuser("admin", password="secret")
+        self.client.force_login(
+            admin, backend="django.contrib.auth.backends.ModelBackend"
+        )
+        upload = SimpleUploadedFile(
+            "users.csv",
+            b"email,name\nskipped@example.com,Skipped\nnew@example.com,New\n",
+        )
+        response = self.client.post(
+            "/admin/clients/clientuser/import/", {"file": upload, "start": 1}
+        )
+
+        self.assertEqual(response.status_code, 200)
+        results = [json.loads(line) for line in response.streaming_content]
+        self.assertEqual(
+            [(r["line"], r["email"], r["status"]) for r in results],
+            [(3, "new@example.com", "created")],
+        )
+        self.assertFalse(
+            ClientUser.objects.filter(email="skipped@example.com").exists()
+        )
+
+
+class RoutePolicyTests(SimpleTestCase):
+    users = {
+        "anonymous": AnonymousUser(),
+        "client": ClientUser(email="member@example.com"),
+        "admin": User(username="admin", is_staff=True),
+    }
+    # Where each user type is sent, None when let through.
+    expected = {
+        "/": {"anonymous": None, "client": "/polls/", "admin": "/admin/login/"},
+        "/polls/": {
+            "anonymous": "/clients/login/",
+            "client": None,
+            "admin": "/admin/login/",
+        },
+        "/polls/1/": {
+            "anonymous": "/clients/login/",
+            "client": None,
+            "admin": "/admin/login/",
+        },
+        "/admin/": {"anonymous": None, "client": "/polls/", "admin": None},
+        "/clients/login/": {
+            "anonymous": None,
+            "client": None,
+            "admin": "/admin/login/",
+        },
+    }
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def public_paths(self):
+        paths = [settings.STATIC_URL, settings.MEDIA_URL]
+        paths += settings.ROUTE_POLICY_PUBLIC_PATHS
+        paths = [f"/{path.strip('/')}" for path in paths]
+        # The paths themselves, and what is below them
+        return paths + [f"{path}/x" for path in paths]
+
+    def location(self, response):
+        return response["Location"] if response.status_code == 302 else None
+
+    def test_redirects_by_user_type(self):
+        middleware = RoutePolicyMiddleware(lambda request: HttpResponse())
+        for path, targets in self.expected.items():
+            for kind, target in targets.items():
+                with self.subTest(path=path, user=kind):
+                    request = self.factory.get(path)
+                    request.user = self.users[kind]
+                    self.assertEqual(self.location(middleware(request)), target)
+
+    def test_public_paths_skip_the_user(self):
+        middleware = RoutePolicyMiddleware(lambda request: HttpResponse())
+        for path in self.public_paths():
+            with self.subTest(path=path):
+                # No request.user: looking at it would raise
+                response = middleware(self.factory.get(path))
+                self.assertEqual(response.status_code, 200)
+
+    async def test_async_redirects_by_user_type(self):
+        async def get_response(_request):
+            return HttpResponse()
+
+        middleware = RoutePolicyMiddleware(get_response)
+        for path, targets in self.expected.items():
+            for kind, target in targets.items():
+                with self.subTest(path=path, user=kind):
+                    request = self.factory.get(path)
+
+                    async def auser(kind=kind):
+                        return self.users[kind]
+
+                    request.auser = auser
+                    response = await middleware(request)
+                    self.assertEqual(self.location(response), target)
+                    # Loaded once, for the view and templates to reuse
+                    self.assertIs(request.user, self.users[kind])
+
+    async def test_async_public_paths_skip_the_user(self):
+        async def get_response(_request):
+            return HttpResponse()
+
+        middleware = RoutePolicyMiddleware(get_response)
+        for path in self.public_paths():
+            with self.subTest(path=path):
+                response = await middleware(self.factory.get(path))
+                self.assertEqual(response.status_code, 200)
@@ -0,0 +1,83 @@
+"""Stateless bearer tokens for ClientUser API access.
+
+A token is `<kid>.<payload>.<signature>`: the payload holds the user id and
+the expiry time, the signature is an HMAC-SHA256 of kid and payload with
+the key `kid` names. Checking a token needs neither the database nor a
+session, which also means a token stays valid until it expires, even if
+the user is deactivated meanwhile: keep API_TOKEN_MAX_AGE short.
+
+Keys are listed in settings.API_TOKEN_KEYS as "kid:secret", the first one
+signs new tokens and all of them are accepted. To rotate, put a new key
+first, and drop the old one once API_TOKEN_MAX_AGE has passed. Without any
+key configured, tokens are signed with one derived from SECRET_KEY.
+"""
+
+import json
+import time
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+KEY_SALT = "clients.tokens"
+
+DEFAULT_KID = "0"
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def signing_keys():
+    """Return {kid: secret} of the accepted keys, the signing one first."""
+    keys = {}
+    for entry in settings.API_TOKEN_KEYS:
+        kid, _, secret = entry.partition(":")
+        if not kid or not secret or "." in kid:
+            raise ValueError(f"Invalid API_TOKEN_KEYS entry for key {kid!r}.")
+        keys[kid] = secret
+    return keys or {DEFAULT_KID: settings.SECRET_KEY}
+
+
+def _signature(kid, payload, secret):
+    message = f"{kid}.{payload}"
+    return salted_hmac(KEY_SALT, message, secret=secret, algorithm="sha256").hexdigest()
+
+
+def issue_token(user, max_age=None):
+    """Return (token, expiry timestamp) for the user."""
+    max_age = settings.API_TOKEN_MAX_AGE if max_age is None else max_age
+    expires = int(time.time()) + max_age
+    kid, secret = next(iter(signing_keys().items()))
+    claims = {"sub": user.pk, "exp": expires}
+    payload = urlsafe_base64_encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{kid}.{payload}.{_signature(kid, payload, secret)}", expires
+
+
+def verify_token(token):
+    """Return the claims of a valid token, raise InvalidToken otherwise."""
+    try:
+        kid, payload, signature = token.split(".")
+    except ValueError as e:
+        raise InvalidToken("Malformed token.") from e
+    secret = signing_keys().get(kid)
+    if secret is None:
+        raise InvalidToken("Unknown signing key.")
+    if not constant_time_compare(signature, _signature(kid, payload, secret)):
+        raise InvalidToken("Invalid signature.")
+    try:
+        claims = json.loads(urlsafe_base64_decode(payload))
+        expires = claims["exp"]
+    except (TypeError, ValueError, KeyError) as e:
+        raise InvalidToken("Malformed token.") from e
+    if expires <= time.time():
+        raise InvalidToken("Token expired.")
+    return claims
+
+
+def request_token(request):
+    """Return the bearer token of the request, None if it has none."""
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return None
+    return token.strip()
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import signup_view, login_view, logout_view
+from .views import signup_view, login_view, logout_view, token_api
 
 app_name = "clients"
 
@@ -7,4 +7,6 @@ urlpatterns = [
     path("signup/", signup_view, name="signup"),
     path("login/", login_view, name="login"),
     path("logout/", logout_view, name="logout"),
+    # ex: /clients/api/token/
+    path("api/token/", token_api, name="apiToken"),
 ]
@@ -0,0 +1,107 @@
+"""Cached loading of the ClientUser behind a session.
+
+The authentication middleware loads the user on every request. Instead of
+querying the database each time, a snapshot of the few columns requests
+need is kept in a small in-process LRU, backed by the shared cache.
+
+Snapshots are stored with the user's version, which the model signals bump
+on every save and delete, so a snapshot built from a row that changed
+meanwhile is never served from the shared cache. Entries of the local LRU
+are dropped right away in the process that saved the user, and expire
+after LOCAL_TTL seconds elsewhere; that bounds how long a deactivated user
+stays logged in on other workers.
+"""
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from mysite.local_cache import LocalCache
+from mysite.versions import bump_version, get_version
+
+from .models import ClientUser
+
+SNAPSHOT_FIELDS = (
+    "id",
+    "email",
+    "name",
+    "is_active",
+    "is_staff",
+    "last_login",
+)
+
+SHARED_TIMEOUT = 5 * 60
+
+LOCAL_SIZE = 1024
+LOCAL_TTL = 5
+
+
+def version_key(user_id):
+    return f"clients:user:version:{user_id}"
+
+
+def snapshot_key(user_id):
+    return f"clients:user:snapshot:{user_id}"
+
+
+local_cache = LocalCache(LOCAL_SIZE, LOCAL_TTL)
+
+
+def _user(snapshot):
+    # The other columns are deferred, and loaded if something reads them.
+    # from_db() wants the values in the order of the model's fields.
+    names = [
+        f.attname for f in ClientUser._meta.concrete_fields if f.attname in snapshot
+    ]
+    user = ClientUser.from_db(
+        DEFAULT_DB_ALIAS, names, [snapshot[name] for name in names]
+    )
+    user.cached_session_auth_hash = snapshot.get("session_auth_hash")
+    return user
+
+
+def _shared_snapshot(user_id):
+    entries = cache.get_many([snapshot_key(user_id), version_key(user_id)])
+    snapshot = entries.get(snapshot_key(user_id))
+    version = entries.get(version_key(user_id))
+    if snapshot is not None and version is not None:
+        if snapshot["version"] == version:
+            return snapshot
+    return None
+
+
+def _build_snapshot(user_id):
+    # Read the version first: a save landing while the row is read bumps
+    # it, so the stored snapshot is never served.
+    version = get_version(version_key(user_id))
+    snapshot = (
+        ClientUser.objects.filter(pk=user_id)
+        .values(*SNAPSHOT_FIELDS, "password")
+        .first()
+    )
+    if snapshot is None:
+        return None
+    # The session is checked against a hash of the password hash, the
+    # password hash itself is kept out of the cache.
+    password = snapshot.pop("password")
+    snapshot["session_auth_hash"] = ClientUser(
+        password=password
+    ).get_session_auth_hash()
+    snapshot["version"] = version
+    cache.set(snapshot_key(user_id), snapshot, SHARED_TIMEOUT)
+    return snapshot
+
+
+def get_user(user_id):
+    """Return the user with the given id, None if there is none."""
+    snapshot = local_cache.get(user_id)
+    if snapshot is None:
+        snapshot = _shared_snapshot(user_id) or _build_snapshot(user_id)
+        if snapshot is None:
+            return None
+        local_cache.set(user_id, snapshot)
+    return _user(snapshot)
+
+
+def invalidate(user_id):
+    local_cache.delete(user_id)
+    bump_version(version_key(user_id))
@@ -1,10 +1,18 @@
+from django.conf import settings
+from django.http import JsonResponse
 from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
+from django.views.decorators.csrf import csrf_exempt
 
+from mysite.query_budget import query_budget
+
+from . import tokens
 from .forms import ClientUserSignupForm
 from .decorators import non_logged_in_user
+from .models import ClientUser
 
 
+@query_budget(10, max_time_ms=100)
 @non_logged_in_user
 def signup_view(request):
     if request.method == "POST":
@@ -19,6 +27,7 @@ def signup_view(request):
     return render(request, "clients/signup.html", {"form": form})
 
 
+@query_budget(8, max_time_ms=100)
 @non_logged_in_user
 def login_view(request):
     if request.method == "POST":
@@ -36,6 +45,31 @@ def login_view(request):
     return render(request, "clients/login.html")
 
 
+@query_budget(4, max_time_ms=50)
 def logout_view(request):
     logout(request)  # Logs out the user
     return redirect("/")  # Redirect to home or login page
+
+
+@query_budget(1, max_time_ms=50)
+@csrf_exempt
+def token_api(request):
+    """Issue an API token for the email and password posted."""
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+    user = authenticate(
+        request,
+        email=request.POST.get("email"),
+        password=request.POST.get("password"),
+    )
+    if not isinstance(user, ClientUser):
+        return JsonResponse({"error": "Invalid email or password"}, status=401)
+    token, expires = tokens.issue_token(user)
+    return JsonResponse(
+        {
+            "token": token,
+            "token_type": "Bearer",
+            "expires_at": expires,
+            "expires_in": settings.API_TOKEN_MAX_AGE,
+        }
+    )
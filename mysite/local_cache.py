@@ -0,0 +1,49 @@
+import threading
+import time
+from collections import OrderedDict
+
+from .metrics import CACHE_GETS, LOCAL_CACHE_HIT, LOCAL_CACHE_MISS
+
+
+class LocalCache:
+    """Thread-safe, bounded LRU keeping each entry at most `ttl` seconds.
+
+    Meant as a per-process tier in front of the shared cache, for values
+    read on most requests: the short TTL bounds how stale an entry can get
+    when another process changes the value.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self.entries[key]
+                entry = None
+            if entry is not None:
+                self.entries.move_to_end(key)
+        if entry is None:
+            CACHE_GETS.inc(LOCAL_CACHE_MISS)
+            return None
+        CACHE_GETS.inc(LOCAL_CACHE_HIT)
+        return entry[1]
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
@@ -0,0 +1,391 @@
+"""Request metrics, exposed at /metrics in the Prometheus text format.
+
+Every thread counts into its own dict, so recording a sample takes no lock:
+a request costs a few dict updates. The dicts of finished threads are
+folded into one. Each process writes its totals to
+`METRICS_DIR/<pid>-<start>.json` at most every METRICS_FLUSH_INTERVAL
+seconds (and when it exits), and /metrics adds up the files of all the
+workers. Files of exited workers are kept so counters never go back; empty
+METRICS_DIR when deploying, as with the multiprocess mode of the official
+Prometheus client.
+
+MetricsMiddleware records the latency and status of each request by URL
+name, and the queries QueryBudgetMiddleware counted for it. Cache hit rates
+and uploaded bytes are recorded where they happen.
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+# Seconds, the default buckets of the official Prometheus clients.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Label of the requests no URL pattern matched.
+UNMATCHED = "<unmatched>"
+
+# Other methods are labelled "other", labels must come from a bounded set.
+METHODS = frozenset(
+    ("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS", "TRACE")
+)
+
+_MISSING = object()
+
+
+class _ShardOwner:
+    __slots__ = ("__weakref__",)
+
+
+class Registry:  # pylint: disable=too-many-instance-attributes
+    """The metrics of this process, and their totals over all processes."""
+
+    def __init__(self):
+        self.metrics = {}
+        self._shards_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._next_flush = 0.0
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # A forked worker starts from zero, under a file of its own.
+        self._local = threading.local()
+        self._shards = {}
+        self._retired = {}
+        self._filename = f"{os.getpid()}-{time.time_ns()}.json"
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            # Collected with the thread's locals when the thread ends.
+            owner = self._local.owner = _ShardOwner()
+            with self._shards_lock:
+                self._shards[id(shard)] = shard
+            weakref.finalize(owner, self._retire, shard)
+        return shard
+
+    def _retire(self, shard):
+        """Fold the shard of a finished thread into the retired counts."""
+        with self._shards_lock:
+            # Absent when it belonged to the parent of a forked worker.
+            if self._shards.pop(id(shard), None) is not shard:
+                return
+            for key, value in shard.items():
+                self._retired[key] = self._retired.get(key, 0) + value
+
+    def add(self, key, amount):
+        shard = getattr(self._local, "shard", None) or self._shard()
+        shard[key] = shard.get(key, 0) + amount
+
+    def local_totals(self):
+        with self._shards_lock:
+            totals = dict(self._retired)
+            shards = list(self._shards.values())
+        for shard in shards:
+            # dict.copy() is atomic, the owning thread may keep counting.
+            for key, value in shard.copy().items():
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def maybe_flush(self):
+        """Flush when due, unless another thread already is."""
+        if time.monotonic() < self._next_flush:
+            return
+        # pylint: disable-next=consider-using-with
+        if self._flush_lock.acquire(blocking=False):
+            try:
+                self._flush()
+            finally:
+                self._flush_lock.release()
+
+    def flush(self):
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        self._next_flush = time.monotonic() + settings.METRICS_FLUSH_INTERVAL
+        totals = self.local_totals()
+        if not totals:
+            return
+        directory = settings.METRICS_DIR
+        path = os.path.join(directory, self._filename)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+                json.dump([[*key, value] for key, value in totals.items()], f)
+            os.replace(f"{path}.tmp", path)
+        except OSError:
+            logger.exception("Could not write the metrics to %s", path)
+
+    def totals(self):
+        """Return the totals of all processes, this one's being current."""
+        self.flush()
+        totals = {}
+        directory = settings.METRICS_DIR
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(directory, name), encoding="utf-8") as f:
+                    samples = json.load(f)
+            except (FileNotFoundError, ValueError):
+                continue
+            for metric, labels, part, value in samples:
+                key = (metric, tuple(labels), part)
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def exposition(self):
+        """Return all metrics in the Prometheus text format."""
+        by_metric = {}
+        for (name, labels, part), value in self.totals().items():
+            by_metric.setdefault(name, {}).setdefault(labels, {})[part] = value
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for labels, parts in sorted(by_metric.get(name, {}).items()):
+                lines.extend(metric.samples(dict(zip(metric.labels, labels)), parts))
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\""))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """A metric counted into `metric_registry`, exposed under `name`."""
+
+    kind = None
+
+    def __init__(self, metric_registry, name, documentation, labels=()):
+        self.registry = metric_registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        metric_registry.metrics[name] = self
+
+    def samples(self, labels, parts):
+        """Return the exposition lines of one set of label values."""
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        """Add to the count of the label values, in the order of `labels`."""
+        self.registry.add((self.name, labels, None), amount)
+
+    def samples(self, labels, parts):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(parts[None])}"]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, *args, buckets=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = buckets
+
+    def observe(self, labels, value):
+        # Only the observation's own bucket is counted, the cumulative counts
+        # Prometheus expects are computed when exposing.
+        add = self.registry.add
+        add((self.name, labels, bisect_left(self.buckets, value)), 1)
+        add((self.name, labels, "sum"), value)
+
+    def samples(self, labels, parts):
+        lines = []
+        count = 0
+        for index, bound in enumerate((*self.buckets, "+Inf")):
+            count += parts.get(index, 0)
+            le = bound if isinstance(bound, str) else repr(float(bound))
+            bucket_labels = _format_labels({**labels, "le": le})
+            lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+        total = _format_value(parts.get("sum", 0.0))
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+REQUEST_DURATION = Histogram(
+    registry,
+    "http_request_duration_seconds",
+    "Time spent serving requests, middlewares included.",
+    labels=("view", "method"),
+    buckets=LATENCY_BUCKETS,
+)
+RESPONSES = Counter(
+    registry,
+    "http_responses_total",
+    "Responses sent, by status code.",
+    labels=("view", "status"),
+)
+DB_QUERIES = Counter(
+    registry,
+    "db_queries_total",
+    "Database queries run while serving requests.",
+    labels=("view",),
+)
+DB_TIME = Counter(
+    registry,
+    "db_query_duration_seconds_total",
+    "Time spent in database queries while serving requests.",
+    labels=("view",),
+)
+CACHE_GETS = Counter(
+    registry,
+    "cache_gets_total",
+    'Cache lookups, by tier ("local" per-process caches, "shared" the Django '
+    "caches) and result.",
+    labels=("tier", "result"),
+)
+UPLOAD_BYTES = Counter(
+    registry,
+    "upload_bytes_total",
+    'Bytes of contact attachments stored, "form" posted at once, "chunked" '
+    "through resumable uploads.",
+    labels=("kind",),
+)
+
+CACHE_HIT = ("shared", "hit")
+CACHE_MISS = ("shared", "miss")
+LOCAL_CACHE_HIT = ("local", "hit")
+LOCAL_CACHE_MISS = ("local", "miss")
+
+
+def _instrument_cache(backend_class):
+    """Count the hits and misses of a cache backend class's get methods.
+
+    Patches the class: every cache alias using it is counted. The async
+    methods of the backends call these. get_many() is only counted when
+    the backend implements it, BaseCache's calls get().
+    """
+    get = backend_class.get
+    if getattr(get, "counted", False):
+        return
+
+    @wraps(get)
+    def counted_get(self, key, default=None, version=None):
+        value = get(self, key, _MISSING, version=version)
+        if value is _MISSING:
+            CACHE_GETS.inc(CACHE_MISS)
+            return default
+        CACHE_GETS.inc(CACHE_HIT)
+        return value
+
+    counted_get.counted = True
+    backend_class.get = counted_get
+
+    get_many = backend_class.get_many
+    if get_many is BaseCache.get_many:
+        return
+
+    @wraps(get_many)
+    def counted_get_many(self, keys, version=None):
+        keys = list(keys)
+        values = get_many(self, keys, version=version)
+        if values:
+            CACHE_GETS.inc(CACHE_HIT, len(values))
+        if len(keys) > len(values):
+            CACHE_GETS.inc(CACHE_MISS, len(keys) - len(values))
+        return values
+
+    backend_class.get_many = counted_get_many
+
+
+class MetricsMiddleware:
+    """Records each request's latency, status and queries by URL name.
+
+    Put it first, so the latency covers the other middlewares too, and
+    before QueryBudgetMiddleware, whose recorder it reads.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        for alias in settings.CACHES:
+            _instrument_cache(type(caches[alias]))
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, duration):
+        match = request.resolver_match
+        view = match.view_name if match else UNMATCHED
+        method = request.method if request.method in METHODS else "other"
+        REQUEST_DURATION.observe((view, method), duration)
+        RESPONSES.inc((view, str(response.status_code)))
+        recorder = getattr(request, "query_recorder", None)
+        if recorder is not None:
+            DB_QUERIES.inc((view,), recorder.count)
+            DB_TIME.inc((view,), recorder.time_ms / 1000)
+        registry.maybe_flush()
+
+
+def metrics_view(request):
+    """The metrics of all workers, for Prometheus to scrape.
+
+    Takes METRICS_TOKEN as a bearer token. Without one set, only DEBUG
+    servers answer.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden("Set METRICS_TOKEN to scrape the metrics.")
+    elif not constant_time_compare(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        return HttpResponse(status=401, headers={"WWW-Authenticate": "Bearer"})
+    return HttpResponse(
+        registry.exposition(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
@@ -1,27 +1,134 @@
-from django.shortcuts import redirect
-from django.urls import reverse
+from urllib.parse import urlparse
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.http import HttpResponseRedirect
+from django.urls import reverse
+
+ANONYMOUS = "anonymous"
+CLIENT = "client"
+ADMIN = "admin"
+
+# The rule of paths that are not policed at all.
+PUBLIC = object()
+
+
+async def aresolve_user(request):
+    """Load the user of an async request.
+
+    request.user is replaced by the loaded user: left lazy, it would query
+    the database from the event loop as soon as a template touches it.
+    """
+    request.user = await request.auser()
+    return request.user
+
+
+def user_type(user):
+    if not user.is_authenticated:
+        return ANONYMOUS
+    # Admin users are auth.User, client users clients.ClientUser.
+    return ADMIN if isinstance(user, User) else CLIENT
+
+
+def _segments(path):
+    return [segment for segment in path.split("/") if segment]
+
+
+class _Node:
+    __slots__ = ("children", "rule", "exact_rule")
 
+    def __init__(self):
+        self.children = {}
+        self.rule = None
+        self.exact_rule = None
+
+
+class RoutePolicy:
+    """settings.ROUTE_POLICY compiled into a trie of path segments.
+
+    Looking a path up costs one dict access per segment, whatever the
+    number of rules, and the redirect targets are reversed once.
+    """
+
+    def __init__(self, rules, public_paths):
+        self.root = _Node()
+        for path in public_paths:
+            self._node(path).rule = PUBLIC
+        for path, redirects in rules:
+            exact = path.startswith("=")
+            node = self._node(path.removeprefix("="))
+            reversed_redirects = {
+                kind: reverse(url_name) for kind, url_name in redirects.items()
+            }
+            if exact:
+                node.exact_rule = reversed_redirects
+            elif node.rule is not PUBLIC:
+                node.rule = reversed_redirects
+
+    def _node(self, path):
+        node = self.root
+        for segment in _segments(path):
+            node = node.children.setdefault(segment, _Node())
+        return node
+
+    def match(self, path):
+        """Return the rule of the longest matching prefix, None if public."""
+        node = self.root
+        rule = node.rule
+        for segment in _segments(path):
+            node = node.children.get(segment)
+            if node is None:
+                break
+            if node.rule is PUBLIC:
+                return None
+            if node.rule is not None:
+                rule = node.rule
+        else:
+            if node.exact_rule is not None:
+                rule = node.exact_rule
+        return rule
+
+
+def _url_path(url):
+    path = urlparse(url).path
+    return path if path.startswith("/") else f"/{path}"
+
+
+class RoutePolicyMiddleware:
+    """Redirects users away from the paths their type may not visit.
+
+    Static, media and other public paths are let through before the
+    session or user is looked at.
+    """
+
+    sync_capable = True
+    async_capable = True
 
-class RedirectBasedOnUserTypeMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        public_paths = [_url_path(settings.STATIC_URL), _url_path(settings.MEDIA_URL)]
+        self.policy = RoutePolicy(
+            settings.ROUTE_POLICY, public_paths + settings.ROUTE_POLICY_PUBLIC_PATHS
+        )
 
     def __call__(self, request):
-        # Check if the user is authenticated
-        if request.user.is_authenticated:
-            # Check if the user is an admin user
-            if isinstance(request.user, User):  # Default admin user
-                # Redirect admin users visiting /, /clients, or /polls
-                if request.path.startswith("/") and not request.path.startswith(
-                    "/admin"
-                ):
-                    return redirect(reverse("admin:login"))
-
-            # Check if the user is a client-side user
-            else:  # Assume client user if not admin
-                # Redirect client users visiting /admin
-                if request.path.startswith("/admin"):
-                    return redirect(reverse("polls:index"))
-
-        return self.get_response(request)
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        rule = self.policy.match(request.path_info)
+        if not rule:
+            return self.get_response(request)
+        return self.redirect(rule, request.user) or self.get_response(request)
+
+    async def __acall__(self, request):
+        rule = self.policy.match(request.path_info)
+        if not rule:
+            return await self.get_response(request)
+        user = await aresolve_user(request)
+        return self.redirect(rule, user) or await self.get_response(request)
+
+    def redirect(self, rule, user):
+        target = rule.get(user_type(user))
+        return HttpResponseRedirect(target) if target is not None else None
@@ -0,0 +1,178 @@
+"""Admin changelist pagination that stays fast on very large tables.
+
+The default changelist runs COUNT(*) for the total and pages with OFFSET,
+both of which read every row before the ones shown. KeysetPaginationMixin
+replaces them with:
+
+- EstimatedCountPaginator: counts come from the PostgreSQL planner
+  statistics, and are only exact for small results.
+- KeysetChangeList: with the default ordering, pages are selected with
+  `WHERE (keyset_field, id) < (last shown row)` over an index on those
+  columns, so the 1000th page costs the same as the first. Sorting by
+  another column falls back to numbered pages.
+"""
+
+import json
+
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+AFTER_VAR = "after"
+BEFORE_VAR = "before"
+
+# Below this many rows an exact count is cheap enough, and estimates of
+# small results tend to be far off.
+EXACT_COUNT_THRESHOLD = 10_000
+
+
+def estimate_count(queryset):
+    """Return the planner's estimate of the queryset's size, None if unknown."""
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+            # -1 until the table was first analyzed.
+            return int(row[0]) if row and row[0] >= 0 else None
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+class EstimatedCountPaginator(Paginator):
+    estimated = False
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < EXACT_COUNT_THRESHOLD:
+            return super().count
+        self.estimated = True
+        return estimate
+
+
+class KeysetChangeList(ChangeList):
+    keyset = False
+    previous_url = None
+    next_url = None
+
+    def __init__(self, request, *args, **kwargs):
+        super().__init__(request, *args, **kwargs)
+        # The search form keeps every other parameter in hidden inputs.
+        self.params.pop(AFTER_VAR, None)
+        self.params.pop(BEFORE_VAR, None)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(AFTER_VAR, None)
+        lookup_params.pop(BEFORE_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Filters, searches and sorts start over from the first page.
+        new_params = dict(new_params or {})
+        new_params.setdefault(AFTER_VAR, None)
+        new_params.setdefault(BEFORE_VAR, None)
+        return super().get_query_string(new_params, remove)
+
+    def uses_keyset(self):
+        return not self.show_all and ORDER_VAR not in self.params
+
+    def _cursor(self, request, var):
+        value = request.GET.get(var)
+        if not value or "|" not in value:
+            return None
+        key, pk = value.rsplit("|", 1)
+        field = self.model._meta.get_field(self.model_admin.keyset_field)
+        try:
+            return field.to_python(key), self.model._meta.pk.to_python(pk)
+        except ValidationError:
+            return None
+
+    def _cursor_of(self, obj):
+        key = getattr(obj, self.model_admin.keyset_field)
+        return f"{key.isoformat() if hasattr(key, 'isoformat') else key}|{obj.pk}"
+
+    def get_results(self, request):
+        if not self.uses_keyset():
+            return super().get_results(request)
+
+        field = self.model_admin.keyset_field
+        after = self._cursor(request, AFTER_VAR)
+        before = None if after else self._cursor(request, BEFORE_VAR)
+        queryset = self.queryset
+        if after:
+            key, pk = after
+            # The redundant `field <= key` bound lets PostgreSQL start an
+            # index range scan at the cursor; it cannot use the OR for that.
+            queryset = queryset.filter(
+                Q(**{f"{field}__lt": key}) | Q(**{field: key, "pk__lt": pk}),
+                **{f"{field}__lte": key},
+            )
+        elif before:
+            key, pk = before
+            queryset = queryset.filter(
+                Q(**{f"{field}__gt": key}) | Q(**{field: key, "pk__gt": pk}),
+                **{f"{field}__gte": key},
+            ).reverse()
+
+        rows = list(queryset[: self.list_per_page + 1])
+        more = len(rows) > self.list_per_page
+        rows = rows[: self.list_per_page]
+        if before:
+            rows.reverse()
+
+        has_previous = more if before else after is not None
+        has_next = more if not before else True
+        self.previous_url = (
+            self.get_query_string({BEFORE_VAR: self._cursor_of(rows[0])})
+            if rows and has_previous
+            else None
+        )
+        self.next_url = (
+            self.get_query_string({AFTER_VAR: self._cursor_of(rows[-1])})
+            if rows and has_next
+            else None
+        )
+
+        self.paginator = self.model_admin.get_paginator(
+            request, self.queryset, self.list_per_page
+        )
+        self.result_count = self.paginator.count
+        self.show_full_result_count = False
+        self.full_result_count = None
+        self.show_admin_actions = True
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = bool(self.previous_url or self.next_url)
+        self.keyset = True
+
+
+class KeysetPaginationMixin:
+    """ModelAdmin mixin for KeysetChangeList and EstimatedCountPaginator.
+
+    Set `keyset_field` to the indexed column pages are ordered by, newest
+    first. The model needs an index on (keyset_field, id).
+    """
+
+    keyset_field = None
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_ordering(self, request):
+        return ["-" + self.keyset_field, "-pk"]
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
@@ -0,0 +1,358 @@
+"""Sampling request profiler, cheap enough to leave on in production.
+
+ProfilerMiddleware profiles one request in PROFILER_SAMPLE_RATE, the
+requests under PROFILER_PATHS, and those sending PROFILER_HEADER with the
+PROFILER_TOKEN as value. Other requests only cost a random number.
+
+A profiled request gets, depending on PROFILER_MODE:
+- "sample": its thread's stack sampled every PROFILER_SAMPLE_INTERVAL_MS,
+  saved as folded stacks (`<id>.folded`), the input format of flamegraph.pl,
+  speedscope and most other flame graph tools;
+- "cprofile": a cProfile run, saved as pstats (`<id>.prof`) for snakeviz,
+  flameprof or tuna.
+Either way the SQL queries and template render times are recorded next to
+it, in `<id>.json`. Async requests are always sampled, in two threads:
+the event loop, and the worker thread sync_to_async() runs the request's
+sync code (ORM queries included) in. Their stacks start with an "event
+loop" or "sync worker" frame, and include whatever else those threads ran
+meanwhile, other requests' coroutines in particular.
+
+The ProfileStore keeps the last PROFILER_MAX_PROFILES in PROFILER_DIR, the
+admin browses them through mysite.profiler_views.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.template.base import Template
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+
+from .query_budget import QueryRecorder
+
+logger = logging.getLogger(__name__)
+
+# Queries kept per profile, the count and time still cover all of them.
+MAX_QUERIES = 500
+
+PROFILE_ID = re.compile(r"[0-9]{20}-[0-9a-f]{8}")
+
+FORMATS = {"sample": "folded", "cprofile": "prof"}
+
+_template_timings = ContextVar("profiler_template_timings", default=None)
+
+
+def _instrument_templates():
+    """Make Template.render time itself while a profile is being taken."""
+    render = Template.render
+    if getattr(render, "profiled", False):
+        return
+
+    @wraps(render)
+    def timed_render(self, context):
+        timings = _template_timings.get()
+        if timings is None:
+            return render(self, context)
+        start = time.perf_counter()
+        try:
+            return render(self, context)
+        finally:
+            # Inclusive: an included template's time also counts for its parent.
+            timings.append(
+                {
+                    "name": self.name or "<string>",
+                    "ms": (time.perf_counter() - start) * 1000,
+                }
+            )
+
+    timed_render.profiled = True
+    Template.render = timed_render
+
+
+class QueryLog(QueryRecorder):
+    """QueryRecorder also keeping the first MAX_QUERIES statements."""
+
+    def __init__(self):
+        super().__init__()
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            self.count += 1
+            self.time_ms += ms
+            if len(self.queries) < MAX_QUERIES:
+                self.queries.append({"sql": sql, "ms": ms, "many": many})
+
+
+def _frame_label(code, prefixes):
+    filename = code.co_filename
+    for prefix in prefixes:
+        if prefix in filename:
+            filename = filename.split(prefix, 1)[1]
+            break
+    # ";" separates frames in the folded format.
+    return f"{code.co_qualname} ({filename}:{code.co_firstlineno})".replace(";", ",")
+
+
+class StackSampler:
+    """Counts the stacks of threads, sampled from a background thread.
+
+    `threads` maps the ids of the threads to sample to the label of a root
+    frame added to their stacks, None for no root frame.
+    """
+
+    def __init__(self, threads, interval):
+        self.threads = threads
+        self.interval = interval
+        self.stacks = Counter()
+        self._prefixes = ("site-packages/", f"{settings.BASE_DIR}/")
+        self._labels = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="profiler-sampler", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            for thread_id, root in self.threads.items():
+                self._sample(frames.get(thread_id), root)
+
+    def _sample(self, frame, root):
+        labels = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = _frame_label(code, self._prefixes)
+            labels.append(label)
+            frame = frame.f_back
+        if labels:
+            if root is not None:
+                labels.append(root)
+            self.stacks[";".join(reversed(labels))] += 1
+
+    def folded(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+
+class ProfileStore:
+    """Profiles on disk, the oldest deleted beyond `max_profiles`.
+
+    A profile is `<id>.json` with what was recorded about the request, next
+    to its profile data (see FORMATS). Ids sort by capture time.
+    """
+
+    def __init__(self, directory, max_profiles):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def save(self, meta, data):
+        """Store a profile, `data` being bytes or a pstats dumping callable."""
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        meta = {**meta, "id": profile_id}
+        data_path = self._path(f"{profile_id}.{FORMATS[meta['mode']]}")
+        if callable(data):
+            data(data_path)
+        else:
+            with open(data_path, "wb") as f:
+                f.write(data)
+        # The metadata goes last, and in one rename: listing never sees a
+        # profile without its data.
+        temporary = self._path(f"{profile_id}.json.tmp")
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(temporary, self._path(f"{profile_id}.json"))
+        self.rotate()
+        return profile_id
+
+    def _ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith(".json"))
+
+    def rotate(self):
+        ids = self._ids()
+        for profile_id in ids[: max(0, len(ids) - self.max_profiles)]:
+            for extension in ("json", *FORMATS.values()):
+                try:
+                    os.remove(self._path(f"{profile_id}.{extension}"))
+                except FileNotFoundError:
+                    pass
+
+    def get(self, profile_id):
+        """Return a profile's metadata, None if there is no such profile."""
+        if not PROFILE_ID.fullmatch(profile_id):
+            return None
+        try:
+            with open(self._path(f"{profile_id}.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def all(self):
+        profiles = (self.get(profile_id) for profile_id in self._ids())
+        return [profile for profile in profiles if profile is not None]
+
+    def data_path(self, profile):
+        return self._path(f"{profile['id']}.{FORMATS[profile['mode']]}")
+
+
+def get_store():
+    return ProfileStore(settings.PROFILER_DIR, settings.PROFILER_MAX_PROFILES)
+
+
+class ProfilerMiddleware:
+    """Profiles the sampled requests, see the module docstring.
+
+    Put it at the top, right after MetricsMiddleware, so the profile covers
+    the other middlewares too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+        self.rate = settings.PROFILER_SAMPLE_RATE
+        self.paths = tuple(settings.PROFILER_PATHS)
+        self.header = settings.PROFILER_HEADER
+        self.token = settings.PROFILER_TOKEN
+        self.mode = settings.PROFILER_MODE
+        if self.mode not in FORMATS:
+            raise ValueError(f"Unknown PROFILER_MODE {self.mode!r}.")
+        self.interval = settings.PROFILER_SAMPLE_INTERVAL_MS / 1000
+        self.store = get_store()
+        _instrument_templates()
+
+    def sampled(self, request):
+        if self.rate and random.random() * self.rate < 1:
+            return True
+        if self.paths and request.path_info.startswith(self.paths):
+            return True
+        value = request.headers.get(self.header) if self.token else None
+        return value is not None and constant_time_compare(value, self.token)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled(request):
+            return self.get_response(request)
+
+        queries = QueryLog()
+        templates = []
+        token = _template_timings.set(templates)
+        started = timezone.now()
+        start = time.perf_counter()
+        response = None
+        if self.mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            profiler = StackSampler({threading.get_ident(): None}, self.interval)
+            profiler.start()
+        try:
+            with queries.record():
+                response = self.get_response(request)
+        finally:
+            if self.mode == "cprofile":
+                profiler.disable()
+                data = profiler.dump_stats
+            else:
+                profiler.stop()
+                data = profiler.folded().encode()
+            _template_timings.reset(token)
+            self.save(request, response, started, start, queries, templates, data)
+        return response
+
+    async def __acall__(self, request):
+        if not self.sampled(request):
+            return await self.get_response(request)
+
+        queries = QueryLog()
+        templates = []
+        token = _template_timings.set(templates)
+        started = timezone.now()
+        start = time.perf_counter()
+        response = None
+        # As in QueryBudgetMiddleware: the queries run in the one
+        # thread-sensitive worker thread.
+        await sync_to_async(queries.install)()
+        worker = await sync_to_async(threading.get_ident)()
+        sampler = StackSampler(
+            {threading.get_ident(): "event loop", worker: "sync worker"},
+            self.interval,
+        )
+        sampler.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(queries.uninstall)()
+            sampler.stop()
+            _template_timings.reset(token)
+            await sync_to_async(self.save)(
+                request,
+                response,
+                started,
+                start,
+                queries,
+                templates,
+                sampler.folded().encode(),
+                mode="sample",
+            )
+        return response
+
+    def save(
+        self, request, response, started, start, queries, templates, data, mode=None
+    ):
+        match = request.resolver_match
+        meta = {
+            "mode": mode or self.mode,
+            "started_at": started.isoformat(),
+            "duration_ms": (time.perf_counter() - start) * 1000,
+            "method": request.method,
+            "path": request.get_full_path(),
+            "view": match.view_name if match else None,
+            # No response: the view raised.
+            "status": response.status_code if response is not None else 500,
+            "query_count": queries.count,
+            "db_ms": queries.time_ms,
+            "queries": queries.queries,
+            "templates": templates,
+        }
+        try:
+            self.store.save(meta, data)
+        except OSError:
+            logger.exception("Could not save the profile of %s", request.path)
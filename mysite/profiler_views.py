@@ -0,0 +1,110 @@
+"""Admin pages browsing the profiles mysite.profiler captured.
+
+Superusers only: the profiles show SQL statements with their values.
+"""
+
+from collections import Counter
+
+from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404
+from django.template.response import TemplateResponse
+
+from .profiler import FORMATS, get_store
+
+# Profiles listed, slowest first.
+LIST_SIZE = 100
+
+# Functions shown on a sampled profile's page.
+TOP_FUNCTIONS = 25
+
+
+def _check_superuser(request):
+    if not request.user.is_superuser:
+        raise PermissionDenied
+
+
+def _get_profile(profile_id):
+    profile = get_store().get(profile_id)
+    if profile is None:
+        raise Http404("No such profile.")
+    return profile
+
+
+def profile_list(request):
+    _check_superuser(request)
+    profiles = get_store().all()
+    path = request.GET.get("path", "")
+    if path:
+        profiles = [profile for profile in profiles if path in profile["path"]]
+    profiles.sort(key=lambda profile: profile["duration_ms"], reverse=True)
+    return TemplateResponse(
+        request,
+        "admin/profiles/list.html",
+        {
+            **admin.site.each_context(request),
+            "title": "Slowest profiled requests",
+            "profiles": profiles[:LIST_SIZE],
+            "total": len(profiles),
+            "path": path,
+        },
+    )
+
+
+def _top_functions(path):
+    """Return (function, own samples, samples) of a folded stacks file.
+
+    Own samples are those the function was running in, the others those it
+    was on the stack for.
+    """
+    own = Counter()
+    total = Counter()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            frames = stack.split(";")
+            own[frames[-1]] += int(count)
+            for frame in set(frames):
+                total[frame] += int(count)
+    return [
+        (frame, count, total[frame]) for frame, count in own.most_common(TOP_FUNCTIONS)
+    ]
+
+
+def profile_detail(request, profile_id):
+    _check_superuser(request)
+    profile = _get_profile(profile_id)
+    store = get_store()
+    functions = None
+    if profile["mode"] == "sample":
+        try:
+            functions = _top_functions(store.data_path(profile))
+        except FileNotFoundError:
+            raise Http404("The profile was rotated out.") from None
+    return TemplateResponse(
+        request,
+        "admin/profiles/detail.html",
+        {
+            **admin.site.each_context(request),
+            "title": f"{profile['method']} {profile['path']}",
+            "profile": profile,
+            "functions": functions,
+            "samples": sum(count for _, count, _ in functions or []),
+            "queries": sorted(profile["queries"], key=lambda q: q["ms"], reverse=True),
+            "templates": sorted(
+                profile["templates"], key=lambda t: t["ms"], reverse=True
+            ),
+        },
+    )
+
+
+def profile_download(request, profile_id):
+    _check_superuser(request)
+    profile = _get_profile(profile_id)
+    try:
+        data = open(get_store().data_path(profile), "rb")
+    except FileNotFoundError:
+        raise Http404("The profile was rotated out.") from None
+    return FileResponse(
+        data, as_attachment=True, filename=f"{profile_id}.{FORMATS[profile['mode']]}"
+    )
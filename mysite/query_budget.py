@@ -0,0 +1,179 @@
+import logging
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.urls import URLPattern, reverse
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryBudget:
+    def __init__(self, max_queries, max_time_ms=None):
+        self.max_queries = max_queries
+        self.max_time_ms = max_time_ms
+
+    def overruns(self, recorder):
+        """Return a description of each limit the recorded usage went over."""
+        overruns = []
+        if recorder.count > self.max_queries:
+            overruns.append(f"{recorder.count} queries > {self.max_queries}")
+        if self.max_time_ms is not None and recorder.time_ms > self.max_time_ms:
+            overruns.append(f"{recorder.time_ms:.1f} ms > {self.max_time_ms} ms")
+        return overruns
+
+
+def query_budget(max_queries, max_time_ms=None):
+    """Declare how many queries, and how much DB time, a view may use.
+
+    Works on view functions and class-based views. Apply it as the outermost
+    decorator so wrappers that do not copy attributes cannot hide it. The
+    budget covers the whole request, including the queries the middlewares
+    run (session and user loading).
+    """
+
+    def decorator(view):
+        view.query_budget = QueryBudget(max_queries, max_time_ms)
+        return view
+
+    return decorator
+
+
+def get_query_budget(view_func):
+    budget = getattr(view_func, "query_budget", None)
+    if budget is None:
+        view_class = getattr(view_func, "view_class", None)
+        budget = getattr(view_class, "query_budget", None)
+    return budget
+
+
+class QueryRecorder:
+    """Execute wrapper counting the queries it sees and the time they take."""
+
+    def __init__(self):
+        self.count = 0
+        self.time_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time_ms += (time.perf_counter() - start) * 1000
+
+    def install(self):
+        # Connections are thread-local: async code has to call this (and
+        # uninstall) in the thread its queries run in.
+        for connection in connections.all():
+            connection.execute_wrappers.append(self)
+
+    def uninstall(self):
+        for connection in connections.all():
+            connection.execute_wrappers.remove(self)
+
+    @contextmanager
+    def record(self):
+        """Record the queries run in this thread, on every database."""
+        self.install()
+        try:
+            yield self
+        finally:
+            self.uninstall()
+
+
+class QueryBudgetMiddleware:
+    """Logs, or raises when QUERY_BUDGET_ACTION is "raise", when a request
+    uses more queries or DB time than its view's budget."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        # Also read by MetricsMiddleware.
+        recorder = request.query_recorder = QueryRecorder()
+        with recorder.record():
+            response = self.get_response(request)
+        self.check(request, recorder)
+        return response
+
+    async def __acall__(self, request):
+        # The async ORM runs the request's queries in one thread-sensitive
+        # worker thread, which is where the recorder has to be installed.
+        recorder = request.query_recorder = QueryRecorder()
+        await sync_to_async(recorder.install)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recorder.uninstall)()
+        self.check(request, recorder)
+        return response
+
+    def check(self, request, recorder):
+        match = request.resolver_match
+        budget = get_query_budget(match.func) if match else None
+        if budget is not None:
+            overruns = budget.overruns(recorder)
+            if overruns:
+                message = f"{match.view_name} went over its query budget: " + ", ".join(
+                    overruns
+                )
+                if settings.QUERY_BUDGET_ACTION == "raise":
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+
+
+class QueryBudgetTestMixin:
+    """TestCase mixin checking the views of a URLconf against their budgets."""
+
+    def assertUrlsWithinBudget(self, urlconf, url_kwargs, post_data=None):
+        """Request every URL of `urlconf` and fail when one of them has no
+        budget or runs more queries than its budget allows.
+
+        `url_kwargs` fills the URL parameters, `post_data` maps URL names to
+        the data of an extra POST request. Caches are cleared before each
+        request so the budgets hold for cold caches. DB time is not checked,
+        it depends too much on the machine running the tests.
+        """
+        post_data = post_data or {}
+        for pattern in urlconf.urlpatterns:
+            if not isinstance(pattern, URLPattern):
+                continue
+            name = f"{urlconf.app_name}:{pattern.name}"
+            with self.subTest(url=name):
+                budget = get_query_budget(pattern.callback)
+                self.assertIsNotNone(budget, f"{name} declares no query budget")
+
+                url = reverse(
+                    name,
+                    kwargs={key: url_kwargs[key] for key in pattern.pattern.converters},
+                )
+                requests = [(self.client.get, None)]
+                if pattern.name in post_data:
+                    requests.append((self.client.post, post_data[pattern.name]))
+                for send, data in requests:
+                    cache.clear()
+                    recorder = QueryRecorder()
+                    with recorder.record():
+                        send(url, data)
+                    self.assertLessEqual(
+                        recorder.count,
+                        budget.max_queries,
+                        f"{send.__name__.upper()} {url} ran {recorder.count} "
+                        f"queries, its budget is {budget.max_queries}",
+                    )
@@ -0,0 +1,218 @@
+"""Indexed full-text search for the admin changelists.
+
+The default ModelAdmin search runs `ILIKE '%term%'` over every search
+field, a sequential scan of the table. Models that need better get a search
+index with the CreateSearchIndex migration operation:
+
+- PostgreSQL: a generated `search_vector` tsvector column with a GIN index.
+- SQLite: an FTS5 table over the columns, kept in sync by triggers.
+
+Both are maintained by the database, so rows are indexed however they are
+written, bulk_create() and update() included. Email addresses are indexed
+as their parts: "jane.smith@example.com" is found by "smith" or
+"example.com", as with the default search. IndexedSearchMixin then
+searches through the index, and skips text search entirely for terms that
+are a full email address or an id. Other backends use the default search.
+
+SQLite drops the triggers when Django rebuilds the table to alter it, so a
+migration doing that has to run CreateSearchIndex again after it.
+"""
+
+import re
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import connections
+from django.db.migrations.operations.base import Operation
+from django.db.models.expressions import RawSQL
+
+_WORD = re.compile(r"\w+")
+
+
+class PostgresSearch:
+    vector_column = "search_vector"
+
+    def create(self, table, pk_column, columns, quote):
+        # The parser keeps an email address or a host name as one token,
+        # splitting on "@" and "." indexes their parts instead. FTS5 splits
+        # on them anyway.
+        document = " || ' ' || ".join(
+            f"coalesce(translate({quote(c)}::text, '@.', '  '), '')" for c in columns
+        )
+        return [
+            f"ALTER TABLE {quote(table)} ADD COLUMN IF NOT EXISTS"
+            f" {self.vector_column} tsvector GENERATED ALWAYS AS"
+            f" (to_tsvector('simple', {document})) STORED",
+            f"CREATE INDEX IF NOT EXISTS {quote(table + '_search')}"
+            f" ON {quote(table)} USING GIN ({self.vector_column})",
+        ]
+
+    def drop(self, table, pk_column, columns, quote):
+        return [
+            f"ALTER TABLE {quote(table)} DROP COLUMN IF EXISTS {self.vector_column}"
+        ]
+
+    def matching_ids(self, table, pk_column, words, quote):
+        # Prefix matches, like the default search matches parts of words.
+        query = " & ".join(f"{word}:*" for word in words)
+        return RawSQL(
+            f"SELECT {quote(pk_column)} FROM {quote(table)}"
+            f" WHERE {self.vector_column} @@ to_tsquery('simple', %s)",
+            [query],
+        )
+
+
+class SQLiteSearch:
+    def index_table(self, table):
+        return f"{table}_fts"
+
+    def create(self, table, pk_column, columns, quote):
+        fts = quote(self.index_table(table))
+        pk = quote(pk_column)
+        names = ", ".join(quote(c) for c in columns)
+        new = ", ".join(f"new.{quote(c)}" for c in columns)
+        old = ", ".join(f"old.{quote(c)}" for c in columns)
+        delete = (
+            f"INSERT INTO {fts}({fts}, rowid, {names})"
+            f" VALUES('delete', old.{pk}, {old});"
+        )
+        insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.{pk}, {new});"
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5({names},"
+            f" content={quote(table)}, content_rowid={pk})",
+            f"INSERT INTO {fts}({fts}) VALUES('rebuild')",
+            f"CREATE TRIGGER IF NOT EXISTS {quote(table + '_fts_insert')}"
+            f" AFTER INSERT ON {quote(table)} BEGIN {insert} END",
+            f"CREATE TRIGGER IF NOT EXISTS {quote(table + '_fts_delete')}"
+            f" AFTER DELETE ON {quote(table)} BEGIN {delete} END",
+            f"CREATE TRIGGER IF NOT EXISTS {quote(table + '_fts_update')}"
+            f" AFTER UPDATE ON {quote(table)} BEGIN {delete} {insert} END",
+        ]
+
+    def drop(self, table, pk_column, columns, quote):
+        return [
+            f"DROP TRIGGER IF EXISTS {quote(table + '_fts_' + action)}"
+            for action in ("insert", "delete", "update")
+        ] + [f"DROP TABLE IF EXISTS {quote(self.index_table(table))}"]
+
+    def matching_ids(self, table, pk_column, words, quote):
+        fts = quote(self.index_table(table))
+        query = " ".join(f'"{word}"*' for word in words)
+        return RawSQL(f"SELECT rowid FROM {fts} WHERE {fts} MATCH %s", [query])
+
+
+BACKENDS = {
+    "postgresql": PostgresSearch(),
+    "sqlite": SQLiteSearch(),
+}
+
+
+class CreateSearchIndex(Operation):
+    """Migration operation indexing the given fields of a model for search."""
+
+    reversible = True
+
+    def __init__(self, model_name, fields):
+        self.model_name = model_name
+        self.fields = fields
+
+    def deconstruct(self):
+        return (
+            self.__class__.__name__,
+            [],
+            {"model_name": self.model_name, "fields": self.fields},
+        )
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def _execute(self, action, app_label, schema_editor, state):
+        backend = BACKENDS.get(schema_editor.connection.vendor)
+        if backend is None:
+            return
+        opts = state.apps.get_model(app_label, self.model_name)._meta
+        columns = [opts.get_field(field).column for field in self.fields]
+        for sql in getattr(backend, action)(
+            opts.db_table, opts.pk.column, columns, schema_editor.quote_name
+        ):
+            schema_editor.execute(sql, params=None)
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        self._execute("create", app_label, schema_editor, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        self._execute("drop", app_label, schema_editor, from_state)
+
+    def describe(self):
+        return f"Create search index on {self.model_name}"
+
+    @property
+    def migration_name_fragment(self):
+        return f"{self.model_name.lower()}_search"
+
+
+class RebuildSearchIndex(CreateSearchIndex):
+    """Migration operation recreating a CreateSearchIndex index, for when
+    the way it is built changed."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        self._execute("drop", app_label, schema_editor, from_state)
+        self._execute("create", app_label, schema_editor, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        self.database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def describe(self):
+        return f"Rebuild search index on {self.model_name}"
+
+    @property
+    def migration_name_fragment(self):
+        return f"{self.model_name.lower()}_search_rebuild"
+
+
+class IndexedSearchMixin:
+    """ModelAdmin mixin searching through the index of CreateSearchIndex.
+
+    `search_fields` still has to be set for the admin to show its search
+    box. Terms that are a full email address are only looked up in
+    `search_email_field`, numeric terms only as the primary key when
+    `search_by_id` is set. Either falls back to text search if nothing
+    matches.
+    """
+
+    search_email_field = "email"
+    search_by_id = False
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+
+        exact = self._exact_matches(queryset, search_term)
+        if exact is not None and exact.exists():
+            return exact, False
+
+        connection = connections[queryset.db]
+        backend = BACKENDS.get(connection.vendor)
+        words = _WORD.findall(search_term)
+        if backend is None or not words:
+            return super().get_search_results(request, queryset, search_term)
+
+        opts = queryset.model._meta
+        ids = backend.matching_ids(
+            opts.db_table, opts.pk.column, words, connection.ops.quote_name
+        )
+        return queryset.filter(pk__in=ids), False
+
+    def _exact_matches(self, queryset, search_term):
+        if self.search_by_id and search_term.isdigit():
+            return queryset.filter(pk=int(search_term))
+        if self.search_email_field:
+            try:
+                validate_email(search_term)
+            except ValidationError:
+                return None
+            return queryset.filter(
+                **{f"{self.search_email_field}__iexact": search_term}
+            )
+        return None
@@ -0,0 +1,379 @@
+"""Session engine and middleware keeping django_session off the hot path.
+
+Sessions are read through two cache tiers before the database: a small
+per-process LocalCache, then the shared cache. The local tier keeps an
+entry LOCAL_TTL seconds, so a session changed or deleted by another process
+can be served stale for that long; logging in and out cycle the session
+key, which is never stale.
+
+Sessions are only written when they were modified. Instead of saving every
+session on every request to slide its expiry, SessionMiddleware refreshes
+the expiry of a session in use once it is SESSION_REFRESH_INTERVAL seconds
+behind, and the refreshes are written in batches by a background thread.
+A refresh lost in a crash only makes a session expire earlier.
+
+SessionStore.clear_expired(), which `clearsessions` and `purge_sessions`
+run, deletes expired sessions in chunks so no statement holds locks for
+long, and their shared cache entries with them. A session whose refreshed
+expiry was not written yet can be purged; it then ends once the local tiers
+of the other processes drop it, LOCAL_TTL seconds at most.
+"""
+
+import atexit
+import copy
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions import middleware
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core.cache import caches
+from django.db import close_old_connections
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from django.utils.http import http_date
+
+from .local_cache import LocalCache
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "mysite.sessions:"
+
+LOCAL_SIZE = 10_000
+LOCAL_TTL = 2
+
+# Seconds between writes of the pending expiry refreshes, and how many
+# pending refreshes trigger a write sooner.
+FLUSH_INTERVAL = 5
+FLUSH_SIZE = 1000
+
+CLEAR_CHUNK_SIZE = 1000
+
+local_cache = LocalCache(LOCAL_SIZE, LOCAL_TTL)
+
+
+class SessionStore(DBStore):
+    """Database-backed sessions read through the local and shared caches.
+
+    Cache entries are (data, expire_date) pairs, the expiry date being the
+    one stored in the database.
+    """
+
+    cache_key_prefix = KEY_PREFIX
+
+    def __init__(self, session_key=None):
+        self._cache = caches[settings.SESSION_CACHE_ALIAS]
+        self.expire_date = None
+        super().__init__(session_key)
+
+    def _cached(self, session_key):
+        entry = local_cache.get(session_key)
+        if entry is None:
+            try:
+                entry = self._cache.get(self.cache_key_prefix + session_key)
+            except Exception:  # pylint: disable=broad-exception-caught
+                # Some backends reject keys with unexpected characters.
+                return None
+            if entry is not None:
+                local_cache.set(session_key, entry)
+        return entry
+
+    async def _acached(self, session_key):
+        entry = local_cache.get(session_key)
+        if entry is None:
+            try:
+                entry = await self._cache.aget(self.cache_key_prefix + session_key)
+            except Exception:  # pylint: disable=broad-exception-caught
+                return None
+            if entry is not None:
+                local_cache.set(session_key, entry)
+        return entry
+
+    def _entry(self, data, expire_date):
+        # Copied: the session dict keeps changing after it is cached.
+        return copy.deepcopy(data), expire_date
+
+    def _use(self, entry):
+        data, self.expire_date = entry
+        if self.expire_date <= timezone.now():
+            return None
+        return copy.deepcopy(data)
+
+    def _store(self, entry):
+        local_cache.set(self.session_key, entry)
+        try:
+            self._cache.set(
+                self.cache_key_prefix + self.session_key,
+                entry,
+                self.get_expiry_age(expiry=entry[1]),
+            )
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Error saving to cache (%s)", self._cache)
+
+    async def _astore(self, entry):
+        local_cache.set(self.session_key, entry)
+        try:
+            await self._cache.aset(
+                self.cache_key_prefix + self.session_key,
+                entry,
+                await self.aget_expiry_age(expiry=entry[1]),
+            )
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Error saving to cache (%s)", self._cache)
+
+    def load(self):
+        entry = self._cached(self.session_key)
+        data = self._use(entry) if entry is not None else None
+        if data is not None:
+            return data
+        s = self._get_session_from_db()
+        if s is None:
+            return {}
+        entry = self._entry(self.decode(s.session_data), s.expire_date)
+        self._store(entry)
+        return self._use(entry)
+
+    async def aload(self):
+        entry = await self._acached(self.session_key)
+        data = self._use(entry) if entry is not None else None
+        if data is not None:
+            return data
+        s = await self._aget_session_from_db()
+        if s is None:
+            return {}
+        entry = self._entry(self.decode(s.session_data), s.expire_date)
+        await self._astore(entry)
+        return self._use(entry)
+
+    def exists(self, session_key):
+        return (
+            session_key
+            and (self.cache_key_prefix + session_key) in self._cache
+            or super().exists(session_key)
+        )
+
+    async def aexists(self, session_key):
+        return (
+            session_key
+            and await self._cache.ahas_key(self.cache_key_prefix + session_key)
+            or await super().aexists(session_key)
+        )
+
+    def save(self, must_create=False):
+        super().save(must_create)
+        self.expire_date = self.get_expiry_date()
+        self._store(self._entry(self._session, self.expire_date))
+
+    async def asave(self, must_create=False):
+        await super().asave(must_create)
+        self.expire_date = await self.aget_expiry_date()
+        await self._astore(self._entry(self._session, self.expire_date))
+
+    def delete(self, session_key=None):
+        super().delete(session_key)
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        local_cache.delete(session_key)
+        self._cache.delete(self.cache_key_prefix + session_key)
+
+    async def adelete(self, session_key=None):
+        await super().adelete(session_key)
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        local_cache.delete(session_key)
+        await self._cache.adelete(self.cache_key_prefix + session_key)
+
+    def refresh_expiry(self, interval):
+        """Slide the expiry of an unmodified session that was loaded.
+
+        Only done once the stored expiry is `interval` seconds behind, the
+        database write is left to the ExpiryRefresher. Returns whether the
+        expiry was refreshed.
+        """
+        if self.expire_date is None or self.session_key is None:
+            return False
+        expire_date = self.get_expiry_date()
+        if (expire_date - self.expire_date).total_seconds() < interval:
+            return False
+        get_expiry_refresher().add(self.session_key, expire_date)
+        self._store(self._entry(self._session, expire_date))
+        self.expire_date = expire_date
+        return True
+
+    @classmethod
+    def clear_expired(cls, chunk_size=CLEAR_CHUNK_SIZE, pause=0):
+        """Delete expired sessions chunk by chunk, return how many.
+
+        Waits `pause` seconds between chunks to leave room for other writes.
+        """
+        model = cls.get_model_class()
+        shared_cache = caches[settings.SESSION_CACHE_ALIAS]
+        now = timezone.now()
+        deleted = 0
+        while True:
+            keys = list(
+                model.objects.filter(expire_date__lt=now).values_list(
+                    "session_key", flat=True
+                )[:chunk_size]
+            )
+            if not keys:
+                return deleted
+            # Checked again, the expiry may have been refreshed since.
+            count, _ = model.objects.filter(
+                session_key__in=keys, expire_date__lt=now
+            ).delete()
+            deleted += count
+            # Cached, a purged session would live on with a refreshed
+            # expiry. Those kept are read from the database again.
+            shared_cache.delete_many([cls.cache_key_prefix + key for key in keys])
+            for key in keys:
+                local_cache.delete(key)
+            if pause:
+                time.sleep(pause)
+
+    @classmethod
+    async def aclear_expired(cls):
+        return await sync_to_async(cls.clear_expired)()
+
+
+class ExpiryRefresher:
+    """Per-process buffer of session expiry dates to write.
+
+    Refreshes are written by a background thread every `flush_interval`
+    seconds, or as soon as `max_size` are pending, with one UPDATE per
+    chunk of sessions. An expiry is never moved back, and sessions deleted
+    meanwhile stay deleted.
+    """
+
+    def __init__(self, flush_interval, max_size):
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._thread = None
+        self._stopped = threading.Event()
+        self._wake = threading.Event()
+
+    def add(self, session_key, expire_date):
+        with self._lock:
+            self._pending[session_key] = expire_date
+            due = len(self._pending) >= self.max_size
+        self._start()
+        if due:
+            self._wake.set()
+
+    def flush(self):
+        """Write the pending refreshes out. Returns the number written."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            model = SessionStore.get_model_class()
+            items = list(batch.items())
+            try:
+                for start in range(0, len(items), FLUSH_SIZE):
+                    end = start + FLUSH_SIZE
+                    chunk = dict(items[start:end])
+                    model.objects.filter(session_key__in=chunk).update(
+                        expire_date=Case(
+                            *[
+                                When(
+                                    session_key=key,
+                                    expire_date__lt=expire_date,
+                                    then=Value(expire_date),
+                                )
+                                for key, expire_date in chunk.items()
+                            ],
+                            default=F("expire_date"),
+                        )
+                    )
+                    for key in chunk:
+                        del batch[key]
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("Refreshing session expiry failed, keeping them")
+                with self._lock:
+                    for key, expire_date in batch.items():
+                        self._pending.setdefault(key, expire_date)
+            return len(items) - len(batch)
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        self.flush()
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="session-expiry-refresher", daemon=True
+            )
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            close_old_connections()
+            self.flush()
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def get_expiry_refresher():
+    global _refresher  # pylint: disable=global-statement
+    if _refresher is None:
+        with _refresher_lock:
+            if _refresher is None:
+                _refresher = ExpiryRefresher(FLUSH_INTERVAL, FLUSH_SIZE)
+    return _refresher
+
+
+class SessionMiddleware(middleware.SessionMiddleware):
+    """SessionMiddleware sliding the expiry of sessions in use.
+
+    Modified sessions are saved as usual. Unmodified ones that were loaded
+    get their expiry refreshed every SESSION_REFRESH_INTERVAL seconds,
+    which needs SessionStore as the session engine.
+    """
+
+    def process_response(self, request, response):
+        response = super().process_response(request, response)
+        session = getattr(request, "session", None)
+        interval = settings.SESSION_REFRESH_INTERVAL
+        if (
+            not interval
+            or not isinstance(session, SessionStore)
+            or not session.accessed
+            or session.modified
+            or response.status_code >= 500
+            or session.is_empty()
+        ):
+            return response
+        if session.refresh_expiry(interval):
+            if not session.get_expire_at_browser_close():
+                max_age = session.get_expiry_age()
+                response.set_cookie(
+                    settings.SESSION_COOKIE_NAME,
+                    session.session_key,
+                    max_age=max_age,
+                    expires=http_date(time.time() + max_age),
+                    domain=settings.SESSION_COOKIE_DOMAIN,
+                    path=settings.SESSION_COOKIE_PATH,
+                    secure=settings.SESSION_COOKIE_SECURE or None,
+                    httponly=settings.SESSION_COOKIE_HTTPONLY or None,
+                    samesite=settings.SESSION_COOKIE_SAMESITE,
+                )
+        return response
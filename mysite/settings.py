@@ -32,6 +32,10 @@ SECRET_KEY = env.get_value("SECRET_KEY")
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = env.get_value("DEBUG")
 
+# The debug toolbar, on with DEBUG. Production profiles requests with
+# mysite.profiler instead, see "Profiler" below.
+DEBUG_TOOLBAR = env.bool("DEBUG_TOOLBAR", default=env.bool("DEBUG", default=False))
+
 ALLOWED_HOSTS = []
 
 AUTH_USER_MODEL = "auth.User"
@@ -41,7 +45,6 @@ AUTH_USER_MODEL = "auth.User"
 INSTALLED_APPS = [
     "clients.apps.ClientsConfig",
     "polls.apps.PollsConfig",
-    "debug_toolbar",
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
@@ -50,26 +53,64 @@ INSTALLED_APPS = [
     "django.contrib.staticfiles",
 ]
 
+# Route the hot polls views to their async versions (see polls.async_views),
+# mysite.asgi turns this on.
+ASYNC_VIEWS = env.bool("ASYNC_VIEWS", default=False)
+
 MIDDLEWARE = [
-    "debug_toolbar.middleware.DebugToolbarMiddleware",
+    "mysite.metrics.MetricsMiddleware",
+    "mysite.profiler.ProfilerMiddleware",
+    "mysite.query_budget.QueryBudgetMiddleware",
     "django.middleware.security.SecurityMiddleware",
-    "django.contrib.sessions.middleware.SessionMiddleware",
+    "mysite.sessions.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
-    "clients.middleware.RedirectLoggedInMiddleware",
-    "polls.middleware.LoginRequiredPollsMiddleware",
-    "mysite.middleware.RedirectBasedOnUserTypeMiddleware",
+    "mysite.middleware.RoutePolicyMiddleware",
 ]
 
+if DEBUG_TOOLBAR:
+    INSTALLED_APPS.insert(2, "debug_toolbar")
+    # The toolbar middleware is sync only and would make the whole ASGI
+    # middleware chain fall back to a thread per request.
+    if not ASYNC_VIEWS:
+        MIDDLEWARE.insert(2, "debug_toolbar.middleware.DebugToolbarMiddleware")
+    else:
+        SILENCED_SYSTEM_CHECKS = ["debug_toolbar.W001"]
+
 INTERNAL_IPS = [
     "127.0.0.1",
 ]
 
 ROOT_URLCONF = "mysite.urls"
 
+# Route policy
+# Which user types may visit which paths, enforced by
+# mysite.middleware.RoutePolicyMiddleware. Each rule maps a path prefix
+# ("=" for an exact path) to the URL names "anonymous", "client" and "admin"
+# users are redirected to; types left out are let through. The longest
+# matching prefix wins. STATIC_URL, MEDIA_URL and ROUTE_POLICY_PUBLIC_PATHS
+# are let through without looking at the session or user.
+
+ROUTE_POLICY = [
+    ("/", {"admin": "admin:login"}),
+    ("=/", {"client": "polls:index", "admin": "admin:login"}),
+    ("/admin/", {"client": "polls:index"}),
+    ("/polls/", {"anonymous": "clients:login", "admin": "admin:login"}),
+]
+
+# The APIs authenticate with clients.tokens bearer tokens, not sessions,
+# and /metrics with METRICS_TOKEN.
+ROUTE_POLICY_PUBLIC_PATHS = [
+    "/__debug__/",
+    "/clients/api/",
+    "/polls/api/contact/",
+    "/polls/api/questions/",
+    "/metrics",
+]
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -108,6 +149,99 @@ DATABASES = {
 }
 
 
+# Contact uploads
+# Limits enforced while attachments stream to MEDIA_ROOT, see
+# polls.upload_handlers. Types are matched as shell-style patterns.
+
+CONTACT_UPLOAD_MAX_BYTES = env.int("CONTACT_UPLOAD_MAX_BYTES", default=20 * 1024 * 1024)
+
+CONTACT_UPLOAD_ALLOWED_TYPES = env.list(
+    "CONTACT_UPLOAD_ALLOWED_TYPES", default=["image/*", "application/pdf", "text/*"]
+)
+
+# Larger attachments go through the resumable uploads of polls.uploads.
+CONTACT_CHUNKED_UPLOAD_MAX_BYTES = env.int(
+    "CONTACT_CHUNKED_UPLOAD_MAX_BYTES", default=2 * 1024 * 1024 * 1024
+)
+
+# Uploads a user may have started and not used in a contact yet, until they
+# expire (polls.uploads.UPLOAD_EXPIRY).
+CONTACT_CHUNKED_UPLOADS_PER_USER = env.int(
+    "CONTACT_CHUNKED_UPLOADS_PER_USER", default=10
+)
+
+
+# Contact jobs
+# Addresses notified of every contact submission by the workers of
+# `manage.py run_jobs`, see polls.jobs.
+
+CONTACT_NOTIFY_EMAILS = env.list("CONTACT_NOTIFY_EMAILS", default=[])
+
+
+# Query budgets
+# What QueryBudgetMiddleware does when a view goes over the budget declared
+# with mysite.query_budget.query_budget: "log" a warning or "raise".
+
+QUERY_BUDGET_ACTION = env.get_value("QUERY_BUDGET_ACTION", default="log")
+
+
+# Profiler
+# Requests profiled by mysite.profiler.ProfilerMiddleware: one in
+# PROFILER_SAMPLE_RATE (0 for none), those under the PROFILER_PATHS
+# prefixes, and those sending PROFILER_HEADER set to PROFILER_TOKEN (no
+# token, no header check). PROFILER_MODE is "sample", taking a stack every
+# PROFILER_SAMPLE_INTERVAL_MS, or "cprofile". The last PROFILER_MAX_PROFILES
+# are kept in PROFILER_DIR and browsed at admin/profiles/.
+
+PROFILER_SAMPLE_RATE = env.int("PROFILER_SAMPLE_RATE", default=0)
+PROFILER_PATHS = env.list("PROFILER_PATHS", default=[])
+PROFILER_HEADER = env.get_value("PROFILER_HEADER", default="X-Profile")
+PROFILER_TOKEN = env.get_value("PROFILER_TOKEN", default="")
+PROFILER_MODE = env.get_value("PROFILER_MODE", default="sample")
+PROFILER_SAMPLE_INTERVAL_MS = env.float("PROFILER_SAMPLE_INTERVAL_MS", default=5)
+PROFILER_DIR = env.get_value("PROFILER_DIR", default=BASE_DIR / "profiles")
+PROFILER_MAX_PROFILES = env.int("PROFILER_MAX_PROFILES", default=500)
+
+
+# Metrics
+# Request metrics served at /metrics in the Prometheus text format, see
+# mysite.metrics. Each worker writes its totals to METRICS_DIR every
+# METRICS_FLUSH_INTERVAL seconds; empty the directory when deploying.
+# Scrapers send METRICS_TOKEN as a bearer token. Without one, /metrics is
+# only served with DEBUG on.
+
+METRICS_DIR = env.get_value("METRICS_DIR", default=BASE_DIR / "metrics")
+METRICS_FLUSH_INTERVAL = env.float("METRICS_FLUSH_INTERVAL", default=5)
+METRICS_TOKEN = env.get_value("METRICS_TOKEN", default="")
+
+
+# Cache
+# Defaults to a per-process memory cache, point CACHE_URL at a shared cache
+# (e.g. redis://127.0.0.1:6379/1) when running several workers.
+
+CACHES = {"default": env.cache("CACHE_URL", default="locmemcache://")}
+
+
+# Sessions
+# Read through the cache, see mysite.sessions. The expiry of a session in
+# use slides forward once it is SESSION_REFRESH_INTERVAL seconds behind,
+# 0 keeps it fixed from the last change.
+
+SESSION_ENGINE = "mysite.sessions"
+
+SESSION_REFRESH_INTERVAL = env.int("SESSION_REFRESH_INTERVAL", default=60 * 60)
+
+
+# API tokens
+# Bearer tokens of the contact API, see clients.tokens. API_TOKEN_KEYS
+# lists "kid:secret" entries: the first signs new tokens, all are accepted.
+# Defaults to a key derived from SECRET_KEY.
+
+API_TOKEN_KEYS = env.list("API_TOKEN_KEYS", default=[])
+
+API_TOKEN_MAX_AGE = env.int("API_TOKEN_MAX_AGE", default=60 * 60)
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -154,6 +288,29 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Polls voting
+# "direct" updates the Choice row on every vote, "sharded" spreads the
+# increments over POLLS_VOTE_SHARDS counter rows per choice and "buffered"
+# counts them in memory and flushes them in bulk every
+# POLLS_VOTE_BUFFER_FLUSH_MS, or sooner when the buffer is full or old.
+# Buffered votes are only known to the worker process that counted them
+# until they are flushed: with several workers, results rebuilt by another
+# worker may lag by up to POLLS_VOTE_BUFFER_MAX_AGE_MS. While flushes fail,
+# a worker keeps at most POLLS_VOTE_BUFFER_MAX_PENDING votes and writes
+# further ones directly.
+
+POLLS_VOTE_MODE = env.get_value("POLLS_VOTE_MODE", default="direct")
+
+POLLS_VOTE_SHARDS = env.int("POLLS_VOTE_SHARDS", default=8)
+
+POLLS_VOTE_BUFFER_FLUSH_MS = env.int("POLLS_VOTE_BUFFER_FLUSH_MS", default=200)
+
+POLLS_VOTE_BUFFER_MAX_SIZE = env.int("POLLS_VOTE_BUFFER_MAX_SIZE", default=10000)
+
+POLLS_VOTE_BUFFER_MAX_AGE_MS = env.int("POLLS_VOTE_BUFFER_MAX_AGE_MS", default=1000)
+
+POLLS_VOTE_BUFFER_MAX_PENDING = env.int("POLLS_VOTE_BUFFER_MAX_PENDING", default=100000)
+
 # LOGGING = {
 #     "version": 1,
 #     "disable_existing_loggers": False,
@@ -21,7 +21,8 @@ from django.contrib import admin
 from django.urls import include, path
 from django.shortcuts import redirect
 
-from debug_toolbar.toolbar import debug_toolbar_urls
+from . import profiler_views
+from .metrics import metrics_view
 
 admin.site.site_header = "Django Example App"
 
@@ -32,13 +33,30 @@ def home_view(request):
     return redirect("/clients/login/")
 
 
-urlpatterns = (
-    [
-        path("", home_view, name="home"),
-        path("admin/", admin.site.urls),
-        path("clients/", include("clients.urls")),
-        path("polls/", include("polls.urls")),
-    ]
-    + debug_toolbar_urls()
-    + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-)
+urlpatterns = [
+    path("", home_view, name="home"),
+    path("metrics", metrics_view, name="metrics"),
+    path(
+        "admin/profiles/",
+        admin.site.admin_view(profiler_views.profile_list),
+        name="profiles",
+    ),
+    path(
+        "admin/profiles/<str:profile_id>/",
+        admin.site.admin_view(profiler_views.profile_detail),
+        name="profileDetail",
+    ),
+    path(
+        "admin/profiles/<str:profile_id>/download/",
+        admin.site.admin_view(profiler_views.profile_download),
+        name="profileDownload",
+    ),
+    path("admin/", admin.site.urls),
+    path("clients/", include("clients.urls")),
+    path("polls/", include("polls.urls")),
+] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+
+if "debug_toolbar" in settings.INSTALLED_APPS:
+    from debug_toolbar.toolbar import debug_toolbar_urls
+
+    urlpatterns += debug_toolbar_urls()
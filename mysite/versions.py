@@ -0,0 +1,51 @@
+"""Version counters kept in the shared cache.
+
+Cached values are stored under a key that includes a counter, and bumping
+the counter is how they are invalidated, see polls.page_cache and
+clients.user_cache.
+"""
+
+import time
+
+from django.core.cache import cache
+
+
+def _initial_version():
+    # Start from the clock so a counter that was evicted from the cache does
+    # not come back with a number an old cache entry was stored under.
+    return int(time.time() * 1000)
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _initial_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Missing counter: anything new is newer than what was stored before.
+        version = _initial_version()
+        cache.set(key, version, timeout=None)
+        return version
+
+
+async def aget_version(key):
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, _initial_version(), timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+async def abump_version(key):
+    try:
+        return await cache.aincr(key)
+    except ValueError:
+        version = _initial_version()
+        await cache.aset(key, version, timeout=None)
+        return version
@@ -1,11 +1,30 @@
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseBadRequest
+from django.urls import path
 from django.utils.html import format_html
-from .models import Question, Choice, Contact
+from mysite.pagination import KeysetPaginationMixin
+from mysite.search import IndexedSearchMixin
+from .export import FORMATS, export_queryset, export_response, parse_bound
+from .models import Question, Choice, Contact, Job
 
 
 class ChoiceInline(admin.TabularInline):
     model = Choice
     extra = 3
+    # Votes are counted, not edited: a posted count would overwrite the
+    # votes cast since the page was loaded. Sharded counters are included,
+    # and folded into Choice.votes by the fold_votes command.
+    fields = ["choice_text", "vote_total"]
+    readonly_fields = ["vote_total"]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_vote_totals()
+
+    @admin.display(description="Votes")
+    def vote_total(self, choice):
+        # The extra forms' new choices have none.
+        return getattr(choice, "total_votes", 0)
 
 
 class QuestionAdmin(admin.ModelAdmin):
@@ -20,10 +39,13 @@ class QuestionAdmin(admin.ModelAdmin):
     inlines = [ChoiceInline]
 
 
-class ContactAdmin(admin.ModelAdmin):
+class ContactAdmin(KeysetPaginationMixin, IndexedSearchMixin, admin.ModelAdmin):
     list_display = ("name", "email", "submitted_at", "uploaded_file_link")
     list_filter = ("submitted_at",)
     search_fields = ("name", "email", "message")
+    search_by_id = True
+    keyset_field = "submitted_at"
+    actions = ["export_csv", "export_ndjson"]
 
     def uploaded_file_link(self, obj):
         if obj.file:
@@ -32,6 +54,49 @@ class ContactAdmin(admin.ModelAdmin):
             )
         return "No file uploaded"
 
+    @admin.action(description="Export selected contacts as CSV")
+    def export_csv(self, request, queryset):
+        return export_response(export_queryset(queryset), "csv")
+
+    @admin.action(description="Export selected contacts as NDJSON")
+    def export_ndjson(self, request, queryset):
+        return export_response(export_queryset(queryset), "ndjson")
+
+    def get_urls(self):
+        # ex: /admin/polls/contact/export/?format=ndjson&gzip=1&since=2025-01-01
+        return [
+            path(
+                "export/",
+                self.admin_site.admin_view(self.export_view),
+                name="polls_contact_export",
+            ),
+        ] + super().get_urls()
+
+    def export_view(self, request):
+        """Stream every contact, optionally within a submitted_at range."""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        export_format = request.GET.get("format", "csv")
+        if export_format not in FORMATS:
+            return HttpResponseBadRequest(f"Unknown format {export_format!r}.")
+        try:
+            since = parse_bound(request.GET.get("since"))
+            until = parse_bound(request.GET.get("until"), end=True)
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+        return export_response(
+            export_queryset(since=since, until=until),
+            export_format,
+            compress=request.GET.get("gzip") in ("1", "true"),
+        )
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("task", "contact", "status", "attempts", "run_after")
+    list_filter = ("status", "task")
+    raw_id_fields = ("contact",)
+
 
 admin.site.register(Question, QuestionAdmin)
 admin.site.register(Contact, ContactAdmin)
+admin.site.register(Job, JobAdmin)
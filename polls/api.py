@@ -0,0 +1,141 @@
+"""Cursor-paginated JSON listing of questions with their choices.
+
+Pages are ordered newest first and selected by seeking past the
+(pub_date, id) of the previous page's last question, which the client gets
+back as an opaque cursor. The seek is an index range scan over
+polls_question_published, so a deep page reads no more rows than the
+first. A page costs two queries: the questions, then the choices of all
+of them. Rows are fetched with values(), no model instances are built.
+
+Responses carry an ETag derived from LIST_VERSION_KEY, which the model
+signals bump, so clients revalidating an unchanged page get a 304 without
+any query.
+"""
+
+import base64
+import hashlib
+import json
+
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_datetime
+from django.utils.http import quote_etag, urlencode
+
+from mysite.versions import aget_version, bump_version, get_version
+
+from .models import Choice, Question
+
+LIST_VERSION_KEY = "polls:api:questions:version"
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(question):
+    position = [question["pub_date"].isoformat(), question["id"]]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return the (pub_date, id) a cursor points at, ValueError if invalid."""
+    try:
+        pub_date, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        pub_date = parse_datetime(pub_date)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor.") from e
+    if pub_date is None or not isinstance(pk, int):
+        raise ValueError("Invalid cursor.")
+    return pub_date, pk
+
+
+def parse_page(params):
+    """Return the (cursor, limit) a request asks for, ValueError if invalid."""
+    cursor = params.get("cursor") or None
+    if cursor is not None:
+        decode_cursor(cursor)
+    try:
+        limit = int(params.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError as e:
+        raise ValueError("Invalid limit.") from e
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f"The limit must be between 1 and {MAX_PAGE_SIZE}.")
+    return cursor, limit
+
+
+def page_response(request, page, limit, etag):
+    """Return the page as JSON, tagged so clients can revalidate it."""
+    page["next"] = None
+    if page["next_cursor"] is not None:
+        query = urlencode({"cursor": page["next_cursor"], "limit": limit})
+        page["next"] = request.build_absolute_uri(f"{request.path}?{query}")
+    response = JsonResponse(page)
+    response["ETag"] = etag
+    # Always revalidate, the ETag makes that cheap.
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def page_etag(version, cursor, limit):
+    digest = hashlib.md5(f"{cursor}:{limit}".encode(), usedforsecurity=False)
+    return quote_etag(f"{version}-{digest.hexdigest()[:16]}")
+
+
+def _questions(cursor, limit):
+    questions = Question.objects.order_by("-pub_date", "-id")
+    if cursor is not None:
+        pub_date, pk = decode_cursor(cursor)
+        # The redundant pub_date bound is what the index scan starts at,
+        # PostgreSQL cannot derive one from the OR.
+        questions = questions.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk),
+            pub_date__lte=pub_date,
+        )
+    # One more than asked for tells whether there is a next page.
+    return questions.values("id", "question_text", "pub_date")[: limit + 1]
+
+
+def _choices(questions):
+    return (
+        Choice.objects.filter(question_id__in=[q["id"] for q in questions])
+        .order_by("question_id", "id")
+        .values("id", "question_id", "choice_text")
+    )
+
+
+def _page(questions, choices, limit):
+    by_question = {}
+    for choice in choices:
+        by_question.setdefault(choice.pop("question_id"), []).append(choice)
+    results = questions[:limit]
+    for question in results:
+        question["choices"] = by_question.get(question["id"], [])
+    more = len(questions) > limit
+    return {
+        "results": results,
+        "next_cursor": encode_cursor(results[-1]) if more else None,
+    }
+
+
+def list_version():
+    return get_version(LIST_VERSION_KEY)
+
+
+def question_page(cursor, limit):
+    questions = list(_questions(cursor, limit))
+    choices = list(_choices(questions)) if questions else []
+    return _page(questions, choices, limit)
+
+
+def invalidate():
+    bump_version(LIST_VERSION_KEY)
+
+
+async def alist_version():
+    return await aget_version(LIST_VERSION_KEY)
+
+
+async def aquestion_page(cursor, limit):
+    questions = [q async for q in _questions(cursor, limit)]
+    choices = [c async for c in _choices(questions)] if questions else []
+    return _page(questions, choices, limit)
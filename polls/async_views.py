@@ -0,0 +1,177 @@
+"""Async-native versions of the busiest polls views.
+
+polls.urls routes to these instead of polls.views when ASYNC_VIEWS is on,
+which mysite.asgi turns on by default. They only use the async ORM and
+async cache API, and load everything a template needs before rendering so
+no query runs on the event loop.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, HttpResponseRedirect, JsonResponse
+from django.shortcuts import aget_object_or_404, render
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.db.models import F
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from clients.decorators import api_token_required
+from mysite.query_budget import query_budget
+
+from . import api, page_cache, snapshots, uploads
+from .counters import AVOTE_RECORDERS
+from .jobs import asubmission_status, enqueue_contact_jobs, submission_accepted
+from .models import Choice, Contact, Question
+from .upload_handlers import (
+    discard_uploads,
+    stored_file,
+    streaming_uploads,
+    upload_error,
+)
+
+
+@query_budget(3, max_time_ms=50)
+class IndexView(View):
+    async def get(self, request):
+        version = await page_cache.aindex_version()
+        context = {
+            "latest_question_list": await page_cache.alatest_questions(version),
+            "index_version": version,
+            "page_cache_timeout": page_cache.PAGE_CACHE_TIMEOUT,
+        }
+        return render(request, "polls/index.html", context)
+
+
+async def _detail_context(question):
+    return {
+        "question": question,
+        "question_version": await page_cache.aquestion_version(question.pk),
+        "page_cache_timeout": page_cache.PAGE_CACHE_TIMEOUT,
+    }
+
+
+@query_budget(4, max_time_ms=50)
+class DetailView(View):
+    async def get(self, request, pk):
+        question = await page_cache.aget_question(pk)
+        if question is None:
+            raise Http404("No question found matching the query")
+        return render(request, "polls/detail.html", await _detail_context(question))
+
+
+@query_budget(4, max_time_ms=50)
+class ResultsView(View):
+    async def get(self, request, pk):
+        snapshot = await snapshots.aget_snapshot(pk)
+        if snapshot is None:
+            raise Http404("No question found matching the query")
+        return render(request, "polls/results.html", {"snapshot": snapshot})
+
+
+@query_budget(7, max_time_ms=100)
+async def vote(request, question_id):
+    try:
+        choice_id = int(request.POST["choice"])
+    except (KeyError, ValueError):
+        choice_id = None
+
+    record_vote = AVOTE_RECORDERS.get(settings.POLLS_VOTE_MODE)
+    if record_vote is not None:
+        if choice_id is not None and await record_vote(question_id, choice_id):
+            await snapshots.arecord_vote(question_id, choice_id)
+            return HttpResponseRedirect(reverse("polls:results", args=(question_id,)))
+
+    question = await aget_object_or_404(
+        Question.objects.prefetch_related("choice_set"), pk=question_id
+    )
+    if record_vote is None and choice_id is not None:
+        # Same single UPDATE as Choice.save(update_fields=["votes"])
+        if await Choice.objects.filter(pk=choice_id, question=question).aupdate(
+            votes=F("votes") + 1
+        ):
+            await snapshots.arecord_vote(question_id, choice_id)
+            return HttpResponseRedirect(reverse("polls:results", args=(question_id,)))
+
+    # Redisplay the question voting form.
+    context = await _detail_context(question)
+    context["error_message"] = "You didn't select a choice."
+    return render(request, "polls/detail.html", context)
+
+
+@query_budget(9, max_time_ms=100)
+@csrf_exempt
+@api_token_required
+@streaming_uploads
+async def contact_api(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+    error = upload_error(request)
+    if error:
+        return JsonResponse({"error": error}, status=request.upload_error_status)
+
+    name = request.POST.get("name")
+    email = request.POST.get("email")
+    message = request.POST.get("message")
+    file = stored_file(request.FILES.get("file", None))
+
+    if not name or not email or not message:
+        discard_uploads(request)
+        return JsonResponse(
+            {"error": "Name, email, and message are required."}, status=400
+        )
+
+    upload = None
+    if request.POST.get("upload"):
+        upload = await uploads.acompleted_upload(
+            request.POST["upload"], request.api_claims["sub"]
+        )
+        if upload is None:
+            discard_uploads(request)
+            return JsonResponse({"error": "Unknown or unfinished upload."}, status=400)
+        file = upload.file
+
+    contact = Contact(
+        name=name,
+        email=email,
+        message=message,
+        file=file,
+        submitted_by_id=request.api_claims["sub"],
+    )
+    if not await sync_to_async(_save_contact)(contact, upload):
+        return JsonResponse({"error": "Unknown or unfinished upload."}, status=400)
+    return JsonResponse(submission_accepted(contact), status=202)
+
+
+def _save_contact(contact, upload=None):
+    """Save the contact and queue its jobs, False if its upload was taken."""
+    with transaction.atomic():
+        if upload is not None and not uploads.consume(upload):
+            return False
+        contact.save()
+        enqueue_contact_jobs(contact)
+    return True
+
+
+@query_budget(4, max_time_ms=50)
+@api_token_required
+async def contact_status(request, pk):
+    status = await asubmission_status(pk, request.api_claims["sub"])
+    if status is None:
+        return JsonResponse({"error": "Submission not found."}, status=404)
+    return JsonResponse(status)
+
+
+@query_budget(4, max_time_ms=50)
+@api_token_required
+async def questions_api(request):
+    try:
+        cursor, limit = api.parse_page(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    etag = api.page_etag(await api.alist_version(), cursor, limit)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+    page = await api.aquestion_page(cursor, limit)
+    return api.page_response(request, page, limit, etag)
@@ -0,0 +1,54 @@
+import math
+
+# Metrics compared against a baseline, and whether higher is better.
+METRICS = {
+    "throughput": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+    "queries_per_request": False,
+    "db_ms_per_request": False,
+}
+
+
+def percentile(sorted_samples, fraction):
+    """Nearest-rank percentile of already sorted samples."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+
+def summarize(samples_ms, elapsed):
+    """Return throughput and latency percentiles of a set of timings."""
+    samples_ms = sorted(samples_ms)
+    return {
+        "requests": len(samples_ms),
+        "throughput": len(samples_ms) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(samples_ms, 0.50),
+        "p95_ms": percentile(samples_ms, 0.95),
+        "p99_ms": percentile(samples_ms, 0.99),
+    }
+
+
+def compare(baseline, current, tolerance):
+    """Return the regressions of `current` results against `baseline` ones.
+
+    Results map endpoints to their metrics. A metric regresses when it got
+    worse by more than `tolerance`, a fraction of its baseline value.
+    Endpoints missing from either side are skipped. Regressions are
+    (endpoint, metric, baseline value, current value) tuples.
+    """
+    regressions = []
+    for endpoint, before in baseline.items():
+        after = current.get(endpoint)
+        if after is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            old, new = before.get(metric), after.get(metric)
+            if old is None or new is None:
+                continue
+            change = (old - new) if higher_is_better else (new - old)
+            if change > tolerance * old:
+                regressions.append((endpoint, metric, old, new))
+    return regressions
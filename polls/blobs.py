@@ -0,0 +1,134 @@
+"""Reference counts of the files in ContentAddressedStorage.
+
+Identical uploads share a single blob, so a file can only be deleted once no
+Contact points at it anymore. polls.signals keeps StoredBlob.ref_count in
+step with Contact rows and collect_garbage() deletes what nothing uses.
+Files outside blobs/ (uploads made before the storage existed) are not
+counted and never collected.
+"""
+
+import os
+import time
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+
+from .models import Contact, StoredBlob
+from .storage import BLOB_DIR
+
+# Seconds a blob is kept after its last write or reference. Covers uploads
+# that are stored but whose Contact has not been saved yet.
+GC_GRACE_PERIOD = 60 * 60
+
+
+def contact_storage():
+    return Contact._meta.get_field("file").storage
+
+
+def is_blob(name):
+    return bool(name) and name.startswith(f"{BLOB_DIR}/")
+
+
+def acquire(name):
+    """Count one more reference to the blob."""
+    if not is_blob(name):
+        return
+    if StoredBlob.objects.filter(name=name).update(ref_count=F("ref_count") + 1):
+        return
+    try:
+        with transaction.atomic():
+            StoredBlob.objects.create(name=name, ref_count=1)
+    except IntegrityError:
+        # Created by a concurrent upload of the same content.
+        StoredBlob.objects.filter(name=name).update(ref_count=F("ref_count") + 1)
+
+
+def acquire_many(names):
+    """Count one more reference per name, in two queries.
+
+    For contacts created with bulk_create(), which sends no signals.
+    """
+    counts = Counter(name for name in names if is_blob(name))
+    if not counts:
+        return
+    StoredBlob.objects.bulk_create(
+        [StoredBlob(name=name) for name in counts], ignore_conflicts=True
+    )
+    StoredBlob.objects.filter(name__in=counts).update(
+        ref_count=F("ref_count")
+        + Case(
+            *[When(name=name, then=Value(count)) for name, count in counts.items()],
+            default=Value(0),
+        )
+    )
+
+
+def release(name):
+    """Drop one reference to the blob, collect_garbage() deletes it at 0."""
+    if is_blob(name):
+        StoredBlob.objects.filter(name=name).update(ref_count=F("ref_count") - 1)
+
+
+def _is_recent(path, grace_period):
+    try:
+        return time.time() - os.path.getmtime(path) < grace_period
+    except FileNotFoundError:
+        return False
+
+
+def _collect(storage, name, grace_period, dry_run):
+    """Delete the blob if it is still unreferenced, return whether it was."""
+    with transaction.atomic():
+        # Locked, so acquire() waits until the row is gone. Checked again
+        # under the lock: the blob may have been referenced, or uploaded
+        # again, since it was listed.
+        blob = (
+            StoredBlob.objects.select_for_update()
+            .filter(name=name, ref_count__lte=0)
+            .first()
+        )
+        if blob is None or _is_recent(storage.path(name), grace_period):
+            return False
+        if not dry_run:
+            storage.delete(name)
+            blob.delete()
+    return True
+
+
+def collect_garbage(grace_period=GC_GRACE_PERIOD, dry_run=False):
+    """Delete blobs no Contact refers to, return their names.
+
+    Also removes incoming files left behind by interrupted uploads.
+    """
+    storage = contact_storage()
+    deleted = []
+
+    # Blobs that were stored but never referenced, e.g. by invalid forms,
+    # are counted at 0 first so they are deleted under a lock as well.
+    counted = set(StoredBlob.objects.values_list("name", flat=True))
+    uncounted = [
+        name
+        for name in storage.blob_names()
+        if name not in counted and not _is_recent(storage.path(name), grace_period)
+    ]
+    if dry_run:
+        deleted.extend(uncounted)
+    else:
+        StoredBlob.objects.bulk_create(
+            [StoredBlob(name=name) for name in uncounted], ignore_conflicts=True
+        )
+
+    unreferenced = StoredBlob.objects.filter(ref_count__lte=0).values_list(
+        "name", flat=True
+    )
+    for name in unreferenced.iterator():
+        if _is_recent(storage.path(name), grace_period):
+            continue
+        if _collect(storage, name, grace_period, dry_run):
+            deleted.append(name)
+
+    if not dry_run:
+        for path in storage.incoming_files(older_than=grace_period):
+            os.remove(path)
+    return deleted
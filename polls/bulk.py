@@ -0,0 +1,129 @@
+"""Creating many contacts in one request, for api/contact/bulk/.
+
+Records are sent as a JSON array, as NDJSON (one object per line), or as
+the "contacts" field of a multipart request whose other parts are the
+attachments. A record names its attachment's part in its "file" key.
+Every record is checked like ContactForm checks a submission, and the
+valid ones are inserted with bulk_create(), CHUNK_SIZE at a time.
+"""
+
+import json
+from itertools import chain
+
+from django.db import transaction
+
+from . import blobs
+from .forms import ContactForm
+from .models import Contact, Job
+from .tasks import contact_jobs
+from .upload_handlers import stored_file
+
+CHUNK_SIZE = 1000
+
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl")
+
+_INVALID_JSON = object()
+
+
+def _ndjson(lines):
+    for line in lines:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield _INVALID_JSON
+
+
+def parse_records(request):
+    """Return an iterable over the request's records.
+
+    Raises ValueError if the body is not in a supported format.
+    """
+    if request.content_type in NDJSON_TYPES:
+        # Read line by line, the body is never held in memory as a whole.
+        return _ndjson(request)
+    if request.content_type == "multipart/form-data":
+        text = request.POST.get("contacts", "")
+        if not text.lstrip().startswith("["):
+            return _ndjson(text.splitlines())
+        records = json.loads(text)
+    elif request.content_type == "application/json":
+        records = json.load(request)
+    else:
+        raise ValueError(f"Unsupported content type {request.content_type!r}.")
+    if not isinstance(records, list):
+        raise ValueError("Expected a JSON array of contacts.")
+    return records
+
+
+def build_contact(record, files, submitted_by_id=None):
+    """Return (contact, None) for a valid record, (None, errors) otherwise."""
+    if record is _INVALID_JSON:
+        return None, {"__all__": ["Invalid JSON."]}
+    if not isinstance(record, dict):
+        return None, {"__all__": ["Expected a JSON object."]}
+
+    attachments = {}
+    if record.get("file"):
+        upload = files.get(record["file"])
+        if upload is None:
+            return None, {"file": [f"No attachment named {record['file']!r}."]}
+        attachments["file"] = upload
+
+    form = ContactForm(
+        {field: record.get(field) for field in ("name", "email", "message")},
+        attachments,
+    )
+    if not form.is_valid():
+        return None, form.errors.get_json_data()
+    return (
+        Contact(
+            name=form.cleaned_data["name"],
+            email=form.cleaned_data["email"],
+            message=form.cleaned_data["message"],
+            file=stored_file(attachments["file"]) if attachments else None,
+            submitted_by_id=submitted_by_id,
+        ),
+        None,
+    )
+
+
+def save_chunk(contacts):
+    # bulk_create() sends no post_save, so do what the signal handlers and
+    # the single-contact views would.
+    with transaction.atomic():
+        Contact.objects.bulk_create(contacts)
+        blobs.acquire_many(contact.file.name for contact in contacts)
+        Job.objects.bulk_create(
+            chain.from_iterable(contact_jobs(contact) for contact in contacts)
+        )
+
+
+def create_contacts(records, files, submitted_by_id=None):
+    """Insert the valid records, return a result per record.
+
+    submitted_by_id is the ClientUser the contacts are recorded as sent by.
+    """
+    results = []
+    chunk = []
+
+    def flush():
+        save_chunk([contact for _, contact in chunk])
+        for result, contact in chunk:
+            result["id"] = contact.pk
+        chunk.clear()
+
+    for index, record in enumerate(records):
+        contact, errors = build_contact(record, files, submitted_by_id)
+        if errors is not None:
+            results.append({"index": index, "errors": errors})
+            continue
+        result = {"index": index}
+        results.append(result)
+        chunk.append((result, contact))
+        if len(chunk) >= CHUNK_SIZE:
+            flush()
+    if chunk:
+        flush()
+    return results
@@ -0,0 +1,146 @@
+import random
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Value, When
+
+from .models import Choice, ChoiceVoteShard
+from .vote_buffer import (
+    arecord_buffered_vote,
+    get_vote_buffer,
+    record_buffered_vote,
+)
+
+
+def shard_count():
+    return max(1, settings.POLLS_VOTE_SHARDS)
+
+
+def _new_vote_shards(choice_ids):
+    return [
+        ChoiceVoteShard(choice_id=choice_id, slot=slot)
+        for choice_id in choice_ids
+        for slot in range(shard_count())
+    ]
+
+
+def ensure_vote_shards(choice_ids):
+    """Create the counter slots of the given choices if they are missing."""
+    ChoiceVoteShard.objects.bulk_create(
+        _new_vote_shards(choice_ids), ignore_conflicts=True
+    )
+
+
+def _random_shard(question_id, choice_id):
+    return ChoiceVoteShard.objects.filter(
+        choice_id=choice_id,
+        choice__question_id=question_id,
+        slot=random.randrange(shard_count()),
+    )
+
+
+def record_sharded_vote(question_id, choice_id):
+    """Add one vote to a random slot of the choice.
+
+    The membership of the choice in the question is checked by the same
+    UPDATE statement, so a vote costs one round trip and concurrent voters
+    only contend when they pick the same slot. Returns False when the choice
+    does not belong to the question.
+    """
+    shard = _random_shard(question_id, choice_id)
+    if shard.update(votes=F("votes") + 1):
+        return True
+
+    # Either the choice is not part of the question or its slots have not
+    # been created yet (first vote, or POLLS_VOTE_SHARDS was raised).
+    if not Choice.objects.filter(pk=choice_id, question_id=question_id).exists():
+        return False
+    ensure_vote_shards([choice_id])
+    return shard.update(votes=F("votes") + 1) > 0
+
+
+async def arecord_sharded_vote(question_id, choice_id):
+    shard = _random_shard(question_id, choice_id)
+    if await shard.aupdate(votes=F("votes") + 1):
+        return True
+
+    if not await Choice.objects.filter(pk=choice_id, question_id=question_id).aexists():
+        return False
+    await ChoiceVoteShard.objects.abulk_create(
+        _new_vote_shards([choice_id]), ignore_conflicts=True
+    )
+    return await shard.aupdate(votes=F("votes") + 1) > 0
+
+
+def fold_vote_shards(question_id=None):
+    """Move the slot counts into Choice.votes and reset the slots.
+
+    Returns the number of votes that were folded.
+    """
+    shards = ChoiceVoteShard.objects.filter(votes__gt=0)
+    if question_id is not None:
+        shards = shards.filter(choice__question_id=question_id)
+
+    with transaction.atomic():
+        rows = list(
+            shards.select_for_update(of=("self",)).values_list(
+                "pk", "choice_id", "votes"
+            )
+        )
+        if not rows:
+            return 0
+
+        totals = defaultdict(int)
+        for _, choice_id, votes in rows:
+            totals[choice_id] += votes
+
+        Choice.objects.filter(pk__in=totals).update(
+            votes=F("votes")
+            + Case(
+                *[When(pk=pk, then=Value(votes)) for pk, votes in totals.items()],
+                default=Value(0),
+            )
+        )
+        ChoiceVoteShard.objects.filter(pk__in=[row[0] for row in rows]).update(votes=0)
+    return sum(totals.values())
+
+
+def _choice_totals_queryset(question_id):
+    return (
+        Choice.objects.filter(question_id=question_id)
+        .with_vote_totals()
+        .order_by("pk")
+        .values_list("pk", "choice_text", "total_votes")
+    )
+
+
+def choice_totals(question_id):
+    """Return (id, text, votes) for each choice of the question.
+
+    The votes include those still held in the counter slots and in this
+    process's vote buffer, so a voter served by the same worker sees their
+    own vote before it is flushed. The rows are read first: votes flushed
+    in between are then missed by this read, rather than counted twice.
+    """
+    rows = list(_choice_totals_queryset(question_id))
+    pending = get_vote_buffer().pending(question_id)
+    return [(pk, text, votes + pending.get(pk, 0)) for pk, text, votes in rows]
+
+
+async def achoice_totals(question_id):
+    rows = [row async for row in _choice_totals_queryset(question_id)]
+    pending = get_vote_buffer().pending(question_id)
+    return [(pk, text, votes + pending.get(pk, 0)) for pk, text, votes in rows]
+
+
+# Vote modes that bypass the per-vote Choice.save() in polls.views.vote.
+VOTE_RECORDERS = {
+    "sharded": record_sharded_vote,
+    "buffered": record_buffered_vote,
+}
+
+AVOTE_RECORDERS = {
+    "sharded": arecord_sharded_vote,
+    "buffered": arecord_buffered_vote,
+}
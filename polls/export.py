@@ -0,0 +1,130 @@
+"""Streaming dumps of Contact rows as CSV or NDJSON.
+
+Rows are read with iterator(), which uses a server-side cursor on
+PostgreSQL, and encoded as they arrive, so memory use does not depend on
+the number of rows. The first line is sent on its own, the rest in pieces
+of about BUFFER_SIZE bytes.
+"""
+
+import csv
+import datetime
+import json
+import zlib
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Contact
+
+FIELDS = ("id", "name", "email", "message", "file", "submitted_at")
+
+CHUNK_SIZE = 2000
+
+BUFFER_SIZE = 64 * 1024
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def parse_bound(value, end=False):
+    """Parse an ISO date or datetime, None if empty.
+
+    A date as the end of a range includes that whole day. Raises ValueError
+    if the value is neither.
+    """
+    if not value:
+        return None
+    # Dates first: parse_datetime() also takes them, as midnight.
+    day = parse_date(value)
+    if day is not None:
+        moment = datetime.datetime.combine(
+            day + datetime.timedelta(days=1) if end else day, datetime.time()
+        )
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(f"Invalid date {value!r}.")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def export_queryset(queryset=None, since=None, until=None):
+    queryset = Contact.objects.all() if queryset is None else queryset
+    if since is not None:
+        queryset = queryset.filter(submitted_at__gte=since)
+    if until is not None:
+        queryset = queryset.filter(submitted_at__lt=until)
+    return queryset.order_by("pk").values_list(*FIELDS)
+
+
+class _Line:
+    """File-like target for csv.writer returning what is written."""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Line())
+    yield writer.writerow(FIELDS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(FIELDS, row)), cls=DjangoJSONEncoder) + "\n"
+
+
+def _buffered(lines):
+    lines = iter(lines)
+    # The first line goes out on its own so the client gets a byte at once.
+    for line in lines:
+        yield line.encode()
+        break
+    buffer = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= BUFFER_SIZE:
+            yield "".join(buffer).encode()
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer).encode()
+
+
+def _gzipped(chunks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        # Sync flushes keep data from piling up inside the compressor.
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def stream(queryset, export_format="csv", compress=False):
+    """Yield the encoded export of a queryset from export_queryset()."""
+    rows = queryset.iterator(chunk_size=CHUNK_SIZE)
+    lines = _csv_lines(rows) if export_format == "csv" else _ndjson_lines(rows)
+    chunks = _buffered(lines)
+    return _gzipped(chunks) if compress else chunks
+
+
+def export_response(queryset, export_format="csv", compress=False):
+    filename = f"contacts-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"
+    if compress:
+        filename += ".gz"
+    response = StreamingHttpResponse(
+        stream(queryset, export_format, compress),
+        content_type="application/gzip" if compress else FORMATS[export_format],
+    )
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    # Keep proxies from holding the stream back until it ends.
+    response["X-Accel-Buffering"] = "no"
+    return response
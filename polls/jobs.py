@@ -0,0 +1,195 @@
+"""Database-backed job queue, no broker needed.
+
+Views insert Job rows next to the contact they belong to and answer right
+away. `manage.py run_jobs` starts a pool of processes, each running work():
+claim the next ready job, run its task from polls.tasks, repeat. Failed jobs
+are retried with exponential backoff until MAX_ATTEMPTS, jobs whose worker
+died are picked up again once their LEASE is over (or failed, if that was
+their last attempt). Idle workers expire abandoned chunked uploads as well.
+Database errors do not stop a worker, it waits and carries on; the command
+restarts workers that stopped anyway.
+"""
+
+import logging
+import random
+import time
+from datetime import timedelta
+
+import django
+from django.db import DatabaseError, close_old_connections, transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import Contact, Job
+from .tasks import TASKS, contact_jobs
+from .uploads import expire_uploads
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+
+# Seconds before the first retry, doubled for every further attempt.
+RETRY_DELAY = 10
+
+# Seconds a job may run before it is considered abandoned.
+LEASE = 10 * 60
+
+# Seconds between two expire_uploads() runs of an idle worker.
+EXPIRE_UPLOADS_INTERVAL = 60 * 60
+
+
+def enqueue_contact_jobs(contact):
+    Job.objects.bulk_create(contact_jobs(contact))
+
+
+def submission_accepted(contact):
+    """Return the API response for a contact whose jobs were just queued."""
+    return {
+        "message": "Contact information submitted successfully!",
+        "id": contact.pk,
+        "status_url": reverse("polls:apiContactStatus", args=(contact.pk,)),
+    }
+
+
+def retry_delay(attempts):
+    # Jitter keeps jobs that failed together from being retried together.
+    return RETRY_DELAY * 2 ** (attempts - 1) * random.uniform(0.5, 1.5)
+
+
+def requeue_abandoned():
+    """Queue the jobs whose worker died again, return how many were."""
+    abandoned = Job.objects.filter(
+        status=Job.Status.RUNNING,
+        started_at__lt=timezone.now() - timedelta(seconds=LEASE),
+    )
+    abandoned.filter(attempts__gte=MAX_ATTEMPTS).update(
+        status=Job.Status.FAILED, last_error="Abandoned by its worker"
+    )
+    return abandoned.update(status=Job.Status.QUEUED)
+
+
+def claim():
+    """Mark the next ready job as running and return it, None if there is none."""
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.Status.QUEUED, run_after__lte=timezone.now())
+            .order_by("run_after")
+            .first()
+        )
+        if job is None:
+            return None
+        # Conditional, for backends without SELECT ... FOR UPDATE (SQLite).
+        claimed = Job.objects.filter(pk=job.pk, status=Job.Status.QUEUED).update(
+            status=Job.Status.RUNNING,
+            attempts=job.attempts + 1,
+            started_at=timezone.now(),
+        )
+    if not claimed:
+        return None
+    job.refresh_from_db()
+    return job
+
+
+def run(job):
+    try:
+        TASKS[job.task](job)
+    except Exception as error:  # pylint: disable=broad-exception-caught
+        logger.warning("Job %s failed (attempt %s)", job, job.attempts, exc_info=True)
+        job.last_error = f"{type(error).__name__}: {error}"
+        if job.attempts >= MAX_ATTEMPTS:
+            job.status = Job.Status.FAILED
+        else:
+            job.status = Job.Status.QUEUED
+            job.run_after = timezone.now() + timedelta(
+                seconds=retry_delay(job.attempts)
+            )
+    else:
+        job.status = Job.Status.DONE
+    # Not save(): the job is gone if its contact was deleted meanwhile.
+    updated = Job.objects.filter(pk=job.pk).update(
+        status=job.status, run_after=job.run_after, last_error=job.last_error
+    )
+    if not updated:
+        logger.info("Job %s was deleted while it ran", job)
+
+
+def setup_worker():
+    """ProcessPoolExecutor initializer, for start methods other than fork."""
+    django.setup()
+
+
+def work(poll_interval=1.0, until_idle=False):
+    """Run jobs until interrupted, return how many were run.
+
+    With `until_idle`, return as soon as no job is ready. Idle, a worker
+    also expires abandoned chunked uploads, every EXPIRE_UPLOADS_INTERVAL.
+    """
+    done = 0
+    expire_after = time.monotonic()
+    try:
+        while True:
+            close_old_connections()
+            try:
+                job = claim()
+                if job is not None:
+                    run(job)
+                    done += 1
+                    continue
+                if time.monotonic() >= expire_after:
+                    expire_uploads()
+                    expire_after = time.monotonic() + EXPIRE_UPLOADS_INTERVAL
+                if until_idle:
+                    return done
+                requeue_abandoned()
+            except DatabaseError:
+                # Lost a race for the table lock (SQLite), or the database
+                # is away. A job claimed meanwhile is requeued after LEASE.
+                logger.warning("Job worker database error", exc_info=True)
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        return done
+
+
+def _submission_status(statuses):
+    if Job.Status.FAILED in statuses:
+        return Job.Status.FAILED
+    if all(status == Job.Status.DONE for status in statuses):
+        return Job.Status.DONE
+    return "processing"
+
+
+def _status_response(contact_id, jobs):
+    return {
+        "id": contact_id,
+        "status": _submission_status([job["status"] for job in jobs]),
+        "jobs": jobs,
+    }
+
+
+def _jobs_of(contact_id, user_id):
+    return Job.objects.filter(
+        contact_id=contact_id, contact__submitted_by_id=user_id
+    ).values("task", "status", "attempts")
+
+
+def _contact(contact_id, user_id):
+    return Contact.objects.filter(pk=contact_id, submitted_by_id=user_id)
+
+
+def submission_status(contact_id, user_id):
+    """Return what the jobs of a contact are up to.
+
+    None if it does not exist or was not submitted by the user.
+    """
+    jobs = list(_jobs_of(contact_id, user_id))
+    if not jobs and not _contact(contact_id, user_id).exists():
+        return None
+    return _status_response(contact_id, jobs)
+
+
+async def asubmission_status(contact_id, user_id):
+    jobs = [job async for job in _jobs_of(contact_id, user_id)]
+    if not jobs and not await _contact(contact_id, user_id).aexists():
+        return None
+    return _status_response(contact_id, jobs)
@@ -0,0 +1,397 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from statistics import fmean
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from clients.models import ClientUser
+from clients.tokens import issue_token
+from mysite.query_budget import QueryRecorder
+from polls.benchmarks import compare, summarize
+from polls.models import Contact, Question
+from polls.seeding import SeedPlan, seed
+
+BACKEND = "clients.auth_backends.ClientUserBackend"
+
+# Everything the benchmark creates is marked so it can be cleaned up.
+QUESTION_PREFIX = "[bench] "
+EMAIL_DOMAIN = "bench.invalid"
+PASSWORD = "bench-password"
+
+FLOWS = ("poll", "login", "signup", "contact")
+DEFAULT_MIX = "poll=6,login=2,signup=1,contact=1"
+
+
+def parse_mix(value):
+    """Return {flow: weight} of a "flow=weight,..." mix."""
+    mix = {}
+    for item in value.split(","):
+        flow, _, weight = item.partition("=")
+        if flow not in FLOWS:
+            raise CommandError(f"Unknown flow {flow!r}, expected one of {FLOWS}.")
+        try:
+            mix[flow] = int(weight or 1)
+        except ValueError as e:
+            raise CommandError(f"Invalid weight for {flow!r}: {weight!r}") from e
+    return mix
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a dataset and drive a mix of the polls and clients flows across "
+        "concurrent workers. Reports throughput, latency percentiles, queries "
+        "and DB time per endpoint, and compares them to an earlier baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", type=int, default=100)
+        parser.add_argument(
+            "--choices", type=int, default=4, help="Choices per question."
+        )
+        parser.add_argument("--users", type=int, default=200, help="Client users.")
+        parser.add_argument("--contacts", type=int, default=1000)
+        parser.add_argument(
+            "--threads", type=int, default=4, help="Concurrent workers per process."
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="Processes to run the threads in, more than one sidesteps the GIL.",
+        )
+        parser.add_argument(
+            "--iterations", type=int, default=50, help="Flows run by each worker."
+        )
+        parser.add_argument(
+            "--mix",
+            default=DEFAULT_MIX,
+            help=f"Weights of the flows {', '.join(FLOWS)}. Default: {DEFAULT_MIX}",
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+        parser.add_argument(
+            "--output", help="Write the results to this JSON file, to diff later."
+        )
+        parser.add_argument(
+            "--baseline", help="JSON results of an earlier run to compare against."
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.2,
+            help="How much worse than the baseline a metric may get, as a fraction.",
+        )
+        parser.add_argument(
+            "--keep", action="store_true", help="Keep the seeded data afterwards."
+        )
+        # Internal: run the workload against data seeded by the parent
+        # process and print the raw samples.
+        parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        mix = parse_mix(options["mix"])
+        if options["worker"] is not None:
+            samples, elapsed = self.run_process(options, mix, options["worker"])
+            self.stdout.write(json.dumps({"samples": samples, "elapsed": elapsed}))
+            return
+
+        baseline = None
+        if options["baseline"]:
+            with open(options["baseline"], encoding="utf-8") as f:
+                baseline = json.load(f)
+
+        self.cleanup()
+        self.seed(options)
+        try:
+            if options["processes"] > 1:
+                samples, elapsed = self.run_processes(options)
+            else:
+                samples, elapsed = self.run_process(options, mix, 0)
+        finally:
+            if not options["keep"]:
+                self.cleanup()
+
+        results = {
+            "meta": {
+                "created_at": timezone.now().isoformat(),
+                "vendor": connection.vendor,
+                "async_views": settings.ASYNC_VIEWS,
+                "vote_mode": settings.POLLS_VOTE_MODE,
+                **{
+                    key: options[key]
+                    for key in (
+                        "questions",
+                        "choices",
+                        "users",
+                        "contacts",
+                        "threads",
+                        "processes",
+                        "iterations",
+                        "mix",
+                        "seed",
+                    )
+                },
+            },
+            "endpoints": self.summarize(samples, elapsed),
+        }
+        self.report(results["endpoints"])
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+        if baseline is not None:
+            self.compare(baseline, results, options["tolerance"])
+
+    def cleanup(self):
+        Question.objects.filter(question_text__startswith=QUESTION_PREFIX).delete()
+        Contact.objects.filter(email__endswith=f"@{EMAIL_DOMAIN}").delete()
+        ClientUser.objects.filter(email__endswith=f"@{EMAIL_DOMAIN}").delete()
+
+    def seed(self, options):
+        # The indexes stay: the tables may not be the benchmark's alone.
+        plan = SeedPlan(
+            questions=options["questions"],
+            choices=options["choices"],
+            users=options["users"],
+            contacts=options["contacts"],
+            password=PASSWORD,
+            random_seed=options["seed"],
+            question_prefix=QUESTION_PREFIX,
+            email_domain=EMAIL_DOMAIN,
+        )
+        seed(plan, drop_indexes=False)
+
+    def run_processes(self, options):
+        processes = [
+            subprocess.Popen(
+                [
+                    sys.executable,
+                    "-m",
+                    "django",
+                    "bench",
+                    f"--worker={index}",
+                    *(
+                        f"--{key}={options[key]}"
+                        for key in ("threads", "iterations", "mix", "seed")
+                    ),
+                ],
+                cwd=settings.BASE_DIR,
+                env={**os.environ, "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE},
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+            for index in range(options["processes"])
+        ]
+        samples = defaultdict(lambda: defaultdict(list))
+        elapsed = 0.0
+        for index, process in enumerate(processes):
+            stdout, stderr = process.communicate()
+            if process.returncode:
+                raise CommandError(f"Worker process {index} failed:\n{stderr}")
+            output = json.loads(stdout.strip().splitlines()[-1])
+            # The processes ran side by side, the slowest one took the longest.
+            elapsed = max(elapsed, output["elapsed"])
+            for endpoint, measures in output["samples"].items():
+                for measure, values in measures.items():
+                    samples[endpoint][measure] += values
+        return samples, elapsed
+
+    def run_process(self, options, mix, process_index):
+        """Run the threads of one process, return (samples, elapsed seconds).
+
+        Samples map each endpoint to its lists of latencies ("ms"), query
+        counts ("queries"), DB times ("db_ms") and error statuses ("errors").
+        """
+        # Lets the test clients through ALLOWED_HOSTS and keeps mail local
+        setup_test_environment()
+        questions = list(
+            Question.objects.filter(question_text__startswith=QUESTION_PREFIX)
+            .prefetch_related("choice_set")
+            .order_by("pk")
+        )
+        users = list(
+            ClientUser.objects.filter(email__endswith=f"@{EMAIL_DOMAIN}").order_by("pk")
+        )
+        if not questions or not users:
+            raise CommandError("Nothing seeded: needs --questions and --users.")
+
+        samples = defaultdict(lambda: defaultdict(list))
+        lock = threading.Lock()
+        errors = []
+        threads = [
+            threading.Thread(
+                target=self.simulate,
+                args=(
+                    random.Random(f"{options['seed']}-{process_index}-{index}"),
+                    questions,
+                    users,
+                    mix,
+                    options["iterations"],
+                    samples,
+                    lock,
+                    errors,
+                ),
+            )
+            for index in range(options["threads"])
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        if errors:
+            raise CommandError(f"{len(errors)} worker(s) failed: {errors[0]!r}")
+        return samples, elapsed
+
+    def simulate(self, rng, questions, users, mix, iterations, samples, lock, errors):
+        recorder = QueryRecorder()
+        recorder.install()
+        try:
+            client = Client()
+            user = rng.choice(users)
+            client.force_login(user, backend=BACKEND)
+            token, _ = issue_token(user)
+            flows = rng.choices(list(mix), weights=list(mix.values()), k=iterations)
+
+            def request(endpoint, method, url, data=None, **extra):
+                count, db_ms = recorder.count, recorder.time_ms
+                start = time.perf_counter()
+                response = getattr(client, method)(url, data, **extra)
+                ms = (time.perf_counter() - start) * 1000
+                with lock:
+                    measures = samples[endpoint]
+                    measures["ms"].append(ms)
+                    measures["queries"].append(recorder.count - count)
+                    measures["db_ms"].append(recorder.time_ms - db_ms)
+                    if response.status_code >= 400:
+                        measures["errors"].append(response.status_code)
+                return response
+
+            for flow in flows:
+                if flow == "poll":
+                    question = rng.choice(questions)
+                    choices = question.choice_set.all()
+                    request("index", "get", reverse("polls:index"))
+                    request(
+                        "detail", "get", reverse("polls:detail", args=(question.pk,))
+                    )
+                    if choices:
+                        request(
+                            "vote",
+                            "post",
+                            reverse("polls:vote", args=(question.pk,)),
+                            {"choice": rng.choice(choices).pk},
+                        )
+                    request(
+                        "results", "get", reverse("polls:results", args=(question.pk,))
+                    )
+                elif flow == "login":
+                    request("logout", "get", reverse("clients:logout"))
+                    request(
+                        "login",
+                        "post",
+                        reverse("clients:login"),
+                        {"email": rng.choice(users).email, "password": PASSWORD},
+                    )
+                elif flow == "signup":
+                    request("logout", "get", reverse("clients:logout"))
+                    request("signup_form", "get", reverse("clients:signup"))
+                    request(
+                        "signup",
+                        "post",
+                        reverse("clients:signup"),
+                        {
+                            "email": f"signup-{uuid.uuid4().hex}@{EMAIL_DOMAIN}",
+                            "name": "Signup",
+                            "password": PASSWORD,
+                        },
+                    )
+                else:
+                    request(
+                        "contact",
+                        "post",
+                        reverse("polls:apiContactForm"),
+                        {
+                            "name": "Bench",
+                            "email": f"api@{EMAIL_DOMAIN}",
+                            "message": "Posted by the benchmark.",
+                        },
+                        HTTP_AUTHORIZATION=f"Bearer {token}",
+                    )
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            errors.append(exc)
+        finally:
+            recorder.uninstall()
+            connection.close()
+
+    def summarize(self, samples, elapsed):
+        everything = defaultdict(list)
+        for measures in samples.values():
+            for measure, values in measures.items():
+                everything[measure] += values
+        results = {}
+        for endpoint, measures in [*sorted(samples.items()), ("all", everything)]:
+            results[endpoint] = {
+                **summarize(measures["ms"], elapsed),
+                "errors": len(measures["errors"]),
+                "queries_per_request": fmean(measures["queries"]),
+                "db_ms_per_request": fmean(measures["db_ms"]),
+            }
+        return results
+
+    def report(self, endpoints):
+        columns = ("req/s", "p50 ms", "p95 ms", "p99 ms", "queries", "db ms", "errors")
+        self.stdout.write(f"{'endpoint':<14}" + "".join(f"{c:>10}" for c in columns))
+        for endpoint, result in endpoints.items():
+            self.stdout.write(
+                f"{endpoint:<14}"
+                f"{result['throughput']:>10.0f}"
+                f"{result['p50_ms']:>10.2f}"
+                f"{result['p95_ms']:>10.2f}"
+                f"{result['p99_ms']:>10.2f}"
+                f"{result['queries_per_request']:>10.1f}"
+                f"{result['db_ms_per_request']:>10.2f}"
+                f"{result['errors']:>10}"
+            )
+
+    def compare(self, baseline, results, tolerance):
+        changed = [
+            key
+            for key, value in baseline["meta"].items()
+            if key != "created_at" and results["meta"].get(key) != value
+        ]
+        if changed:
+            self.stderr.write(
+                "The baseline was run with different "
+                f"{', '.join(changed)}, the comparison may not hold."
+            )
+        regressions = compare(baseline["endpoints"], results["endpoints"], tolerance)
+        if not regressions:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"No regression against the baseline of "
+                    f"{baseline['meta']['created_at']}."
+                )
+            )
+            return
+        for endpoint, metric, old, new in regressions:
+            self.stdout.write(
+                self.style.ERROR(f"{endpoint} {metric}: {old:.2f} -> {new:.2f}")
+            )
+        raise CommandError(
+            f"{len(regressions)} metric(s) regressed by more than {tolerance:.0%}."
+        )
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import setup_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from clients.models import ClientUser
+from polls.benchmarks import summarize
+from polls.models import Contact, Question
+
+BACKEND = "clients.auth_backends.ClientUserBackend"
+
+BENCH_EMAIL = "bench-asgi@example.com"
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the same polls workload through the WSGI handler with the sync "
+        "views and through the ASGI handler with the async views, side by side."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--users", type=int, default=8, help="Concurrent simulated users."
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=25,
+            help="Index, detail, vote, results and contact rounds per user.",
+        )
+        parser.add_argument(
+            "--handler",
+            choices=["wsgi", "asgi"],
+            help="Only run one handler and print its results as JSON.",
+        )
+
+    def handle(self, *args, **options):
+        if options["handler"]:
+            results = self.run_handler(
+                options["handler"], options["users"], options["iterations"]
+            )
+            self.stdout.write(json.dumps(results))
+            return
+
+        # ASYNC_VIEWS is read when the URLconf is imported, so each handler
+        # gets a fresh process.
+        results = {}
+        for handler in ("wsgi", "asgi"):
+            process = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "django",
+                    "bench_asgi",
+                    f"--handler={handler}",
+                    f"--users={options['users']}",
+                    f"--iterations={options['iterations']}",
+                ],
+                cwd=settings.BASE_DIR,
+                env={
+                    **os.environ,
+                    "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE,
+                    "ASYNC_VIEWS": str(handler == "asgi"),
+                },
+                capture_output=True,
+                text=True,
+                check=False,
+            )
+            if process.returncode:
+                raise CommandError(f"{handler} run failed:\n{process.stderr}")
+            results[handler] = json.loads(process.stdout.strip().splitlines()[-1])
+
+        self.stdout.write(
+            f"{'endpoint':<10}{'':>4}"
+            + "".join(
+                f"{handler + ' ' + column:>16}"
+                for handler in results
+                for column in ("req/s", "p50 ms", "p99 ms")
+            )
+        )
+        for endpoint in results["wsgi"]:
+            self.stdout.write(
+                f"{endpoint:<14}"
+                + "".join(
+                    f"{results[handler][endpoint]['throughput']:>16.0f}"
+                    f"{results[handler][endpoint]['p50_ms']:>16.2f}"
+                    f"{results[handler][endpoint]['p99_ms']:>16.2f}"
+                    for handler in results
+                )
+            )
+
+    def run_handler(self, handler, users, iterations):
+        # Lets the test clients through ALLOWED_HOSTS and keeps mail local
+        setup_test_environment()
+        user = ClientUser.objects.filter(email=BENCH_EMAIL).first()
+        if user is None:
+            user = ClientUser.objects.create_user(
+                email=BENCH_EMAIL, password=None, name="Benchmark"
+            )
+        question = Question.objects.create(
+            question_text="ASGI benchmark", pub_date=timezone.now()
+        )
+        choice = question.choice_set.create(choice_text="Yes")
+        question.choice_set.create(choice_text="No")
+
+        steps = [
+            ("index", "get", reverse("polls:index"), None),
+            ("detail", "get", reverse("polls:detail", args=(question.pk,)), None),
+            (
+                "vote",
+                "post",
+                reverse("polls:vote", args=(question.pk,)),
+                {"choice": choice.pk},
+            ),
+            ("results", "get", reverse("polls:results", args=(question.pk,)), None),
+            (
+                "contact",
+                "post",
+                reverse("polls:apiContactForm"),
+                {"name": "Bench", "email": BENCH_EMAIL, "message": "bench"},
+            ),
+        ]
+        timings = defaultdict(list)
+        try:
+            if handler == "wsgi":
+                elapsed = self.run_wsgi(user, steps, users, iterations, timings)
+            else:
+                elapsed = asyncio.run(
+                    self.run_asgi(user, steps, users, iterations, timings)
+                )
+        finally:
+            question.delete()
+            Contact.objects.filter(email=BENCH_EMAIL).delete()
+
+        results = {
+            endpoint: summarize(samples, elapsed)
+            for endpoint, samples in timings.items()
+        }
+        results["all"] = summarize(
+            [sample for samples in timings.values() for sample in samples], elapsed
+        )
+        return results
+
+    def run_wsgi(self, user, steps, users, iterations, timings):
+        errors = []
+
+        def simulate():
+            try:
+                client = Client()
+                client.force_login(user, backend=BACKEND)
+                for _ in range(iterations):
+                    for endpoint, method, url, data in steps:
+                        start = time.perf_counter()
+                        response = getattr(client, method)(url, data)
+                        timings[endpoint].append((time.perf_counter() - start) * 1000)
+                        if response.status_code >= 400:
+                            raise CommandError(f"{endpoint}: {response.status_code}")
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=simulate) for _ in range(users)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return time.perf_counter() - start
+
+    async def run_asgi(self, user, steps, users, iterations, timings):
+        async def simulate():
+            client = AsyncClient()
+            await client.aforce_login(user, backend=BACKEND)
+            for _ in range(iterations):
+                for endpoint, method, url, data in steps:
+                    start = time.perf_counter()
+                    response = await getattr(client, method)(url, data)
+                    timings[endpoint].append((time.perf_counter() - start) * 1000)
+                    if response.status_code >= 400:
+                        raise CommandError(f"{endpoint}: {response.status_code}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(simulate() for _ in range(users)))
+        return time.perf_counter() - start
@@ -0,0 +1,105 @@
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.utils import timezone
+
+from polls.counters import fold_vote_shards
+from polls.models import Question
+from polls.vote_buffer import get_vote_buffer
+from polls.views import vote
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure vote throughput on a single hot choice as concurrent writers "
+        "are added, for each vote mode."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--writers",
+            default="1,2,4,8,16",
+            help="Comma-separated numbers of concurrent writers to try.",
+        )
+        parser.add_argument(
+            "--votes", type=int, default=500, help="Votes cast by each writer."
+        )
+        parser.add_argument(
+            "--modes",
+            default="direct,sharded,buffered",
+            help="Comma-separated vote modes to compare.",
+        )
+
+    def handle(self, *args, **options):
+        writer_counts = [int(n) for n in options["writers"].split(",")]
+        modes = options["modes"].split(",")
+
+        question = Question.objects.create(
+            question_text="Vote benchmark", pub_date=timezone.now()
+        )
+        choice = question.choice_set.create(choice_text="Hot choice")
+        try:
+            self.stdout.write(
+                f"{'writers':>8}"
+                + "".join(f"{mode + ' votes/s':>20}" for mode in modes)
+            )
+            for writers in writer_counts:
+                rates = []
+                for mode in modes:
+                    with override_settings(POLLS_VOTE_MODE=mode):
+                        elapsed = self.run(
+                            question.pk, choice.pk, writers, options["votes"]
+                        )
+                    rates.append(writers * options["votes"] / elapsed)
+                self.stdout.write(
+                    f"{writers:>8}" + "".join(f"{rate:>20.0f}" for rate in rates)
+                )
+
+            get_vote_buffer().flush()
+            fold_vote_shards(question_id=question.pk)
+            choice.refresh_from_db()
+            expected = sum(writer_counts) * options["votes"] * len(modes)
+            if choice.votes != expected:
+                raise CommandError(f"Lost votes: counted {choice.votes} of {expected}")
+        finally:
+            question.delete()
+
+    def run(self, question_id, choice_id, writers, votes):
+        """Return the seconds it took `writers` threads to cast their votes."""
+        factory = RequestFactory()
+        barrier = threading.Barrier(writers + 1)
+        errors = []
+
+        def writer():
+            try:
+                # Connect up front so connection setup is not timed.
+                connection.ensure_connection()
+                barrier.wait()
+                for _ in range(votes):
+                    request = factory.post("/", {"choice": choice_id})
+                    if vote(request, question_id).status_code != 302:
+                        raise CommandError("Vote was rejected")
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                errors.append(exc)
+                barrier.abort()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer) for _ in range(writers)]
+        for thread in threads:
+            thread.start()
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            pass
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        if errors:
+            raise CommandError(f"{len(errors)} writer(s) failed: {errors[0]!r}")
+        return elapsed
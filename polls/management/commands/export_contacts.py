@@ -0,0 +1,43 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from polls.export import FORMATS, export_queryset, parse_bound, stream
+
+
+class Command(BaseCommand):
+    help = "Stream every contact to a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=sorted(FORMATS), default="csv")
+        parser.add_argument(
+            "--gzip", action="store_true", help="Compress the output with gzip."
+        )
+        parser.add_argument(
+            "--since", help="Only contacts submitted at or after this date."
+        )
+        parser.add_argument(
+            "--until", help="Only contacts submitted up to this date, inclusive."
+        )
+        parser.add_argument(
+            "--output", default="-", help="File to write to (default: stdout)."
+        )
+
+    def handle(self, *args, **options):
+        try:
+            queryset = export_queryset(
+                since=parse_bound(options["since"]),
+                until=parse_bound(options["until"], end=True),
+            )
+        except ValueError as e:
+            raise CommandError(e) from e
+
+        chunks = stream(queryset, options["format"], compress=options["gzip"])
+        if options["output"] == "-":
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+        with open(options["output"], "wb") as output:
+            for chunk in chunks:
+                output.write(chunk)
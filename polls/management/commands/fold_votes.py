@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from polls.counters import fold_vote_shards
+
+
+class Command(BaseCommand):
+    help = "Fold the sharded vote counters back into Choice.votes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--question", type=int, help="Only fold the votes of this question."
+        )
+
+    def handle(self, *args, **options):
+        folded = fold_vote_shards(question_id=options["question"])
+        self.stdout.write(self.style.SUCCESS(f"Folded {folded} vote(s)."))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from polls.blobs import GC_GRACE_PERIOD, collect_garbage
+from polls.uploads import UPLOAD_EXPIRY, expire_uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete stored contact files that no contact refers to anymore, and "
+        "abandoned chunked uploads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-period",
+            type=int,
+            default=GC_GRACE_PERIOD,
+            help="Keep files written or referenced less than this many seconds ago.",
+        )
+        parser.add_argument(
+            "--upload-expiry",
+            type=int,
+            default=UPLOAD_EXPIRY,
+            help="Delete chunked uploads untouched for this many seconds.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list the files that would be deleted.",
+        )
+
+    def handle(self, *args, **options):
+        # First, so the blobs of expired complete uploads can be collected.
+        uploads = expire_uploads(
+            max_age=options["upload_expiry"], dry_run=options["dry_run"]
+        )
+        deleted = collect_garbage(
+            grace_period=options["grace_period"], dry_run=options["dry_run"]
+        )
+        for name in deleted:
+            self.stdout.write(name)
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb} {len(deleted)} file(s) and {uploads} expired upload(s)."
+            )
+        )
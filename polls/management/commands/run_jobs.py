@@ -0,0 +1,67 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from polls.jobs import setup_worker, work
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Number of worker processes (default: one per CPU).",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait before looking for new jobs when idle.",
+        )
+        parser.add_argument(
+            "--until-idle",
+            action="store_true",
+            help="Exit once no job is ready instead of waiting for more.",
+        )
+
+    def handle(self, *args, **options):
+        work_options = (options["poll_interval"], options["until_idle"])
+        # Forked workers must not share this process's connections.
+        connections.close_all()
+        with ProcessPoolExecutor(
+            max_workers=options["processes"], initializer=setup_worker
+        ) as pool:
+            workers = {
+                pool.submit(work, *work_options) for _ in range(options["processes"])
+            }
+            done = 0
+            try:
+                while workers:
+                    finished, workers = wait(workers, return_when=FIRST_COMPLETED)
+                    for worker in finished:
+                        done += self.result(worker)
+                        if worker.exception() is not None:
+                            time.sleep(options["poll_interval"])
+                            workers.add(pool.submit(work, *work_options))
+            except KeyboardInterrupt:
+                # The workers got the interrupt as well and stop on their own.
+                done += sum(self.result(worker) for worker in workers)
+        self.stdout.write(self.style.SUCCESS(f"Ran {done} job(s)."))
+
+    def result(self, worker):
+        """Return how many jobs the worker ran, 0 if it stopped on an error."""
+        try:
+            return worker.result()
+        except BrokenProcessPool as e:
+            # A process was killed, the pool shut the others down with it.
+            raise CommandError("A worker process died, stopping.") from e
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            self.stderr.write(f"A worker failed: {e!r}")
+            return 0
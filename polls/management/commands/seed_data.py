@@ -0,0 +1,107 @@
+import argparse
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from polls.seeding import BATCH_SIZE, SeedPlan, seed
+
+
+def parse_date(value):
+    try:
+        return timezone.make_aware(datetime.strptime(value, "%Y-%m-%d"))
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(
+            f"Expected a YYYY-MM-DD date, got {value!r}."
+        ) from e
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk load synthetic questions, choices, client users and contacts, "
+        "with COPY on PostgreSQL and batched inserts elsewhere."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--questions", type=int, default=0)
+        parser.add_argument(
+            "--choices", type=int, default=4, help="Choices per question."
+        )
+        parser.add_argument("--users", type=int, default=0, help="Client users.")
+        parser.add_argument("--contacts", type=int, default=0)
+        parser.add_argument(
+            "--start",
+            type=parse_date,
+            help="Earliest date (YYYY-MM-DD) to spread rows over, a year ago "
+            "by default.",
+        )
+        parser.add_argument(
+            "--end", type=parse_date, help="Latest date (YYYY-MM-DD), now by default."
+        )
+        parser.add_argument(
+            "--max-votes", type=int, default=1000, help="Most votes a choice gets."
+        )
+        parser.add_argument(
+            "--vote-skew",
+            type=float,
+            default=3.0,
+            help="1 spreads votes evenly, higher values give most choices few "
+            "votes and a handful many.",
+        )
+        parser.add_argument(
+            "--password",
+            default="password",
+            help="Password of every synthetic user, hashed once.",
+        )
+        parser.add_argument("--seed", type=int, help="Random seed.")
+        parser.add_argument(
+            "--email-domain",
+            default="seed.invalid",
+            help="Domain of the synthetic email addresses.",
+        )
+        parser.add_argument(
+            "--keep-indexes",
+            action="store_true",
+            help="Do not drop the secondary indexes during the load.",
+        )
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        if options["start"] and options["end"] and options["start"] > options["end"]:
+            raise CommandError("--start is after --end.")
+
+        def progress(model, count, seconds):
+            rate = count / seconds if seconds else 0
+            self.stdout.write(
+                f"{model}: {count} row(s) in {seconds:.1f}s ({rate:.0f}/s)"
+            )
+
+        started = time.perf_counter()
+        plan = SeedPlan(
+            questions=options["questions"],
+            choices=options["choices"],
+            users=options["users"],
+            contacts=options["contacts"],
+            start=options["start"],
+            end=options["end"],
+            max_votes=options["max_votes"],
+            vote_skew=options["vote_skew"],
+            password=options["password"],
+            random_seed=options["seed"],
+            email_domain=options["email_domain"],
+        )
+        counts = seed(
+            plan,
+            drop_indexes=not options["keep_indexes"],
+            using=options["database"],
+            batch_size=options["batch_size"],
+            progress=progress,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Loaded {sum(counts.values())} row(s) in "
+                f"{time.perf_counter() - started:.1f}s, indexes included."
+            )
+        )
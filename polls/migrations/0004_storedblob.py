@@ -0,0 +1,40 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:44
+
+import polls.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0003_choicevoteshard"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StoredBlob",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name", models.CharField(max_length=100, unique=True)),
+                ("ref_count", models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name="contact",
+            name="file",
+            field=models.FileField(
+                blank=True,
+                null=True,
+                storage=polls.storage.ContentAddressedStorage(),
+                upload_to="uploads/",
+            ),
+        ),
+    ]
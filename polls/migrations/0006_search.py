@@ -0,0 +1,26 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:50
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+import mysite.search
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0005_job"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="contact",
+            index=models.Index(
+                django.db.models.functions.text.Upper("email"),
+                name="polls_contact_email_upper",
+            ),
+        ),
+        mysite.search.CreateSearchIndex(
+            model_name="contact", fields=["name", "email", "message"]
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 16:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0006_search"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="contact",
+            index=models.Index(
+                fields=["submitted_at", "id"], name="polls_contact_submitted"
+            ),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.4 on 2026-10-18 17:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("clients", "0004_clientuser_search_rebuild"),
+        ("polls", "0009_contact_search_rebuild"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="contact",
+            name="submitted_by",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="contacts",
+                to="clients.clientuser",
+            ),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 19:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("polls", "0010_contact_submitted_by"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="question",
+            index=models.Index(
+                fields=["pub_date", "id"], name="polls_question_published"
+            ),
+        ),
+    ]
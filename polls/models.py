@@ -1,9 +1,14 @@
 import datetime
+import uuid
 
 from django.db import models
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce, Upper
 from django.utils import timezone
 from django.contrib import admin
 
+from .storage import ContentAddressedStorage
+
 
 class Question(models.Model):
     def __str__(self):
@@ -21,6 +26,21 @@ class Question(models.Model):
     question_text = models.CharField(max_length=200)
     pub_date = models.DateTimeField("date published")
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of the questions API, see polls.api.
+            models.Index(fields=["pub_date", "id"], name="polls_question_published"),
+        ]
+
+
+class ChoiceQuerySet(models.QuerySet):
+    def with_vote_totals(self):
+        # Votes recorded in sharded mode live in ChoiceVoteShard rows until
+        # they are folded back into Choice.votes, so reads add both up.
+        return self.annotate(
+            total_votes=F("votes") + Coalesce(Sum("vote_shards__votes"), 0)
+        )
+
 
 class Choice(models.Model):
     def __str__(self):
@@ -30,13 +50,129 @@ class Choice(models.Model):
     choice_text = models.CharField(max_length=200)
     votes = models.IntegerField(default=0)
 
+    objects = ChoiceQuerySet.as_manager()
+
+
+class ChoiceVoteShard(models.Model):
+    """One of the counter slots a choice's votes are spread over."""
+
+    choice = models.ForeignKey(
+        Choice, on_delete=models.CASCADE, related_name="vote_shards"
+    )
+    slot = models.PositiveSmallIntegerField()
+    votes = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["choice", "slot"], name="unique_choice_vote_shard"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.choice} #{self.slot}"
+
 
 class Contact(models.Model):
     name = models.CharField(max_length=100)
     email = models.EmailField()
     message = models.TextField()
-    file = models.FileField(upload_to="uploads/", null=True, blank=True)
+    file = models.FileField(
+        upload_to="uploads/",
+        storage=ContentAddressedStorage(),
+        null=True,
+        blank=True,
+    )
     submitted_at = models.DateTimeField(auto_now_add=True)
+    # The API client that sent it, the only one to see its status.
+    submitted_by = models.ForeignKey(
+        "clients.ClientUser",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="contacts",
+    )
+    # Filled in by the jobs of polls.tasks after the contact is saved.
+    file_sha256 = models.CharField(max_length=64, blank=True)
+    thumbnail = models.FileField(upload_to="thumbnails/", null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # For the admin's exact email lookups, which compare upper case.
+            models.Index(Upper("email"), name="polls_contact_email_upper"),
+            # Keyset pagination of the admin changelist, see mysite.pagination.
+            models.Index(fields=["submitted_at", "id"], name="polls_contact_submitted"),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.email})"
+
+
+class StoredBlob(models.Model):
+    """How many Contact rows point at a file of ContentAddressedStorage."""
+
+    name = models.CharField(max_length=100, unique=True)
+    ref_count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count})"
+
+
+class Job(models.Model):
+    """A unit of background work, run by `manage.py run_jobs`."""
+
+    class Status(models.TextChoices):
+        QUEUED = "queued"
+        RUNNING = "running"
+        DONE = "done"
+        FAILED = "failed"
+
+    task = models.CharField(max_length=50)
+    contact = models.ForeignKey(
+        Contact, on_delete=models.CASCADE, null=True, related_name="jobs"
+    )
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.QUEUED
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"], name="polls_job_ready"),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.status})"
+
+
+class ChunkedUpload(models.Model):
+    """An attachment sent in chunks to api/contact/uploads/, see polls.uploads."""
+
+    class Status(models.TextChoices):
+        UPLOADING = "uploading"
+        COMPLETE = "complete"
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        "clients.ClientUser", on_delete=models.CASCADE, related_name="uploads"
+    )
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    # Bytes received so far, the next chunk starts there.
+    offset = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(
+        max_length=10, choices=Status.choices, default=Status.UPLOADING
+    )
+    # The blob the file went to once complete.
+    file = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size}, {self.status})"
@@ -0,0 +1,85 @@
+"""Version counters behind the cached index and detail pages.
+
+Cached fragments and objects are keyed on these versions, so bumping a
+counter from the model signals retires everything built from older data
+without having to find and delete it.
+"""
+
+from django.core.cache import cache
+
+from mysite.versions import aget_version, bump_version, get_version
+
+from .models import Question
+
+PAGE_CACHE_TIMEOUT = 10 * 60
+
+INDEX_VERSION_KEY = "polls:index:version"
+
+
+def question_version_key(question_id):
+    return f"polls:question:version:{question_id}"
+
+
+def index_version():
+    return get_version(INDEX_VERSION_KEY)
+
+
+def question_version(question_id):
+    return get_version(question_version_key(question_id))
+
+
+def invalidate_index():
+    bump_version(INDEX_VERSION_KEY)
+
+
+def invalidate_question(question_id):
+    bump_version(question_version_key(question_id))
+
+
+def _question_key(question_id, version):
+    return f"polls:question:{question_id}:{version}"
+
+
+def _questions():
+    # The choices come along so rendering the detail page needs no query,
+    # which also keeps it safe to render from an async view.
+    return Question.objects.prefetch_related("choice_set")
+
+
+def get_question(question_id):
+    """Return the question, from the cache when its version is current."""
+    key = _question_key(question_id, question_version(question_id))
+    question = cache.get(key)
+    if question is None:
+        question = _questions().filter(pk=question_id).first()
+        if question is not None:
+            cache.set(key, question, PAGE_CACHE_TIMEOUT)
+    return question
+
+
+async def aindex_version():
+    return await aget_version(INDEX_VERSION_KEY)
+
+
+async def aquestion_version(question_id):
+    return await aget_version(question_version_key(question_id))
+
+
+async def aget_question(question_id):
+    key = _question_key(question_id, await aquestion_version(question_id))
+    question = await cache.aget(key)
+    if question is None:
+        question = await _questions().filter(pk=question_id).afirst()
+        if question is not None:
+            await cache.aset(key, question, PAGE_CACHE_TIMEOUT)
+    return question
+
+
+async def alatest_questions(version):
+    """Return the questions listed on the index page at `version`."""
+    key = f"polls:index:{version}"
+    questions = await cache.aget(key)
+    if questions is None:
+        questions = [q async for q in Question.objects.order_by("-pub_date")[:5]]
+        await cache.aset(key, questions, PAGE_CACHE_TIMEOUT)
+    return questions
@@ -0,0 +1,344 @@
+"""Bulk loading of synthetic questions, choices, client users and contacts.
+
+Rows are generated as tuples and streamed to the database without going
+through model instances: with COPY FROM STDIN on PostgreSQL, and batched
+executemany() elsewhere. Ids are assigned up front, from the largest one in
+each table, so choices can refer to their questions without reading them
+back; the sequences are reset afterwards.
+
+The whole load is one transaction. The secondary indexes of the tables
+loaded are dropped first and rebuilt at the end, which is far cheaper than
+maintaining them row by row; indexes backing a constraint (primary keys,
+unique emails) are kept. Model signals do not fire, the caches they would
+invalidate are invalidated once the load committed.
+"""
+
+import random
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.db.models import DateTimeField, Max
+from django.utils import timezone
+
+from clients.models import ClientUser
+
+from . import api, page_cache
+from .models import Choice, Contact, Question
+
+BATCH_SIZE = 10_000
+
+# Characters that COPY's text format needs escaped.
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    return str(value).translate(_COPY_ESCAPES)
+
+
+class _CopyStream:
+    """File-like object COPY FROM STDIN reads rows from, in text format."""
+
+    def __init__(self, rows):
+        self._lines = (
+            "\t".join(_copy_value(value) for value in row) + "\n" for row in rows
+        )
+        self._rest = ""
+
+    def read(self, size=-1):
+        parts, length = [self._rest], len(self._rest)
+        while size < 0 or length < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            parts.append(line)
+            length += len(line)
+        data = "".join(parts)
+        if size < 0:
+            self._rest = ""
+            return data
+        self._rest = data[size:]
+        return data[:size]
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Seeder:
+    """Streams rows into the tables of models on one database."""
+
+    def __init__(self, using="default", batch_size=BATCH_SIZE):
+        self.connection = connections[using]
+        self.using = using
+        self.batch_size = batch_size
+
+    def next_id(self, model):
+        return (model.objects.using(self.using).aggregate(id=Max("pk"))["id"] or 0) + 1
+
+    def load(self, model, field_names, rows):
+        """Insert rows, tuples of the values of `field_names`, in the model's table.
+
+        Returns the number of rows inserted.
+        """
+        fields = [model._meta.get_field(name) for name in field_names]
+        count = 0
+
+        def counted():
+            nonlocal count
+            for row in rows:
+                count += 1
+                yield row
+
+        quote = self.connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        columns = ", ".join(quote(field.column) for field in fields)
+        prepared = self._adapted(fields, counted())
+        if self.connection.vendor == "postgresql":
+            self._copy(table, columns, prepared)
+        else:
+            self._insert(table, columns, len(fields), prepared)
+        return count
+
+    def _adapted(self, fields, rows):
+        # Datetimes are the only values generated that the backends need
+        # adapted (to text on SQLite). They are aware already, which skips
+        # the field's own checks.
+        adapt = self.connection.ops.adapt_datetimefield_value
+        datetimes = [
+            index
+            for index, field in enumerate(fields)
+            if isinstance(field, DateTimeField)
+        ]
+        for row in rows:
+            if datetimes:
+                row = list(row)
+                for index in datetimes:
+                    row[index] = adapt(row[index])
+            yield row
+
+    def _copy(self, table, columns, rows):
+        with self.connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {table} ({columns}) FROM STDIN",
+                _CopyStream(rows),
+                size=1024 * 1024,
+            )
+
+    def _insert(self, table, columns, width, rows):
+        placeholders = ", ".join(["%s"] * width)
+        sql = f"INSERT INTO {table} ({columns}) VALUES ({placeholders})"
+        with self.connection.cursor() as cursor:
+            for batch in _batches(rows, self.batch_size):
+                cursor.executemany(sql, batch)
+
+    def secondary_indexes(self, model):
+        """Return (name, definition) of the indexes no constraint relies on."""
+        table = model._meta.db_table
+        with self.connection.cursor() as cursor:
+            if self.connection.vendor == "postgresql":
+                cursor.execute(
+                    "SELECT indexname, indexdef FROM pg_indexes "
+                    "WHERE schemaname = current_schema() AND tablename = %s "
+                    "AND indexname NOT IN "
+                    "(SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass)",
+                    [table, table],
+                )
+            elif self.connection.vendor == "sqlite":
+                # Indexes SQLite creates for constraints have no SQL.
+                cursor.execute(
+                    "SELECT name, sql FROM sqlite_master "
+                    "WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL",
+                    [table],
+                )
+            else:
+                return []
+            return cursor.fetchall()
+
+    def drop_indexes(self, models):
+        """Drop the secondary indexes of the models' tables, return them."""
+        indexes = [index for model in models for index in self.secondary_indexes(model)]
+        with self.connection.cursor() as cursor:
+            for name, _ in indexes:
+                cursor.execute(f"DROP INDEX {self.connection.ops.quote_name(name)}")
+        return indexes
+
+    def create_indexes(self, indexes):
+        with self.connection.cursor() as cursor:
+            for _, definition in indexes:
+                cursor.execute(definition)
+
+    def finish(self, models):
+        """Reset the id sequences and refresh the planner statistics."""
+        statements = self.connection.ops.sequence_reset_sql(no_style(), models)
+        with self.connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+            for model in models:
+                table = self.connection.ops.quote_name(model._meta.db_table)
+                cursor.execute(f"ANALYZE {table}")
+
+
+@dataclass(frozen=True)
+class SeedPlan:  # pylint: disable=too-many-instance-attributes
+    """What seed() loads: how many rows of each kind, and what they hold.
+
+    Questions, users and contacts get dates spread evenly between `start`
+    and `end` (the past year by default). Choice votes are skewed towards
+    0, see choice_rows().
+    """
+
+    questions: int = 0
+    choices: int = 4
+    users: int = 0
+    contacts: int = 0
+    start: datetime | None = None
+    end: datetime | None = None
+    max_votes: int = 1000
+    vote_skew: float = 3.0
+    password: str = "password"
+    random_seed: int | None = None
+    question_prefix: str = ""
+    email_domain: str = "seed.invalid"
+
+    def with_period(self):
+        """Return the plan with its default start and end filled in."""
+        end = self.end or timezone.now()
+        return replace(self, start=self.start or end - timedelta(days=365), end=end)
+
+    def moment(self, rng):
+        span = (self.end - self.start).total_seconds()
+        return self.start + timedelta(seconds=rng.random() * span)
+
+
+def question_rows(plan, first_id, rng):
+    for pk in range(first_id, first_id + plan.questions):
+        yield pk, f"{plan.question_prefix}Question {pk}", plan.moment(rng)
+
+
+def choice_rows(plan, first_id, question_ids, rng):
+    """Choices with votes skewed towards 0: most get few, some get many.
+
+    With `vote_skew` 1 the votes are spread evenly up to `max_votes`, the
+    higher it is the fewer choices get a large share.
+    """
+    pk = first_id
+    for question_id in question_ids:
+        for n in range(plan.choices):
+            yield pk, question_id, f"Choice {n + 1}", int(
+                plan.max_votes * rng.random() ** plan.vote_skew
+            )
+            pk += 1
+
+
+def user_rows(plan, first_id, password, rng):
+    for pk in range(first_id, first_id + plan.users):
+        # Everyone shares the same hash, computing millions would take days.
+        yield (
+            pk,
+            password,
+            False,
+            f"user{pk}@{plan.email_domain}",
+            f"User {pk}",
+            True,
+            False,
+            plan.moment(rng),
+        )
+
+
+def contact_rows(plan, first_id, rng):
+    for pk in range(first_id, first_id + plan.contacts):
+        yield (
+            pk,
+            f"Contact {pk}",
+            f"contact{pk}@{plan.email_domain}",
+            f"Seeded message {pk}.",
+            plan.moment(rng),
+            "",
+        )
+
+
+USER_FIELDS = [
+    "id",
+    "password",
+    "is_superuser",
+    "email",
+    "name",
+    "is_active",
+    "is_staff",
+    "date_joined",
+]
+
+
+def _load_rows(seeder, plan, password, progress):
+    """Load the plan's rows with the seeder, return {model name: rows inserted}.
+
+    `password` is the hash every user gets.
+    """
+    rng = random.Random(plan.random_seed)
+    counts = {}
+
+    def load(model, field_names, rows):
+        started = time.perf_counter()
+        counts[model.__name__] = seeder.load(model, field_names, rows)
+        if progress is not None:
+            progress(
+                model.__name__, counts[model.__name__], time.perf_counter() - started
+            )
+
+    first_question = seeder.next_id(Question)
+    load(
+        Question,
+        ["id", "question_text", "pub_date"],
+        question_rows(plan, first_question, rng),
+    )
+    question_ids = range(first_question, first_question + plan.questions)
+    load(
+        Choice,
+        ["id", "question", "choice_text", "votes"],
+        choice_rows(plan, seeder.next_id(Choice), question_ids, rng),
+    )
+    load(
+        ClientUser,
+        USER_FIELDS,
+        user_rows(plan, seeder.next_id(ClientUser), password, rng),
+    )
+    load(
+        Contact,
+        ["id", "name", "email", "message", "submitted_at", "file_sha256"],
+        contact_rows(plan, seeder.next_id(Contact), rng),
+    )
+    return counts
+
+
+def seed(
+    plan, *, drop_indexes=True, using="default", batch_size=BATCH_SIZE, progress=None
+):
+    """Load the rows of a SeedPlan, return {model name: rows inserted}.
+
+    `progress(model name, count, seconds)` is called after each table.
+    """
+    plan = plan.with_period()
+    password = make_password(plan.password)
+    seeder = Seeder(using, batch_size)
+    models = [Question, Choice, ClientUser, Contact]
+    with transaction.atomic(using=using):
+        indexes = seeder.drop_indexes(models) if drop_indexes else []
+        counts = _load_rows(seeder, plan, password, progress)
+        seeder.create_indexes(indexes)
+        seeder.finish(models)
+        transaction.on_commit(page_cache.invalidate_index, using=using)
+        transaction.on_commit(api.invalidate, using=using)
+    return counts
@@ -0,0 +1,53 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from . import api, blobs, page_cache, snapshots
+from .models import Choice, Contact, Question
+
+
+@receiver([post_save, post_delete], sender=Choice)
+def invalidate_choice_results(sender, instance, update_fields=None, **kwargs):
+    # The vote view patches the snapshot itself after its votes-only save,
+    # and the cached pages do not show votes.
+    if update_fields is not None and set(update_fields) == {"votes"}:
+        return
+    transaction.on_commit(lambda: snapshots.invalidate(instance.question_id))
+    transaction.on_commit(lambda: page_cache.invalidate_question(instance.question_id))
+    transaction.on_commit(api.invalidate)
+
+
+@receiver([post_save, post_delete], sender=Question)
+def invalidate_question_results(sender, instance, **kwargs):
+    transaction.on_commit(lambda: snapshots.invalidate(instance.pk))
+    transaction.on_commit(lambda: page_cache.invalidate_question(instance.pk))
+    transaction.on_commit(page_cache.invalidate_index)
+    transaction.on_commit(api.invalidate)
+
+
+@receiver(post_init, sender=Contact)
+def remember_contact_file(sender, instance, **kwargs):
+    # Read the raw value: going through the descriptor would load a
+    # deferred field.
+    instance._stored_file_name = _file_name(instance.__dict__.get("file"))
+
+
+def _file_name(value):
+    return getattr(value, "name", value) or ""
+
+
+@receiver(post_save, sender=Contact)
+def count_contact_file(sender, instance, created, **kwargs):
+    if "file" not in instance.__dict__:
+        return
+    name = _file_name(instance.__dict__["file"])
+    previous = "" if created else instance._stored_file_name
+    if name != previous:
+        blobs.acquire(name)
+        blobs.release(previous)
+        instance._stored_file_name = name
+
+
+@receiver(post_delete, sender=Contact)
+def release_contact_file(sender, instance, **kwargs):
+    blobs.release(instance._stored_file_name)
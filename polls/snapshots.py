@@ -0,0 +1,197 @@
+"""Precomputed per-question results served by ResultsView.
+
+A snapshot is a plain dict stored in the cache under the question's results
+version. Votes bump the version and patch the snapshot in place when it is
+exactly one version behind. When concurrent votes get in the way the
+snapshot is deleted instead, or not stored by the build they raced with,
+so the voters' next read rebuilds it with their votes. Anything else
+(admin edits, a snapshot older than SNAPSHOT_MAX_AGE) marks it stale:
+stale snapshots are still served while a background thread rebuilds them.
+"""
+
+import logging
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import connection
+
+from mysite.versions import abump_version, aget_version, bump_version, get_version
+
+from .counters import achoice_totals, choice_totals
+from .models import Question
+
+logger = logging.getLogger(__name__)
+
+# Seconds after which a snapshot is rebuilt even if its version is current.
+SNAPSHOT_MAX_AGE = 60
+
+SNAPSHOT_TIMEOUT = 24 * 60 * 60
+
+
+def version_key(question_id):
+    return f"polls:results:version:{question_id}"
+
+
+def snapshot_key(question_id):
+    return f"polls:results:snapshot:{question_id}"
+
+
+def _tally(snapshot):
+    total = sum(choice["votes"] for choice in snapshot["choices"])
+    snapshot["total"] = total
+    for choice in snapshot["choices"]:
+        choice["percent"] = round(100 * choice["votes"] / total) if total else 0
+    return snapshot
+
+
+def _new_snapshot(version, question_id, question_text, totals):
+    return _tally(
+        {
+            "version": version,
+            "built_at": time.time(),
+            "question_id": question_id,
+            "question_text": question_text,
+            "choices": [
+                {"id": pk, "text": text, "votes": votes} for pk, text, votes in totals
+            ],
+        }
+    )
+
+
+def _question_text(question_id):
+    return Question.objects.filter(pk=question_id).values_list(
+        "question_text", flat=True
+    )
+
+
+def build_snapshot(question_id):
+    """Compute and store the question's snapshot, None if it does not exist."""
+    version = get_version(version_key(question_id))
+    question_text = _question_text(question_id).first()
+    if question_text is None:
+        return None
+
+    snapshot = _new_snapshot(
+        version, question_id, question_text, choice_totals(question_id)
+    )
+    # A vote that landed while the tally was computed may be missing from
+    # it, and stored it would be served until rebuilt: leave the next read
+    # to build it again instead.
+    if get_version(version_key(question_id)) == version:
+        key = snapshot_key(question_id)
+        cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+        # Or one right before the snapshot was stored, as in record_vote().
+        if get_version(version_key(question_id)) != version:
+            cache.delete(key)
+    return snapshot
+
+
+async def abuild_snapshot(question_id):
+    version = await aget_version(version_key(question_id))
+    question_text = await _question_text(question_id).afirst()
+    if question_text is None:
+        return None
+
+    snapshot = _new_snapshot(
+        version, question_id, question_text, await achoice_totals(question_id)
+    )
+    if await aget_version(version_key(question_id)) == version:
+        key = snapshot_key(question_id)
+        await cache.aset(key, snapshot, SNAPSHOT_TIMEOUT)
+        if await aget_version(version_key(question_id)) != version:
+            await cache.adelete(key)
+    return snapshot
+
+
+def _rebuild_lock(question_id):
+    # Only one rebuild per question at a time, across processes.
+    return f"polls:results:rebuilding:{question_id}"
+
+
+def _rebuild_in_background(question_id):
+    if cache.add(_rebuild_lock(question_id), 1, timeout=30):
+        _start_rebuild(question_id)
+
+
+def _start_rebuild(question_id):
+    lock = _rebuild_lock(question_id)
+
+    def rebuild():
+        try:
+            build_snapshot(question_id)
+        except Exception:  # pylint: disable=broad-exception-caught
+            logger.exception("Rebuilding results of question %s failed", question_id)
+        finally:
+            cache.delete(lock)
+            connection.close()
+
+    threading.Thread(target=rebuild, daemon=True).start()
+
+
+def _is_stale(snapshot, version):
+    return (
+        snapshot["version"] != version
+        or time.time() - snapshot["built_at"] > SNAPSHOT_MAX_AGE
+    )
+
+
+def get_snapshot(question_id):
+    """Return the question's results, None if the question does not exist."""
+    snapshot = cache.get(snapshot_key(question_id))
+    if snapshot is None:
+        return build_snapshot(question_id)
+
+    if _is_stale(snapshot, get_version(version_key(question_id))):
+        _rebuild_in_background(question_id)
+    return snapshot
+
+
+async def aget_snapshot(question_id):
+    snapshot = await cache.aget(snapshot_key(question_id))
+    if snapshot is None:
+        return await abuild_snapshot(question_id)
+
+    if _is_stale(snapshot, await aget_version(version_key(question_id))):
+        if await cache.aadd(_rebuild_lock(question_id), 1, timeout=30):
+            _start_rebuild(question_id)
+    return snapshot
+
+
+def _add_vote(snapshot, version, choice_id):
+    """Return the snapshot with the vote applied, None if it cannot be."""
+    if snapshot is None or snapshot["version"] != version - 1:
+        return None
+    for choice in snapshot["choices"]:
+        if choice["id"] == choice_id:
+            choice["votes"] += 1
+            snapshot["version"] = version
+            return _tally(snapshot)
+    return None
+
+
+def record_vote(question_id, choice_id):
+    """Apply a committed vote to the cached snapshot."""
+    key = snapshot_key(question_id)
+    version = bump_version(version_key(question_id))
+    snapshot = _add_vote(cache.get(key), version, choice_id)
+    if snapshot is not None:
+        cache.set(key, snapshot, SNAPSHOT_TIMEOUT)
+    # Another vote came in between, and the snapshot may lack either one:
+    # served stale, the voter would not see their vote until it is rebuilt.
+    if snapshot is None or get_version(version_key(question_id)) != version:
+        cache.delete(key)
+
+
+async def arecord_vote(question_id, choice_id):
+    key = snapshot_key(question_id)
+    version = await abump_version(version_key(question_id))
+    snapshot = _add_vote(await cache.aget(key), version, choice_id)
+    if snapshot is not None:
+        await cache.aset(key, snapshot, SNAPSHOT_TIMEOUT)
+    if snapshot is None or await aget_version(version_key(question_id)) != version:
+        await cache.adelete(key)
+
+
+def invalidate(question_id):
+    bump_version(version_key(question_id))
@@ -0,0 +1,108 @@
+import hashlib
+import os
+import time
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+BLOB_DIR = "blobs"
+
+# Where uploads are written while their hash is not known yet. It lives in
+# the same file system as the blobs so moving them in is a rename.
+INCOMING_DIR = "blobs/incoming"
+
+# Where chunked uploads are assembled, see polls.uploads.
+PARTIAL_DIR = "blobs/partial"
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage keeping each distinct content once.
+
+    Files are stored as blobs/ab/cd/<sha256><ext>, so saving a file that is
+    already stored writes nothing and returns the existing name. Which
+    blobs are still in use is tracked by polls.blobs.
+    """
+
+    def blob_name(self, digest, original_name):
+        # Bounded so names stay within the FileField's max_length.
+        extension = os.path.splitext(original_name)[1].lower()[:16]
+        return f"{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+    def get_available_name(self, name, max_length=None):
+        # The final name depends on the content, see _save().
+        return name
+
+    def incoming_path(self):
+        """Return a fresh path to write an upload to before adopting it."""
+        path = self.path(f"{INCOMING_DIR}/{uuid.uuid4().hex}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def partial_path(self, upload_id):
+        """Return the path a chunked upload is assembled at."""
+        path = self.path(f"{PARTIAL_DIR}/{upload_id}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def adopt(self, path, digest, original_name):
+        """Move a file written to incoming_path() to its blob name."""
+        name = self.blob_name(digest, original_name)
+        target = self.path(name)
+        if os.path.exists(target):
+            os.remove(path)
+            # Fresh mtime: the blob is about to be referenced again, which
+            # keeps the garbage collector's grace period from expiring.
+            os.utime(target)
+        else:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+        return name
+
+    def _save(self, name, content):
+        # Hash while writing so the content is only read once.
+        path = self.incoming_path()
+        sha256 = hashlib.sha256()
+        try:
+            with open(path, "wb") as destination:
+                if hasattr(content, "seek"):
+                    content.seek(0)
+                for chunk in content.chunks():
+                    destination.write(chunk)
+                    sha256.update(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+        return self.adopt(path, sha256.hexdigest(), name)
+
+    def incoming_files(self, older_than):
+        """Yield the paths of abandoned incoming files."""
+        directory = self.path(INCOMING_DIR)
+        if not os.path.isdir(directory):
+            return
+        cutoff = time.time() - older_than
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                yield entry.path
+
+    def blob_names(self):
+        """Yield the names of every stored blob."""
+        root = self.path(BLOB_DIR)
+        for first in _shard_directories(root):
+            for second in _shard_directories(first.path):
+                for entry in os.scandir(second.path):
+                    if entry.is_file():
+                        yield f"{BLOB_DIR}/{first.name}/{second.name}/{entry.name}"
+
+
+def _shard_directories(path):
+    if not os.path.isdir(path):
+        return []
+    # Two hex digits: the longer names of INCOMING_DIR and PARTIAL_DIR are
+    # left out.
+    return [
+        entry for entry in os.scandir(path) if entry.is_dir() and len(entry.name) == 2
+    ]
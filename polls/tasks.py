@@ -0,0 +1,89 @@
+"""The jobs run for a contact submission, see polls.jobs.
+
+Each task takes the Job being run. Raising makes polls.jobs retry it later.
+"""
+
+import hashlib
+import io
+import mimetypes
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.mail import send_mail
+from PIL import Image, UnidentifiedImageError
+
+from .blobs import is_blob
+from .models import Contact, Job
+
+THUMBNAIL_SIZE = (256, 256)
+
+
+def _blob_digest(name):
+    # Content-addressed files are named after their hash already.
+    return name.rsplit("/", 1)[-1].split(".", 1)[0] if is_blob(name) else None
+
+
+def hash_attachment(job):
+    contact = job.contact
+    if not contact.file:
+        return
+    digest = _blob_digest(contact.file.name)
+    if digest is None:
+        sha256 = hashlib.sha256()
+        with contact.file.open("rb") as file:
+            for chunk in file.chunks():
+                sha256.update(chunk)
+        digest = sha256.hexdigest()
+    Contact.objects.filter(pk=contact.pk).update(file_sha256=digest)
+
+
+def thumbnail_attachment(job):
+    contact = job.contact
+    content_type = mimetypes.guess_type(contact.file.name or "")[0] or ""
+    if not content_type.startswith("image/"):
+        return
+
+    # Identical images share their thumbnail, like they share their blob.
+    key = _blob_digest(contact.file.name) or f"contact-{contact.pk}"
+    name = f"thumbnails/{key}.png"
+    if not default_storage.exists(name):
+        try:
+            with contact.file.open("rb") as file, Image.open(file) as image:
+                image.thumbnail(THUMBNAIL_SIZE)
+                output = io.BytesIO()
+                image.save(output, format="PNG")
+        except UnidentifiedImageError:
+            return  # Not something Pillow reads, retrying will not help.
+        name = default_storage.save(name, ContentFile(output.getvalue()))
+    Contact.objects.filter(pk=contact.pk).update(thumbnail=name)
+
+
+def notify(job):
+    contact = job.contact
+    send_mail(
+        f"New contact from {contact.name}",
+        f"{contact.name} <{contact.email}> wrote:\n\n{contact.message}",
+        None,
+        [job.payload["recipient"]],
+    )
+
+
+TASKS = {
+    "hash_attachment": hash_attachment,
+    "thumbnail_attachment": thumbnail_attachment,
+    "notify": notify,
+}
+
+
+def contact_jobs(contact):
+    """Return the unsaved jobs to run for a new contact."""
+    jobs = []
+    if contact.file:
+        jobs.append(Job(task="hash_attachment", contact=contact))
+        jobs.append(Job(task="thumbnail_attachment", contact=contact))
+    for recipient in settings.CONTACT_NOTIFY_EMAILS:
+        jobs.append(
+            Job(task="notify", contact=contact, payload={"recipient": recipient})
+        )
+    return jobs
@@ -0,0 +1,222 @@
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import counters, export
+from .admin import ContactAdmin
+from .models import ChoiceVoteShard, Contact, Question
+
+
+class ContactExportTests(TestCase):
+    url = "/admin/polls/contact/export/"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.contacts = []
+        for day, message in [
+            (1, "Plain"),
+            (2, 'Quoted "text", and a comma'),
+            (3, "Two\nlines"),
+        ]:
+            contact = Contact.objects.create(
+                name=f"Day {day}", email=f"day{day}@example.com", message=message
+            )
+            contact.submitted_at = timezone.make_aware(
+                timezone.datetime(2025, 1, day, 12)
+            )
+            contact.save(update_fields=["submitted_at"])
+            cls.contacts.append(contact)
+
+    def setUp(self):
+        admin = User.objects.create_superuser("admin", password="secret")
+        self.client.force_login(
+            admin, backend="django.contrib.auth.backends.ModelBackend"
+        )
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return response, b"".join(response.streaming_content)
+
+    def test_csv(self):
+        response, content = self.export()
+        self.assertEqual(response["Content-Type"], "text/csv")
+        rows = list(csv.reader(io.StringIO(content.decode(), newline="")))
+        self.assertEqual(rows[0], list(export.FIELDS))
+        self.assertEqual(
+            [row[:4] for row in rows[1:]],
+            [[str(c.pk), c.name, c.email, c.message] for c in self.contacts],
+        )
+
+    def test_ndjson_within_dates(self):
+        _, content = self.export(
+            format="ndjson", since="2025-01-02", until="2025-01-02"
+        )
+        [line] = content.decode().splitlines()
+        record = json.loads(line)
+        self.assertEqual(set(record), set(export.FIELDS))
+        self.assertEqual(
+            (record["id"], record["message"]),
+            (self.contacts[1].pk, self.contacts[1].message),
+        )
+        self.assertTrue(record["submitted_at"].startswith("2025-01-02T12:00:00"))
+
+    def test_gzip(self):
+        _, plain = self.export(format="ndjson")
+        response, compressed = self.export(format="ndjson", gzip="1")
+        self.assertEqual(response["Content-Type"], "application/gzip")
+        self.assertEqual(gzip.decompress(compressed), plain)
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get(self.url, {"format": "xml"}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {"since": "soon"}).status_code, 400)
+
+    def test_admin_action_exports_the_selection(self):
+        response = self.client.post(
+            "/admin/polls/contact/",
+            {"action": "export_ndjson", "_selected_action": [self.contacts[0].pk]},
+        )
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(line)["id"] for line in lines], [self.contacts[0].pk]
+        )
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "contacts.csv")
+            call_command("export_contacts", output=path, since="2025-01-03")
+            with open(path, encoding="utf-8", newline="") as f:
+                rows = list(csv.reader(f))
+        self.assertEqual([row[0] for row in rows[1:]], [str(self.contacts[2].pk)])
+
+
+class KeysetPaginationTests(TestCase):
+    url = "/admin/polls/contact/"
+
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.make_aware(timezone.datetime(2025, 1, 1))
+        for index in range(7):
+            contact = Contact.objects.create(
+                name=f"Contact {index}", email="page@example.com", message="Hi"
+            )
+            # Pairs share a timestamp, the ids break the ties.
+            contact.submitted_at = start + timezone.timedelta(hours=index // 2)
+            contact.save(update_fields=["submitted_at"])
+        cls.expected = list(
+            Contact.objects.order_by("-submitted_at", "-pk").values_list(
+                "name", flat=True
+            )
+        )
+
+    def setUp(self):
+        admin = User.objects.create_superuser("admin", password="secret")
+        self.client.force_login(
+            admin, backend="django.contrib.auth.backends.ModelBackend"
+        )
+        self.enterContext(mock.patch.object(ContactAdmin, "list_per_page", 3))
+
+    def page(self, query=""):
+        cl = self.client.get(self.url + query).context["cl"]
+        return cl, [contact.name for contact in cl.result_list]
+
+    def test_next_and_previous_pages(self):
+        pages = []
+        cl, names = self.page()
+        self.assertTrue(cl.keyset)
+        self.assertIsNone(cl.previous_url)
+        pages.append(names)
+        while cl.next_url:
+            cl, names = self.page(cl.next_url)
+            pages.append(names)
+        self.assertEqual(
+            pages, [self.expected[0:3], self.expected[3:6], self.expected[6:]]
+        )
+
+        # And back from the last page to the first.
+        back = []
+        while cl.previous_url:
+            cl, names = self.page(cl.previous_url)
+            back.append(names)
+        self.assertEqual(back, pages[-2::-1])
+        self.assertIsNotNone(cl.next_url)
+
+    def page_sql(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            cl, _ = self.page(query)
+        sql = next(
+            query["sql"]
+            for query in queries.captured_queries
+            if '"polls_contact"' in query["sql"] and "ORDER BY" in query["sql"]
+        )
+        return cl, sql
+
+    def test_cursor_bounds_the_index_range(self):
+        # Outside the OR too, so an index scan can start at the cursor.
+        cl, _ = self.page()
+        cl, sql = self.page_sql(cl.next_url)
+        self.assertIn('AND "polls_contact"."submitted_at" <=', sql)
+        _, sql = self.page_sql(cl.previous_url)
+        self.assertIn('AND "polls_contact"."submitted_at" >=', sql)
+
+    def test_invalid_cursor_shows_the_first_page(self):
+        _, names = self.page("?after=soon|x")
+        self.assertEqual(names, self.expected[:3])
+
+    def test_sorting_by_a_column_uses_numbered_pages(self):
+        cl, names = self.page("?o=1")
+        self.assertFalse(cl.keyset)
+        self.assertEqual(names, sorted(self.expected)[:3])
+
+
+@override_settings(POLLS_VOTE_MODE="sharded", POLLS_VOTE_SHARDS=4)
+class QuestionAdminTests(TestCase):
+    def setUp(self):
+        self.question = Question.objects.create(
+            question_text="Counted?", pub_date=timezone.now()
+        )
+        self.yes = self.question.choice_set.create(choice_text="Yes", votes=2)
+        counters.record_sharded_vote(self.question.pk, self.yes.pk)
+        admin = User.objects.create_superuser("admin", password="secret")
+        self.client.force_login(
+            admin, backend="django.contrib.auth.backends.ModelBackend"
+        )
+        self.url = f"/admin/polls/question/{self.question.pk}/change/"
+
+    def test_votes_are_shown_with_the_shards_and_not_posted(self):
+        response = self.client.get(self.url)
+        self.assertContains(
+            response, '<td class="field-vote_total"><p>3</p></td>', html=True
+        )
+        self.assertNotContains(response, 'name="choice_set-0-votes"')
+        # Reading the page writes nothing.
+        self.assertEqual(ChoiceVoteShard.objects.get(votes__gt=0).votes, 1)
+
+        data = {
+            "question_text": "Still counted?",
+            "pub_date_0": "2025-01-01",
+            "pub_date_1": "12:00:00",
+            "choice_set-TOTAL_FORMS": "1",
+            "choice_set-INITIAL_FORMS": "1",
+            "choice_set-0-id": str(self.yes.pk),
+            "choice_set-0-question": str(self.question.pk),
+            "choice_set-0-choice_text": "Yes!",
+        }
+        response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 302)
+        self.yes.refresh_from_db()
+        self.assertEqual((self.yes.choice_text, self.yes.votes), ("Yes!", 2))
+        self.assertEqual(
+            self.question.choice_set.with_vote_totals().get().total_votes, 3
+        )
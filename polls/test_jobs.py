@@ -0,0 +1,172 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.test import TestCase
+from django.utils import timezone
+
+from clients.models import ClientUser
+from clients.tokens import issue_token
+
+from . import jobs
+from .management.commands import run_jobs
+from .models import Contact, Job
+
+
+class JobTests(TestCase):
+    def setUp(self):
+        self.contact = Contact.objects.create(
+            name="Queued", email="queued@example.com", message="Hello"
+        )
+        self.job = Job.objects.create(task="test", contact=self.contact)
+
+    def run_job(self, task):
+        with mock.patch.dict(jobs.TASKS, {"test": task}):
+            jobs.run(jobs.claim())
+
+    def failing_task(self, job):
+        raise ValueError("Try again")
+
+    def test_failed_job_is_retried_with_backoff(self):
+        before = timezone.now()
+        self.run_job(self.failing_task)
+        self.job.refresh_from_db()
+        self.assertEqual(self.job.status, Job.Status.QUEUED)
+        self.assertEqual(self.job.attempts, 1)
+        self.assertEqual(self.job.last_error, "ValueError: Try again")
+        delay = (self.job.run_after - before).total_seconds()
+        self.assertGreaterEqual(delay, jobs.RETRY_DELAY * 0.5)
+        self.assertLessEqual(delay, jobs.RETRY_DELAY * 1.5 + 1)
+        # Not ready before its delay is over.
+        self.assertIsNone(jobs.claim())
+
+    def test_job_fails_after_max_attempts(self):
+        for attempt in range(1, jobs.MAX_ATTEMPTS + 1):
+            Job.objects.filter(pk=self.job.pk).update(run_after=timezone.now())
+            self.run_job(self.failing_task)
+        self.job.refresh_from_db()
+        self.assertEqual(
+            (self.job.status, self.job.attempts), (Job.Status.FAILED, attempt)
+        )
+        status = jobs.submission_status(self.contact.pk, None)
+        self.assertEqual(status["status"], "failed")
+
+    def test_contact_deleted_while_the_job_runs(self):
+        def delete_contact(job):
+            job.contact.delete()
+
+        self.run_job(delete_contact)
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(jobs.work(until_idle=True), 0)
+
+    def abandon(self, attempts):
+        started_at = timezone.now() - timezone.timedelta(seconds=jobs.LEASE + 1)
+        Job.objects.filter(pk=self.job.pk).update(
+            status=Job.Status.RUNNING, attempts=attempts, started_at=started_at
+        )
+        jobs.requeue_abandoned()
+        self.job.refresh_from_db()
+
+    def test_abandoned_job_is_requeued(self):
+        self.abandon(1)
+        self.assertEqual(self.job.status, Job.Status.QUEUED)
+
+    def test_abandoned_last_attempt_fails(self):
+        self.abandon(jobs.MAX_ATTEMPTS)
+        self.assertEqual(self.job.status, Job.Status.FAILED)
+        self.assertEqual(self.job.last_error, "Abandoned by its worker")
+
+    def test_worker_survives_database_errors(self):
+        claim = jobs.claim
+        failures = [DatabaseError("server closed the connection")]
+
+        def failing_claim():
+            if failures:
+                raise failures.pop()
+            return claim()
+
+        with mock.patch.dict(jobs.TASKS, {"test": lambda job: None}):
+            with mock.patch.object(jobs, "claim", failing_claim):
+                with self.assertLogs("polls.jobs", "WARNING"):
+                    self.assertEqual(jobs.work(poll_interval=0, until_idle=True), 1)
+
+    def run_jobs(self, work):
+        # Threads instead of processes, which would not see the test database.
+        with mock.patch.object(run_jobs, "ProcessPoolExecutor", ThreadPoolExecutor):
+            with mock.patch.object(run_jobs, "work", work):
+                stdout, stderr = io.StringIO(), io.StringIO()
+                call_command(
+                    "run_jobs",
+                    processes=2,
+                    poll_interval=0,
+                    stdout=stdout,
+                    stderr=stderr,
+                )
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_failed_workers_are_restarted(self):
+        failures = [RuntimeError("Worker bug")]
+
+        def work(*_args):
+            if failures:
+                raise failures.pop()
+            return 1
+
+        stdout, stderr = self.run_jobs(work)
+        self.assertIn("Ran 2 job(s).", stdout)
+        self.assertIn("RuntimeError('Worker bug')", stderr)
+
+    def test_dead_worker_process_stops_the_command(self):
+        def work(*_args):
+            raise BrokenProcessPool("A child process terminated abruptly")
+
+        with self.assertRaisesMessage(CommandError, "A worker process died"):
+            self.run_jobs(work)
+
+
+class ContactStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = ClientUser.objects.create_user(
+            email="owner@example.com", password="secret", name="Owner"
+        )
+        cls.other = ClientUser.objects.create_user(
+            email="other@example.com", password="secret", name="Other"
+        )
+
+    def auth(self, user):
+        token, _ = issue_token(user)
+        return {"Authorization": f"Bearer {token}"}
+
+    def status(self, pk, user):
+        return self.client.get(
+            f"/polls/api/contact/{pk}/status/", headers=self.auth(user)
+        )
+
+    def test_only_the_submitter_sees_the_status(self):
+        response = self.client.post(
+            "/polls/api/contact/",
+            {"name": "Owner", "email": "owner@example.com", "message": "Hello"},
+            headers=self.auth(self.owner),
+        )
+        pk = response.json()["id"]
+        self.assertEqual(Contact.objects.get(pk=pk).submitted_by, self.owner)
+        response = self.status(pk, self.owner)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["id"], pk)
+        self.assertEqual(self.status(pk, self.other).status_code, 404)
+        self.assertEqual(self.status(pk + 1, self.owner).status_code, 404)
+
+    def test_bulk_contacts_record_the_submitter(self):
+        response = self.client.post(
+            "/polls/api/contact/bulk/",
+            [{"name": "Owner", "email": "owner@example.com", "message": "Hi"}],
+            content_type="application/json",
+            headers=self.auth(self.owner),
+        )
+        [result] = response.json()["results"]
+        self.assertEqual(self.status(result["id"], self.owner).status_code, 200)
+        self.assertEqual(self.status(result["id"], self.other).status_code, 404)
@@ -0,0 +1,286 @@
+import hashlib
+import os
+import tempfile
+import time
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+from clients.models import ClientUser
+from clients.tokens import issue_token
+
+from . import blobs, jobs, upload_handlers, uploads
+from .models import ChunkedUpload, Contact, StoredBlob
+
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        user = ClientUser.objects.create_user(
+            email="uploader@example.com", password="secret", name="Uploader"
+        )
+        token, _ = issue_token(user)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+
+    def put_chunk(self, url, offset, chunk):
+        return self.client.put(
+            url,
+            chunk,
+            content_type="application/octet-stream",
+            headers={
+                "Upload-Offset": str(offset),
+                "Upload-Checksum": f"sha256 {hashlib.sha256(chunk).hexdigest()}",
+            },
+        )
+
+    def test_upload_resumes_and_attaches_to_contact(self):
+        content = b"%PDF-" + b"x" * 995
+        response = self.client.post(
+            "/polls/api/contact/uploads/",
+            {
+                "filename": "report.pdf",
+                "size": len(content),
+                "sha256": hashlib.sha256(content).hexdigest(),
+            },
+        )
+        self.assertEqual(response.status_code, 201)
+        url = response.json()["url"]
+
+        self.assertEqual(self.put_chunk(url, 0, content[:600]).json()["offset"], 600)
+        # A chunk sent again after a dropped connection tells where to go on.
+        retried = self.put_chunk(url, 0, content[:600])
+        self.assertEqual((retried.status_code, retried.json()["offset"]), (409, 600))
+        self.assertEqual(self.client.get(url).json()["offset"], 600)
+        corrupt = self.client.put(
+            url,
+            content[600:],
+            content_type="application/octet-stream",
+            headers={"Upload-Offset": "600", "Upload-Checksum": "sha256 " + "0" * 64},
+        )
+        self.assertEqual(corrupt.status_code, 400)
+        self.assertEqual(
+            self.put_chunk(url, 600, content[600:]).json()["status"], "complete"
+        )
+
+        upload = ChunkedUpload.objects.get()
+        data = {
+            "name": "Uploader",
+            "email": "uploader@example.com",
+            "message": "Report attached",
+            "upload": upload.pk,
+        }
+        self.assertEqual(self.client.post("/polls/api/contact/", data).status_code, 202)
+        contact = Contact.objects.get()
+        self.assertEqual(contact.file.read(), content)
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertEqual(StoredBlob.objects.get(name=contact.file.name).ref_count, 1)
+
+        # A concurrent post that found the upload before the first took it.
+        with (
+            mock.patch.object(uploads, "completed_upload", return_value=upload),
+            mock.patch.object(
+                uploads, "acompleted_upload", mock.AsyncMock(return_value=upload)
+            ),
+        ):
+            response = self.client.post("/polls/api/contact/", data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Contact.objects.count(), 1)
+        self.assertEqual(StoredBlob.objects.get(name=contact.file.name).ref_count, 1)
+
+    def start_upload(self, content):
+        response = self.client.post(
+            "/polls/api/contact/uploads/",
+            {
+                "filename": "report.pdf",
+                "size": len(content),
+                "sha256": hashlib.sha256(content).hexdigest(),
+            },
+        )
+        return response.json()["url"]
+
+    def test_file_is_hashed_outside_the_lock(self):
+        content = b"%PDF-" + b"x" * 95
+        url = self.start_upload(content)
+        depth = len(connection.atomic_blocks)
+        file_digest = uploads._file_digest  # pylint: disable=protected-access
+
+        def unlocked_digest(path):
+            # Out of the transaction that stored the last chunk.
+            self.assertEqual(len(connection.atomic_blocks), depth)
+            return file_digest(path)
+
+        with mock.patch.object(uploads, "_file_digest", side_effect=unlocked_digest):
+            response = self.put_chunk(url, 0, content)
+        self.assertEqual(response.json()["status"], "complete")
+
+    def test_concurrent_completions_adopt_the_file_once(self):
+        content = b"%PDF-" + b"x" * 95
+        url = self.start_upload(content)
+        # Stored, but the request died before completing it.
+        with mock.patch.object(uploads, "complete", side_effect=lambda u: u):
+            self.put_chunk(url, 0, content)
+        stale = ChunkedUpload.objects.get()
+        self.assertEqual(self.client.get(url).json()["status"], "complete")
+        # A retried last chunk that had read the row before.
+        completed = uploads.complete(stale)
+        self.assertEqual(completed.status, ChunkedUpload.Status.COMPLETE)
+        self.assertEqual(StoredBlob.objects.get(name=completed.file).ref_count, 1)
+
+    def test_corrupt_file_deletes_the_upload(self):
+        content = b"%PDF-" + b"x" * 95
+        url = self.start_upload(content)
+        with mock.patch.object(uploads, "_file_digest", return_value="0" * 64):
+            response = self.put_chunk(url, 0, content)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ChunkedUpload.objects.exists())
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    @override_settings(CONTACT_CHUNKED_UPLOADS_PER_USER=1)
+    def test_uploads_per_user_are_capped(self):
+        self.start_upload(b"%PDF-first")
+        response = self.client.post(
+            "/polls/api/contact/uploads/",
+            {"filename": "other.pdf", "size": 10, "sha256": "0" * 64},
+        )
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(ChunkedUpload.objects.count(), 1)
+
+    def test_idle_worker_expires_abandoned_uploads(self):
+        abandoned, recent = (
+            self.start_upload(b"%PDF-" + b"x" * 95).rstrip("/").rsplit("/", 1)[1]
+            for _ in range(2)
+        )
+        ChunkedUpload.objects.filter(pk=abandoned).update(
+            updated_at=timezone.now()
+            - timezone.timedelta(seconds=uploads.UPLOAD_EXPIRY + 60)
+        )
+        partial = blobs.contact_storage().partial_path(abandoned)
+        self.assertTrue(os.path.exists(partial))
+        self.assertEqual(jobs.work(until_idle=True), 0)
+        self.assertEqual(
+            [str(pk) for pk in ChunkedUpload.objects.values_list("pk", flat=True)],
+            [recent],
+        )
+        self.assertFalse(os.path.exists(partial))
+
+
+class BlobGarbageTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.storage = blobs.contact_storage()
+
+    def blob(self, content, age=2 * blobs.GC_GRACE_PERIOD):
+        name = self.storage.save("file.txt", ContentFile(content))
+        written = time.time() - age
+        os.utime(self.storage.path(name), (written, written))
+        return name
+
+    def test_collects_unreferenced_blobs_past_the_grace_period(self):
+        released, referenced, uncounted = (
+            self.blob(content) for content in (b"released", b"referenced", b"never")
+        )
+        recent = self.blob(b"recent", age=0)
+        for name in (released, referenced):
+            blobs.acquire(name)
+        blobs.release(released)
+
+        self.assertEqual(
+            sorted(blobs.collect_garbage(dry_run=True)), sorted([released, uncounted])
+        )
+        self.assertTrue(self.storage.exists(released))
+        self.assertEqual(sorted(blobs.collect_garbage()), sorted([released, uncounted]))
+        for name, kept in ((released, False), (uncounted, False), (recent, True)):
+            self.assertEqual(self.storage.exists(name), kept)
+        self.assertEqual(
+            list(StoredBlob.objects.values_list("name", flat=True)), [referenced]
+        )
+
+    def test_blob_uploaded_again_while_collecting_is_kept(self):
+        name = self.blob(b"again")
+        is_recent = blobs._is_recent  # pylint: disable=protected-access
+
+        def uploaded_meanwhile(path, grace_period):
+            recent = is_recent(path, grace_period)
+            # Stored again right after being listed, before it is locked.
+            self.storage.save("file.txt", ContentFile(b"again"))
+            return recent
+
+        with mock.patch.object(blobs, "_is_recent", uploaded_meanwhile):
+            self.assertEqual(blobs.collect_garbage(), [])
+        self.assertTrue(self.storage.exists(name))
+
+
+class StreamedUploadTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        user = ClientUser.objects.create_user(
+            email="sender@example.com", password="secret", name="Sender"
+        )
+        token, _ = issue_token(user)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+
+    def post(self, name, content, content_type="text/plain"):
+        return self.client.post(
+            "/polls/api/contact/",
+            {
+                "name": "Sender",
+                "email": "sender@example.com",
+                "message": "Attached",
+                "file": SimpleUploadedFile(name, content, content_type),
+            },
+        )
+
+    def incoming(self):
+        directory = os.path.join(self.media, "blobs", "incoming")
+        return os.listdir(directory) if os.path.isdir(directory) else []
+
+    def test_files_are_stored_under_their_hash(self):
+        content = b"Hello, storage"
+        digest = hashlib.sha256(content).hexdigest()
+        for name in ("note.txt", "copy.txt"):
+            self.assertEqual(self.post(name, content).status_code, 202)
+        first, second = Contact.objects.order_by("pk")
+        expected = f"blobs/{digest[:2]}/{digest[2:4]}/{digest}.txt"
+        self.assertEqual((first.file.name, second.file.name), (expected, expected))
+        self.assertEqual(first.file.read(), content)
+        # Kept once, referenced twice.
+        self.assertEqual(StoredBlob.objects.get(name=expected).ref_count, 2)
+        self.assertEqual(self.incoming(), [])
+
+    @override_settings(CONTACT_UPLOAD_MAX_BYTES=1000)
+    def test_too_large_upload_is_refused(self):
+        response = self.post("big.txt", b"x" * 2000)
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(Contact.objects.exists())
+        self.assertEqual(self.incoming(), [])
+
+    @override_settings(CONTACT_UPLOAD_MAX_BYTES=1000)
+    def test_upload_going_over_the_limit_is_cut_off(self):
+        # A declared size under the limit does not let more bytes through.
+        request = RequestFactory().post("/")
+        request.upload_error = None
+        handler = upload_handlers.StreamingUploadHandler(request)
+        handler.new_file("file", "big.txt", "text/plain", 2000)
+        handler.receive_data_chunk(b"x" * 800, 0)
+        with self.assertRaises(StopUpload):
+            handler.receive_data_chunk(b"x" * 800, 800)
+        self.assertEqual(request.upload_error_status, 413)
+        self.assertEqual(self.incoming(), [])
+
+    def test_unaccepted_type_is_refused(self):
+        response = self.post("tool.exe", b"MZ", "application/x-msdownload")
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(Contact.objects.exists())
+        self.assertEqual(self.incoming(), [])
@@ -1,3 +1,834 @@
-from django.test import TestCase
+import json
+import re
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection, connections
+from django.db.models import F
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from clients.models import ClientUser
+from clients.tokens import issue_token
+from mysite.metrics import Counter, Registry, registry
+from mysite.profiler import StackSampler, get_store
+from mysite.search import PostgresSearch
+from mysite.query_budget import QueryBudgetTestMixin
+
+from . import (
+    async_views,
+    bulk,
+    counters,
+    page_cache,
+    snapshots,
+    urls,
+    views,
+    vote_buffer,
+)
+from .benchmarks import compare
+from .seeding import SeedPlan, Seeder, seed
+from .models import (
+    Choice,
+    ChoiceVoteShard,
+    ChunkedUpload,
+    Contact,
+    Question,
+    StoredBlob,
+)
+
+CSRF_TOKEN = re.compile(r'name="csrfmiddlewaretoken" value="[^"]*"')
+
+
+class PollsQueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = ClientUser.objects.create_user(
+            email="voter@example.com", password="secret", name="Voter"
+        )
+        cls.question = Question.objects.create(
+            question_text="What's new?", pub_date=timezone.now()
+        )
+        cls.choice = cls.question.choice_set.create(choice_text="Not much")
+        cls.question.choice_set.create(choice_text="The sky")
+        cls.upload = ChunkedUpload.objects.create(
+            owner=cls.user, filename="big.pdf", size=10, sha256="0" * 64
+        )
+
+    def setUp(self):
+        self.client.force_login(
+            self.user, backend="clients.auth_backends.ClientUserBackend"
+        )
+        token, _ = issue_token(self.user)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+
+    def test_views_stay_within_query_budget(self):
+        self.assertUrlsWithinBudget(
+            urls,
+            {
+                "pk": self.question.pk,
+                "question_id": self.question.pk,
+                "upload_id": self.upload.pk,
+            },
+            post_data={
+                "vote": {"choice": self.choice.pk},
+                "contactForm": {
+                    "name": "Voter",
+                    "email": "voter@example.com",
+                    "message": "Hello",
+                },
+                "apiContactForm": {
+                    "name": "Voter",
+                    "email": "voter@example.com",
+                    "message": "Hello",
+                },
+                "apiContactBulk": {
+                    "contacts": json.dumps(
+                        [
+                            {
+                                "name": "Voter",
+                                "email": "voter@example.com",
+                                "message": "Hello",
+                            }
+                        ]
+                    )
+                },
+            },
+        )
+
+
+class BulkContactTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        user = ClientUser.objects.create_user(
+            email="bulk@example.com", password="secret", name="Bulk"
+        )
+        token, _ = issue_token(user)
+        self.client.defaults["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+
+    def record(self, name, **fields):
+        return {"name": name, "email": "bulk@example.com", "message": "Hi", **fields}
+
+    def test_invalid_records_get_their_own_errors(self):
+        records = [
+            self.record("First"),
+            self.record("Bad email", email="nope"),
+            "not an object",
+            self.record("Missing file", file="file9"),
+            self.record("Last"),
+        ]
+        with mock.patch.object(bulk, "CHUNK_SIZE", 1):
+            response = self.client.post(
+                "/polls/api/contact/bulk/", records, content_type="application/json"
+            )
+        body = response.json()
+        self.assertEqual((body["created"], body["failed"]), (2, 3))
+        results = body["results"]
+        self.assertEqual([result["index"] for result in results], [0, 1, 2, 3, 4])
+        self.assertIn("email", results[1]["errors"])
+        self.assertEqual(results[2]["errors"], {"__all__": ["Expected a JSON object."]})
+        self.assertEqual(
+            results[3]["errors"], {"file": ["No attachment named 'file9'."]}
+        )
+        names = Contact.objects.order_by("pk").values_list("name", flat=True)
+        self.assertEqual(list(names), ["First", "Last"])
+        self.assertEqual(
+            [results[0]["id"], results[4]["id"]],
+            list(Contact.objects.order_by("pk").values_list("pk", flat=True)),
+        )
+
+    def test_invalid_ndjson_line(self):
+        body = "\n".join(
+            [json.dumps(self.record("First")), "{broken", json.dumps(self.record("Ok"))]
+        )
+        response = self.client.post(
+            "/polls/api/contact/bulk/", body, content_type="application/x-ndjson"
+        )
+        results = response.json()["results"]
+        self.assertEqual(
+            results[1], {"index": 1, "errors": {"__all__": ["Invalid JSON."]}}
+        )
+        self.assertEqual(Contact.objects.count(), 2)
+
+    def test_multipart_records_name_their_attachments(self):
+        records = [self.record("With file", file="file0"), self.record("Without")]
+        response = self.client.post(
+            "/polls/api/contact/bulk/",
+            {
+                "contacts": json.dumps(records),
+                "file0": SimpleUploadedFile("a.txt", b"Attached", "text/plain"),
+            },
+        )
+        self.assertEqual(response.json()["created"], 2)
+        with_file = Contact.objects.get(name="With file")
+        self.assertEqual(with_file.file.read(), b"Attached")
+        self.assertEqual(StoredBlob.objects.get(name=with_file.file.name).ref_count, 1)
+        self.assertFalse(Contact.objects.get(name="Without").file)
+        # Queued as by the contact API, bulk_create() sends no signals.
+        self.assertEqual(
+            set(with_file.jobs.values_list("task", flat=True)),
+            {"hash_attachment", "thumbnail_attachment"},
+        )
+
+    def test_unsupported_body_is_refused(self):
+        response = self.client.post(
+            "/polls/api/contact/bulk/", {"x": 1}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            "/polls/api/contact/bulk/", "a,b", content_type="text/csv"
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class BenchmarkCompareTests(SimpleTestCase):
+    def test_reports_metrics_worse_than_the_tolerance(self):
+        baseline = {
+            "vote": {"throughput": 100.0, "p99_ms": 10.0, "queries_per_request": 3},
+            "gone": {"throughput": 100.0},
+        }
+        current = {
+            "vote": {"throughput": 85.0, "p99_ms": 13.0, "queries_per_request": 4},
+            "new": {"throughput": 1.0},
+        }
+        self.assertEqual(
+            compare(baseline, current, 0.2),
+            [("vote", "p99_ms", 10.0, 13.0), ("vote", "queries_per_request", 3, 4)],
+        )
+
+
+class SeedingTests(TestCase):
+    def test_loads_rows_and_restores_indexes(self):
+        indexes = Seeder().secondary_indexes(Contact)
+        counts = seed(
+            SeedPlan(
+                questions=3, choices=2, users=2, contacts=4, max_votes=10, random_seed=1
+            )
+        )
+
+        self.assertEqual(
+            counts, {"Question": 3, "Choice": 6, "ClientUser": 2, "Contact": 4}
+        )
+        self.assertEqual(Seeder().secondary_indexes(Contact), indexes)
+        users = ClientUser.objects.filter(email__endswith="@seed.invalid")
+        self.assertTrue(all(user.check_password("password") for user in users))
+        self.assertTrue(all(0 <= c.votes < 10 for c in Choice.objects.all()))
+        # The ids handed out next follow the seeded ones.
+        self.assertEqual(
+            Question.objects.create(question_text="New", pub_date=timezone.now()).pk,
+            Question.objects.order_by("-pk")[1].pk + 1,
+        )
+
+
+class ProfilerTests(TestCase):
+    def setUp(self):
+        profiles = tempfile.TemporaryDirectory()
+        self.addCleanup(profiles.cleanup)
+        self.enterContext(
+            override_settings(PROFILER_DIR=profiles.name, PROFILER_TOKEN="secret")
+        )
+        user = ClientUser.objects.create_user(
+            email="profiled@example.com", password="secret", name="Profiled"
+        )
+        self.client.force_login(user, backend="clients.auth_backends.ClientUserBackend")
+        Question.objects.create(question_text="Profiled?", pub_date=timezone.now())
+
+    def test_profiles_requests_sending_the_token(self):
+        self.client.get("/polls/")
+        self.assertEqual(get_store().all(), [])
+
+        cache.clear()
+        self.client.get("/polls/", headers={"X-Profile": "secret"})
+        [profile] = get_store().all()
+        self.assertEqual(profile["path"], "/polls/")
+        self.assertEqual(profile["status"], 200)
+        self.assertEqual(profile["query_count"], len(profile["queries"]))
+        self.assertGreater(profile["query_count"], 0)
+        self.assertIn(
+            "polls/index.html", [template["name"] for template in profile["templates"]]
+        )
+
+    def test_sampler_roots_the_stacks_of_each_thread(self):
+        stop = threading.Event()
+
+        def sleeping_worker():
+            stop.wait()
+
+        worker = threading.Thread(target=sleeping_worker)
+        worker.start()
+        self.addCleanup(worker.join)
+        self.addCleanup(stop.set)
+        sampler = StackSampler(
+            {threading.get_ident(): "event loop", worker.ident: "sync worker"}, 0.001
+        )
+        sampler.start()
+        time.sleep(0.05)
+        sampler.stop()
+        roots = {stack.split(";", 1)[0] for stack in sampler.stacks}
+        self.assertEqual(roots, {"event loop", "sync worker"})
+        self.assertTrue(
+            any(
+                stack.startswith("sync worker;") and "sleeping_worker" in stack
+                for stack in sampler.stacks
+            )
+        )
+
+    @override_settings(PROFILER_MODE="cprofile")
+    def test_admin_browses_the_profiles(self):
+        self.client.get("/polls/", headers={"X-Profile": "secret"})
+        [profile] = get_store().all()
+        admin = User.objects.create_superuser("admin", "admin@example.com", "secret")
+        self.client.force_login(
+            admin, backend="django.contrib.auth.backends.ModelBackend"
+        )
+
+        response = self.client.get("/admin/profiles/")
+        self.assertContains(response, f"/admin/profiles/{profile['id']}/")
+        response = self.client.get(f"/admin/profiles/{profile['id']}/")
+        self.assertContains(response, "polls/index.html")
+        response = self.client.get(f"/admin/profiles/{profile['id']}/download/")
+        self.assertEqual(
+            response["Content-Disposition"],
+            f'attachment; filename="{profile["id"]}.prof"',
+        )
+        self.assertEqual(self.client.get("/admin/profiles/0/").status_code, 404)
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics = tempfile.TemporaryDirectory()
+        self.addCleanup(metrics.cleanup)
+        self.metrics_dir = metrics.name
+        self.enterContext(
+            override_settings(METRICS_DIR=metrics.name, METRICS_TOKEN="secret")
+        )
+        user = ClientUser.objects.create_user(
+            email="measured@example.com", password="secret", name="Measured"
+        )
+        self.client.force_login(user, backend="clients.auth_backends.ClientUserBackend")
+
+    def scrape(self):
+        return self.client.get("/metrics", headers={"Authorization": "Bearer secret"})
+
+    def sample(self, exposition, line):
+        """Return the value of the sample `line` starts, 0 if there is none."""
+        for sample in exposition.splitlines():
+            if sample.startswith(line + " "):
+                return float(sample.rsplit(" ", 1)[1])
+        return 0
+
+    def test_exposes_the_totals_of_all_workers(self):
+        responses = 'http_responses_total{view="polls:index",status="200"}'
+        before = self.sample(self.scrape().content.decode(), responses)
+        self.client.get("/polls/")
+        self.client.get("/polls/")
+        # Another worker's totals.
+        with open(f"{self.metrics_dir}/1-1.json", "w", encoding="utf-8") as f:
+            json.dump([["http_responses_total", ["polls:index", "200"], None, 5]], f)
+
+        response = self.scrape()
+        self.assertEqual(
+            response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8"
+        )
+        exposition = response.content.decode()
+        self.assertEqual(self.sample(exposition, responses), before + 7)
+        self.assertIn("# TYPE http_request_duration_seconds histogram", exposition)
+        requests = (
+            "http_request_duration_seconds_bucket"
+            '{view="polls:index",method="GET",le="+Inf"}'
+        )
+        self.assertGreaterEqual(self.sample(exposition, requests), 2)
+        self.assertGreater(
+            self.sample(exposition, 'db_queries_total{view="polls:index"}'), 0
+        )
+        self.assertGreater(
+            self.sample(exposition, 'cache_gets_total{tier="shared",result="hit"}'), 0
+        )
+
+    def test_cache_lookups_are_counted_once(self):
+        self.scrape()  # Installs the counting.
+        cache.set("present", 1)
+        before = registry.local_totals()
+        cache.get_many(["present", "absent"])
+        after = registry.local_totals()
+        for result in ("hit", "miss"):
+            key = ("cache_gets_total", ("shared", result), None)
+            self.assertEqual(after[key] - before.get(key, 0), 1)
+
+    def test_counts_of_finished_threads_are_kept_in_one_place(self):
+        test_registry = Registry()
+        counter = Counter(test_registry, "test_total", "Test.")
+        threads = [threading.Thread(target=counter.inc) for _ in range(50)]
+        for thread in threads:
+            thread.start()
+            thread.join()
+        counter.inc()
+        shards = test_registry._shards  # pylint: disable=protected-access
+        self.assertEqual(len(shards), 1)
+        self.assertEqual(test_registry.local_totals(), {("test_total", (), None): 51})
+
+    def test_token_is_required(self):
+        self.client.logout()
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        response = self.client.get("/metrics", headers={"Authorization": "Bearer no"})
+        self.assertEqual(response.status_code, 401)
+        response = self.scrape()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("# TYPE http_responses_total counter", response.content.decode())
+
+    def test_metrics_are_closed_without_a_token_unless_debugging(self):
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+            with override_settings(DEBUG=True):
+                self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+
+class ContactSearchTests(TestCase):
+    def setUp(self):
+        for name, email in (
+            ("Jane", "jane.smith@example.com"),
+            ("Bob", "bob@gmail.com"),
+        ):
+            Contact.objects.create(name=name, email=email, message="Hello")
+        admin = User.objects.create_superuser("admin", "admin@example.org", "secret")
+        self.client.force_login(
+            admin, backend="django.contrib.auth.backends.ModelBackend"
+        )
+
+    def search(self, term):
+        response = self.client.get("/admin/polls/contact/", {"q": term})
+        return sorted(contact.name for contact in response.context["cl"].result_list)
+
+    def test_finds_contacts_by_email_domain_and_local_part(self):
+        self.assertEqual(self.search("example.com"), ["Jane"])
+        self.assertEqual(self.search("gmail"), ["Bob"])
+        self.assertEqual(self.search("jane.smith"), ["Jane"])
+        self.assertEqual(self.search("smith"), ["Jane"])
+
+    def test_postgres_index_splits_email_addresses(self):
+        [column, _] = PostgresSearch().create(
+            "polls_contact", "id", ["email"], lambda name: f'"{name}"'
+        )
+        self.assertIn("""translate("email"::text, '@.', '  ')""", column)
+
+
+class ResultsSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.question = Question.objects.create(
+            question_text="Snapshot?", pub_date=timezone.now()
+        )
+        self.yes = self.question.choice_set.create(choice_text="Yes")
+        self.no = self.question.choice_set.create(choice_text="No")
+        snapshots.get_snapshot(self.question.pk)
+
+    def vote(self, choice):
+        Choice.objects.filter(pk=choice.pk).update(votes=F("votes") + 1)
+        snapshots.record_vote(self.question.pk, choice.pk)
+
+    def votes(self):
+        snapshot = snapshots.get_snapshot(self.question.pk)
+        return {choice["id"]: choice["votes"] for choice in snapshot["choices"]}
+
+    def test_vote_patches_the_snapshot(self):
+        self.vote(self.yes)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.votes(), {self.yes.pk: 1, self.no.pk: 0})
+
+    def test_interleaved_votes_are_both_read_back(self):
+        add_vote = snapshots._add_vote  # pylint: disable=protected-access
+
+        def add_vote_after_other_vote(snapshot, version, choice_id):
+            # The other vote lands between reading the snapshot and patching it.
+            with mock.patch.object(snapshots, "_add_vote", add_vote):
+                self.vote(self.no)
+            return add_vote(snapshot, version, choice_id)
+
+        with mock.patch.object(snapshots, "_add_vote", add_vote_after_other_vote):
+            self.vote(self.yes)
+        self.assertEqual(self.votes(), {self.yes.pk: 1, self.no.pk: 1})
+
+    def test_vote_during_a_rebuild_is_read_back(self):
+        choice_totals = snapshots.choice_totals
+
+        def vote_after_the_tally(question_id):
+            totals = choice_totals(question_id)
+            self.vote(self.yes)
+            return totals
+
+        cache.delete(snapshots.snapshot_key(self.question.pk))
+        with mock.patch.object(snapshots, "choice_totals", vote_after_the_tally):
+            snapshot = snapshots.build_snapshot(self.question.pk)
+        self.assertEqual(snapshot["total"], 0)
+        self.assertEqual(self.votes(), {self.yes.pk: 1, self.no.pk: 0})
+
+
+@override_settings(POLLS_VOTE_SHARDS=4)
+class ShardedVoteTests(TransactionTestCase):
+    def setUp(self):
+        self.question = Question.objects.create(
+            question_text="Sharded?", pub_date=timezone.now()
+        )
+        self.yes = self.question.choice_set.create(choice_text="Yes")
+        self.no = self.question.choice_set.create(choice_text="No")
+
+    def totals(self):
+        return dict(
+            self.question.choice_set.with_vote_totals().values_list("pk", "total_votes")
+        )
+
+    def test_concurrent_votes_add_up(self):
+        errors = []
+
+        def voter(choice, votes):
+            try:
+                for _ in range(votes):
+                    self.assertTrue(
+                        counters.record_sharded_vote(self.question.pk, choice.pk)
+                    )
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=voter, args=(choice, 25))
+            for choice in (self.yes, self.yes, self.yes, self.no)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.totals(), {self.yes.pk: 75, self.no.pk: 25})
+        self.assertEqual(ChoiceVoteShard.objects.count(), 8)
+
+        # Folded back into the choices, the totals stay the same.
+        self.assertEqual(counters.fold_vote_shards(self.question.pk), 100)
+        self.assertEqual(self.totals(), {self.yes.pk: 75, self.no.pk: 25})
+        self.assertEqual(
+            dict(self.question.choice_set.values_list("pk", "votes")),
+            {self.yes.pk: 75, self.no.pk: 25},
+        )
+        self.assertFalse(ChoiceVoteShard.objects.filter(votes__gt=0).exists())
+
+    def test_choice_of_another_question_is_refused(self):
+        other = Question.objects.create(question_text="Other?", pub_date=timezone.now())
+        self.assertFalse(counters.record_sharded_vote(other.pk, self.yes.pk))
+        self.assertFalse(ChoiceVoteShard.objects.exists())
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.question = Question.objects.create(
+            question_text="Cached?", pub_date=timezone.now()
+        )
+        self.question.choice_set.create(choice_text="Yes")
+        user = ClientUser.objects.create_user(
+            email="reader@example.com", password="secret", name="Reader"
+        )
+        self.client.force_login(user, backend="clients.auth_backends.ClientUserBackend")
+        self.detail_url = f"/polls/{self.question.pk}/"
+
+    def rename_quietly(self, text):
+        # No signal: what is served next comes from the cache.
+        Question.objects.filter(pk=self.question.pk).update(question_text=text)
+
+    def test_index_is_cached_until_a_question_is_saved(self):
+        self.assertContains(self.client.get("/polls/"), "Cached?")
+        self.rename_quietly("Renamed?")
+        self.assertContains(self.client.get("/polls/"), "Cached?")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.question_text = "Saved?"
+            self.question.save()
+        self.assertContains(self.client.get("/polls/"), "Saved?")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.delete()
+        self.assertContains(self.client.get("/polls/"), "No polls are available.")
+
+    def test_detail_is_cached_until_its_question_changes(self):
+        self.assertContains(self.client.get(self.detail_url), "Cached?")
+        self.rename_quietly("Renamed?")
+        self.assertContains(self.client.get(self.detail_url), "Cached?")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.question_text = "Saved?"
+            self.question.save()
+        self.assertContains(self.client.get(self.detail_url), "Saved?")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.question.choice_set.create(choice_text="Maybe")
+        self.assertContains(self.client.get(self.detail_url), "Maybe")
+
+    def test_votes_leave_the_pages_cached(self):
+        version = page_cache.question_version(self.question.pk)
+        choice = self.question.choice_set.get()
+        choice.votes += 1
+        with self.captureOnCommitCallbacks(execute=True):
+            choice.save(update_fields=["votes"])
+        self.assertEqual(page_cache.question_version(self.question.pk), version)
+
+
+class AsyncViewParityTests(TestCase):
+    """The async hot views answer like their sync counterparts."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = ClientUser.objects.create_user(
+            email="parity@example.com", password="secret", name="Parity"
+        )
+        cls.question = Question.objects.create(
+            question_text="Same?", pub_date=timezone.now()
+        )
+        cls.yes = cls.question.choice_set.create(choice_text="Yes")
+        cls.question.choice_set.create(choice_text="No")
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        token, _ = issue_token(self.user)
+        self.headers = {"Authorization": f"Bearer {token}"}
+
+    def respond(self, module, name, request, **kwargs):
+        cache.clear()
+        view = getattr(module, name)
+        if isinstance(view, type):
+            view = view.as_view()
+        request.user = self.user
+        if module is async_views:
+            response = async_to_sync(view)(request, **kwargs)
+        else:
+            response = view(request, **kwargs)
+        if hasattr(response, "render"):
+            response.render()
+        return response
+
+    def assertSameResponse(self, name, make_request, **kwargs):
+        sync = self.respond(views, name, make_request(), **kwargs)
+        asynchronous = self.respond(async_views, name, make_request(), **kwargs)
+        self.assertEqual(sync.status_code, asynchronous.status_code)
+        self.assertEqual(sync.get("Location"), asynchronous.get("Location"))
+        self.assertEqual(
+            CSRF_TOKEN.sub("", sync.content.decode()),
+            CSRF_TOKEN.sub("", asynchronous.content.decode()),
+        )
+        return sync
+
+    def test_pages(self):
+        pk = self.question.pk
+        for name, path, kwargs in [
+            ("IndexView", "/polls/", {}),
+            ("DetailView", f"/polls/{pk}/", {"pk": pk}),
+            ("ResultsView", f"/polls/{pk}/results/", {"pk": pk}),
+        ]:
+            with self.subTest(name):
+                response = self.assertSameResponse(
+                    name, lambda path=path: self.factory.get(path), **kwargs
+                )
+                self.assertContains(response, "Same?")
+
+    def test_vote(self):
+        response = self.assertSameResponse(
+            "vote",
+            lambda: self.factory.post("/", {"choice": self.yes.pk}),
+            question_id=self.question.pk,
+        )
+        self.assertEqual(response.status_code, 302)
+        self.yes.refresh_from_db()
+        self.assertEqual(self.yes.votes, 2)
+        # No choice: the form comes back with its error.
+        response = self.assertSameResponse(
+            "vote", lambda: self.factory.post("/"), question_id=self.question.pk
+        )
+        self.assertContains(response, "You didn&#x27;t select a choice.")
+
+    def test_apis(self):
+        contact = Contact.objects.create(
+            name="Parity",
+            email="parity@example.com",
+            message="Hi",
+            submitted_by=self.user,
+        )
+        for name, path, kwargs in [
+            ("questions_api", "/polls/api/questions/", {}),
+            ("contact_status", "/", {"pk": contact.pk}),
+            ("contact_status", "/", {"pk": contact.pk + 1}),
+        ]:
+            with self.subTest(name, **kwargs):
+                self.assertSameResponse(
+                    name,
+                    lambda path=path: self.factory.get(path, headers=self.headers),
+                    **kwargs,
+                )
+        response = self.assertSameResponse(
+            "contact_api",
+            lambda: self.factory.post("/", {"name": "Parity"}, headers=self.headers),
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class VoteBufferTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.question = Question.objects.create(
+            question_text="Buffered?", pub_date=timezone.now()
+        )
+        self.yes = self.question.choice_set.create(choice_text="Yes")
+        self.no = self.question.choice_set.create(choice_text="No")
+        # Flushed by the tests only, from the test's own connection.
+        self.buffer = vote_buffer.VoteBuffer(
+            flush_interval=3600, max_size=1000, max_age=3600, max_pending=1000
+        )
+        self.addCleanup(self.buffer.stop)
+        self.enterContext(mock.patch.object(vote_buffer, "_buffer", self.buffer))
+        vote_buffer.choice_ids_cache.clear()
+        self.addCleanup(vote_buffer.choice_ids_cache.clear)
+
+    def db_votes(self):
+        return dict(self.question.choice_set.values_list("pk", "votes"))
+
+    def results(self):
+        return {pk: votes for pk, _, votes in counters.choice_totals(self.question.pk)}
+
+    @override_settings(POLLS_VOTE_MODE="buffered")
+    def test_voter_reads_their_buffered_vote(self):
+        user = ClientUser.objects.create_user(
+            email="buffered@example.com", password="secret", name="Voter"
+        )
+        self.client.force_login(user, backend="clients.auth_backends.ClientUserBackend")
+        response = self.client.post(
+            f"/polls/{self.question.pk}/vote/", {"choice": self.yes.pk}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.db_votes(), {self.yes.pk: 0, self.no.pk: 0})
+        self.assertEqual(self.results(), {self.yes.pk: 1, self.no.pk: 0})
+        # Also once the results snapshot is rebuilt, in this process.
+        cache.clear()
+        snapshot = snapshots.get_snapshot(self.question.pk)
+        self.assertEqual(snapshot["choices"][0]["votes"], 1)
+
+    def test_flush_writes_the_pending_votes(self):
+        for choice in (self.yes, self.yes, self.no):
+            self.assertTrue(
+                vote_buffer.record_buffered_vote(self.question.pk, choice.pk)
+            )
+        self.assertEqual(self.buffer.flush(), 3)
+        self.assertEqual(self.db_votes(), {self.yes.pk: 2, self.no.pk: 1})
+        self.assertEqual(self.buffer.pending(self.question.pk), {})
+        self.assertEqual(self.results(), {self.yes.pk: 2, self.no.pk: 1})
+
+    def test_failed_flush_keeps_the_votes(self):
+        self.buffer.add(self.question.pk, self.yes.pk)
+        with (
+            mock.patch.object(Choice.objects, "filter", side_effect=DatabaseError),
+            self.assertLogs("polls.vote_buffer", "ERROR"),
+        ):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.pending(self.question.pk), {self.yes.pk: 1})
+        self.assertEqual(self.buffer.flush(), 1)
+
+    def test_full_buffer_writes_votes_through(self):
+        self.buffer.max_pending = 2
+        for choice in (self.yes, self.yes, self.no):
+            self.assertTrue(
+                vote_buffer.record_buffered_vote(self.question.pk, choice.pk)
+            )
+        self.assertEqual(self.buffer.pending(self.question.pk), {self.yes.pk: 2})
+        self.assertEqual(self.db_votes(), {self.yes.pk: 0, self.no.pk: 1})
+        self.assertEqual(self.results(), {self.yes.pk: 2, self.no.pk: 1})
+
+    def test_votes_leave_pending_with_their_update(self):
+        self.buffer.add(self.question.pk, self.yes.pk)
+        filter_choices = Choice.objects.filter
+        read = []
+        reader = threading.Thread(
+            target=lambda: read.append(self.buffer.pending(self.question.pk))
+        )
+
+        def filter_during_a_read(*args, **kwargs):
+            reader.start()
+            # The reader waits for the update, then sees the votes gone.
+            reader.join(0.1)
+            self.assertEqual(read, [])
+            return filter_choices(*args, **kwargs)
+
+        with mock.patch.object(Choice.objects, "filter", filter_during_a_read):
+            self.assertEqual(self.buffer.flush(), 1)
+        reader.join()
+        self.assertEqual(read, [{}])
+
+    def test_choice_of_another_question_is_refused(self):
+        other = Question.objects.create(question_text="Other?", pub_date=timezone.now())
+        choice = other.choice_set.create(choice_text="Elsewhere")
+        self.assertFalse(vote_buffer.record_buffered_vote(self.question.pk, choice.pk))
+        self.assertEqual(self.buffer.pending(self.question.pk), {})
+
+    def test_due_buffer_is_flushed_by_the_flusher_thread(self):
+        flushed_by = []
+        flushed = threading.Event()
+
+        def flush():
+            flushed_by.append(threading.current_thread().name)
+            flushed.set()
+
+        self.buffer.max_size = 1
+        with mock.patch.object(self.buffer, "flush", side_effect=flush):
+            self.buffer.add(self.question.pk, self.yes.pk)
+            self.assertTrue(flushed.wait(5))
+        self.assertEqual(flushed_by, ["vote-buffer-flusher"])
+
+
+class QuestionsApiTests(TestCase):
+    def setUp(self):
+        self.question = Question.objects.create(
+            question_text="Listed?", pub_date=timezone.now()
+        )
+        self.question.choice_set.create(choice_text="Yes")
+        user = ClientUser.objects.create_user(
+            email="mobile@example.com", password="secret", name="Mobile"
+        )
+        self.token, _ = issue_token(user)
+
+    def test_token_clients_get_the_questions(self):
+        response = self.client.get(
+            "/polls/api/questions/", headers={"Authorization": f"Bearer {self.token}"}
+        )
+        self.assertEqual(response.status_code, 200)
+        [question] = response.json()["results"]
+        self.assertEqual(question["id"], self.question.pk)
+
+    def test_token_is_required(self):
+        response = self.client.get("/polls/api/questions/")
+        self.assertEqual(response.status_code, 401)
+
+    def test_pages_seek_from_the_cursor(self):
+        # Two share a pub_date, the ids break the tie.
+        for text in ("Second?", "Third?"):
+            Question.objects.create(question_text=text, pub_date=self.question.pub_date)
+        headers = {"Authorization": f"Bearer {self.token}"}
+        url, pages = "/polls/api/questions/?limit=2", []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                page = self.client.get(url, headers=headers).json()
+            pages.append([question["question_text"] for question in page["results"]])
+            url = page["next"]
+        self.assertEqual(pages, [["Third?", "Second?"], ["Listed?"]])
+        [sql] = [
+            query["sql"]
+            for query in queries.captured_queries
+            if 'FROM "polls_question"' in query["sql"]
+        ]
+        # Outside the OR too, so an index scan can start at the cursor.
+        self.assertIn('AND "polls_question"."pub_date" <=', sql)
@@ -0,0 +1,183 @@
+import fnmatch
+import hashlib
+import mimetypes
+import os
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopUpload
+
+from mysite.metrics import UPLOAD_BYTES
+
+from .blobs import contact_storage
+
+
+class StreamedUploadedFile(UploadedFile):
+    """An upload that was written straight to its blob in Contact storage.
+
+    Assign `storage_name` to the FileField instead of the file itself,
+    otherwise the field copies it once more on save.
+    """
+
+    def __init__(self, storage_name, sha256, **kwargs):
+        super().__init__(contact_storage().open(storage_name), **kwargs)
+        self.storage_name = storage_name
+        self.sha256 = sha256
+
+
+class StreamingUploadHandler(FileUploadHandler):
+    """Writes uploaded files chunk by chunk into Contact storage.
+
+    The file is hashed while it streams, so memory use does not grow with
+    its size, and is then moved to the blob named after its hash. A file
+    that is already stored is not kept twice. Files of a type not in
+    CONTACT_UPLOAD_ALLOWED_TYPES are skipped, and the upload is cut off as
+    soon as it goes over CONTACT_UPLOAD_MAX_BYTES. Either way the reason ends up in
+    `request.upload_error`.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_bytes = settings.CONTACT_UPLOAD_MAX_BYTES
+        self.received = 0
+        self.destination = None
+        self.path = None
+        self.hash = None
+        self.size = 0
+
+    def new_file(self, field_name, file_name, content_type, *args, **kwargs):
+        if content_type in ("", "application/octet-stream"):
+            content_type = mimetypes.guess_type(file_name)[0] or content_type
+        super().new_file(field_name, file_name, content_type, *args, **kwargs)
+
+        if not is_allowed_type(content_type):
+            reject(
+                self.request,
+                f"Files of type {content_type!r} are not accepted.",
+                status=415,
+            )
+            raise SkipFile()
+
+        self.path = contact_storage().incoming_path()
+        self.destination = os.fdopen(
+            os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL), "wb"
+        )
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_bytes:
+            self.discard()
+            reject(self.request, "The upload is too large.")
+            raise StopUpload(connection_reset=True)
+
+        self.destination.write(raw_data)
+        self.hash.update(raw_data)
+        self.size += len(raw_data)
+        UPLOAD_BYTES.inc(("form",), len(raw_data))
+
+    def file_complete(self, file_size):
+        self.destination.close()
+        self.destination = None
+        digest = self.hash.hexdigest()
+        return StreamedUploadedFile(
+            contact_storage().adopt(self.path, digest, self.file_name),
+            digest,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=self.size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+        )
+
+    def upload_interrupted(self):
+        self.discard()
+
+    def discard(self):
+        if self.destination is not None:
+            self.destination.close()
+            self.destination = None
+            os.remove(self.path)
+
+
+def is_allowed_type(content_type):
+    return any(
+        fnmatch.fnmatch(content_type, pattern)
+        for pattern in settings.CONTACT_UPLOAD_ALLOWED_TYPES
+    )
+
+
+def reject(request, message, status=413):
+    if getattr(request, "upload_error", None) is None:
+        request.upload_error = message
+        request.upload_error_status = status
+
+
+def streaming_uploads(view):
+    """Install StreamingUploadHandler for the view's POST requests.
+
+    Requests whose declared size is already over the limit are flagged
+    before any of the body is read. Views must call upload_error() before
+    touching request.POST or request.FILES. CSRF-protected views need
+    `csrf_exempt` outside this decorator and `csrf_protect` inside it, as
+    the CSRF check would read the body with the default handlers.
+    """
+
+    def prepare(request):
+        request.upload_error = None
+        if request.method != "POST":
+            return
+        try:
+            content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > settings.CONTACT_UPLOAD_MAX_BYTES:
+            reject(request, "The upload is too large.")
+        request.upload_handlers = [StreamingUploadHandler(request)]
+
+    if iscoroutinefunction(view):
+
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            prepare(request)
+            return await view(request, *args, **kwargs)
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        prepare(request)
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+def upload_error(request):
+    """Return why the request's upload was rejected, None if it was not.
+
+    Parses the body, unless its declared size was already over the limit.
+    """
+    if request.upload_error is None:
+        request.FILES  # pylint: disable=pointless-statement
+    return request.upload_error
+
+
+def stored_file(upload):
+    """Return what to assign to a FileField for an uploaded file."""
+    if isinstance(upload, StreamedUploadedFile):
+        return upload.storage_name
+    return upload
+
+
+def discard_uploads(request):
+    """Close the streamed files of a request that did not use them.
+
+    Their blobs may be shared with other contacts, so they are left for
+    polls.blobs.collect_garbage() to delete once nothing refers to them.
+    """
+    for upload in request.FILES.values():
+        if isinstance(upload, StreamedUploadedFile):
+            upload.close()
@@ -0,0 +1,305 @@
+"""Resumable uploads of large contact attachments, sent in chunks.
+
+The protocol, under api/contact/uploads/ and with an API token:
+
+1. POST the attachment's `filename`, `size` and `sha256` (hex). The upload
+   created comes back with its `url`, the largest `chunk_size` accepted and
+   the `offset` to send from.
+2. PUT the chunks in order to the upload's `url`, each with the headers
+   Upload-Offset (where it starts in the file) and Upload-Checksum
+   ("sha256 <hex digest of the chunk>"). A chunk sent to another offset
+   than the upload's gets a 409 carrying the right `offset`.
+3. To resume, GET the upload's `url` for the offset to go on from.
+4. Once the last chunk is in, the file is checked against its SHA-256 and
+   moved to its blob. Submit the contact with `upload` set to the upload's
+   id instead of a `file`.
+
+Chunks are written straight to a partial file in Contact storage. A
+complete upload holds a reference to its blob until a contact uses it, so
+the garbage collector leaves it alone. expire_uploads(), run by idle job
+workers and by `manage.py gc_blobs`, deletes the uploads left untouched for
+UPLOAD_EXPIRY seconds. A user has at most CONTACT_CHUNKED_UPLOADS_PER_USER
+uploads at a time.
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from mysite.metrics import UPLOAD_BYTES
+
+from . import blobs
+from .models import ChunkedUpload
+from .upload_handlers import is_allowed_type
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+# Read size when spooling a chunk or hashing the assembled file.
+READ_SIZE = 64 * 1024
+
+UPLOAD_EXPIRY = 7 * 24 * 60 * 60
+
+_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+
+class UploadError(ValueError):
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def _partial_path(upload):
+    return blobs.contact_storage().partial_path(upload.pk)
+
+
+def _digest(value):
+    value = (value or "").strip().lower()
+    if not _SHA256.fullmatch(value):
+        raise UploadError("Expected a SHA-256 as 64 hex digits.")
+    return value
+
+
+def create_upload(owner_id, filename, size, sha256):
+    """Start an upload, raise UploadError if it is not acceptable."""
+    filename = os.path.basename(filename or "")
+    if not filename or len(filename) > 255:
+        raise UploadError("A file name of at most 255 characters is required.")
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    if not is_allowed_type(content_type):
+        raise UploadError(
+            f"Files of type {content_type!r} are not accepted.", status=415
+        )
+    try:
+        size = int(size)
+    except (TypeError, ValueError) as e:
+        raise UploadError("The size must be a number of bytes.") from e
+    if not 0 < size <= settings.CONTACT_CHUNKED_UPLOAD_MAX_BYTES:
+        raise UploadError("The upload is too large.", status=413)
+    # Each upload holds a partial file or a blob until used or expired. Not
+    # locked: concurrent requests may go a few over, which is fine for a cap.
+    if (
+        ChunkedUpload.objects.filter(owner_id=owner_id).count()
+        >= settings.CONTACT_CHUNKED_UPLOADS_PER_USER
+    ):
+        raise UploadError(
+            "Too many uploads in progress, finish or wait for some to expire.",
+            status=429,
+        )
+
+    upload = ChunkedUpload.objects.create(
+        owner_id=owner_id, filename=filename, size=size, sha256=_digest(sha256)
+    )
+    with open(_partial_path(upload), "wb"):
+        pass
+    return upload
+
+
+def parse_checksum(header):
+    """Return the digest of an Upload-Checksum header."""
+    algorithm, _, digest = (header or "").partition(" ")
+    if algorithm.lower() != "sha256":
+        raise UploadError("Expected an Upload-Checksum of the form 'sha256 <hex>'.")
+    return _digest(digest)
+
+
+def get_upload(upload_id, owner_id):
+    """Return the owner's upload, None if there is none."""
+    upload = ChunkedUpload.objects.filter(pk=upload_id, owner_id=owner_id).first()
+    if (
+        upload is not None
+        and upload.status == upload.Status.UPLOADING
+        and upload.offset == upload.size
+    ):
+        # Completing was interrupted after the last chunk was stored.
+        return complete(upload)
+    return upload
+
+
+def _spool(stream, length):
+    # The chunk is read before the upload is locked, a slow client does not
+    # hold the lock for the whole transfer.
+    data = bytearray()
+    while len(data) < length:
+        piece = stream.read(min(READ_SIZE, length - len(data)))
+        if not piece:
+            raise UploadError("The chunk is shorter than its Content-Length.")
+        data += piece
+    return bytes(data)
+
+
+def write_chunk(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    upload_id, owner_id, offset, checksum, stream, length
+):
+    """Store a chunk, return the upload, None if the owner has no such upload.
+
+    Raises UploadError when the chunk is refused.
+    """
+    if not 0 < length <= CHUNK_SIZE:
+        raise UploadError(f"Chunks must be 1 to {CHUNK_SIZE} bytes.", status=413)
+    data = _spool(stream, length)
+    if hashlib.sha256(data).hexdigest() != checksum:
+        raise UploadError("The chunk does not match its checksum.")
+
+    with transaction.atomic():
+        upload = (
+            ChunkedUpload.objects.select_for_update()
+            .filter(pk=upload_id, owner_id=owner_id)
+            .first()
+        )
+        if upload is None:
+            return None
+        if offset != upload.offset or upload.status != upload.Status.UPLOADING:
+            raise UploadError(
+                "The chunk does not start at the upload's offset.",
+                status=409,
+                offset=upload.offset,
+            )
+        if offset + length > upload.size:
+            raise UploadError("The chunk goes past the end of the file.")
+        with open(_partial_path(upload), "r+b") as partial:
+            partial.seek(offset)
+            partial.write(data)
+        UPLOAD_BYTES.inc(("chunked",), length)
+        upload.offset += length
+        upload.save(update_fields=["offset", "updated_at"])
+
+    if upload.offset == upload.size:
+        return complete(upload)
+    return upload
+
+
+def _file_digest(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for piece in iter(lambda: f.read(READ_SIZE), b""):
+            sha256.update(piece)
+    return sha256.hexdigest()
+
+
+def complete(upload):
+    """Move a fully received upload to its blob, return it.
+
+    The file is hashed before the row is locked: a large upload does not
+    hold the lock for the whole read. Returns None if the upload is gone
+    meanwhile. Raises UploadError, and deletes the upload, if the file does
+    not match the SHA-256 it was announced with.
+    """
+    path = _partial_path(upload)
+    try:
+        intact = _file_digest(path) == upload.sha256
+    except FileNotFoundError:
+        # Adopted or discarded by a concurrent request.
+        intact = None
+    with transaction.atomic():
+        # Locked, a retried last chunk may be completing it concurrently:
+        # only the first to get here adopts the file.
+        locked = ChunkedUpload.objects.select_for_update().filter(pk=upload.pk).first()
+        if locked is None or locked.status == locked.Status.COMPLETE:
+            return locked
+        if intact is None:
+            return None
+        if intact:
+            locked.file = blobs.contact_storage().adopt(
+                path, locked.sha256, locked.filename
+            )
+            blobs.acquire(locked.file)
+            locked.status = locked.Status.COMPLETE
+            locked.save(update_fields=["status", "file", "updated_at"])
+            return locked
+    discard(locked)
+    raise UploadError("The file does not match its SHA-256, start over.")
+
+
+def _upload_id(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def completed_upload(upload_id, owner_id):
+    """Return the owner's complete upload, None if there is none."""
+    return ChunkedUpload.objects.filter(
+        pk=_upload_id(upload_id),
+        owner_id=owner_id,
+        status=ChunkedUpload.Status.COMPLETE,
+    ).first()
+
+
+async def acompleted_upload(upload_id, owner_id):
+    return await ChunkedUpload.objects.filter(
+        pk=_upload_id(upload_id),
+        owner_id=owner_id,
+        status=ChunkedUpload.Status.COMPLETE,
+    ).afirst()
+
+
+def consume(upload):
+    """Drop a complete upload, handing its blob to a contact.
+
+    Call it in the transaction saving the contact, before saving it. Returns
+    False, and leaves the blob alone, if another contact got the upload
+    first.
+    """
+    # Locked: of two contacts posted with the same upload, the second waits
+    # here and then finds it gone.
+    locked = (
+        ChunkedUpload.objects.select_for_update()
+        .filter(pk=upload.pk, status=ChunkedUpload.Status.COMPLETE)
+        .first()
+    )
+    if locked is None:
+        return False
+    deleted, _ = ChunkedUpload.objects.filter(pk=locked.pk).delete()
+    if not deleted:
+        return False
+    blobs.release(locked.file)
+    return True
+
+
+def _release(upload):
+    if upload.status == upload.Status.COMPLETE:
+        blobs.release(upload.file)
+    else:
+        try:
+            os.remove(_partial_path(upload))
+        except FileNotFoundError:
+            pass
+
+
+def discard(upload):
+    _release(upload)
+    upload.delete()
+
+
+def expire_uploads(max_age=UPLOAD_EXPIRY, dry_run=False):
+    """Delete the uploads untouched for `max_age` seconds, return how many.
+
+    Safe to run from several processes at once, and next to the requests
+    using the uploads.
+    """
+    expired = ChunkedUpload.objects.filter(
+        updated_at__lt=timezone.now() - timedelta(seconds=max_age)
+    )
+    count = 0
+    for upload in expired.iterator():
+        if not dry_run:
+            # The row goes first, and only if untouched since it was read:
+            # of two processes expiring it, or a chunk or contact using it
+            # meanwhile, only one gets to release its file.
+            deleted, _ = ChunkedUpload.objects.filter(
+                pk=upload.pk, updated_at=upload.updated_at
+            ).delete()
+            if not deleted:
+                continue
+            _release(upload)
+        count += 1
+    return count
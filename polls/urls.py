@@ -1,23 +1,49 @@
+from django.conf import settings
 from django.urls import path
 
-from . import views
+from . import async_views, views
+
+# The hot paths have async-native versions for ASGI deployments
+hot_views = async_views if settings.ASYNC_VIEWS else views
 
 app_name = "polls"
 
 urlpatterns = [
     # ex: /polls/
     # name is helpful for: <a href="{% url 'index' %}">index</a>
-    path("", views.IndexView.as_view(), name="index"),
+    path("", hot_views.IndexView.as_view(), name="index"),
     # ex: /polls/5/
-    path("<int:pk>/", views.DetailView.as_view(), name="detail"),
+    path("<int:pk>/", hot_views.DetailView.as_view(), name="detail"),
     # ex: /polls/5/results/
-    path("<int:pk>/results/", views.ResultsView.as_view(), name="results"),
+    path("<int:pk>/results/", hot_views.ResultsView.as_view(), name="results"),
     # ex: /polls/5/vote/
-    path("<int:question_id>/vote/", views.vote, name="vote"),
+    path("<int:question_id>/vote/", hot_views.vote, name="vote"),
     # ex: /polls/contact
     path("contact/", views.contact_form, name="contactForm"),
     # ex: /polls/contact/success
     path("contact/success/", views.contact_success, name="contactSuccess"),
+    # ex: /polls/api/questions/?cursor=...&limit=50
+    path("api/questions/", hot_views.questions_api, name="apiQuestions"),
     # ex: /polls/api/contact
-    path("api/contact/", views.contact_api, name="apiContactForm"),
+    path("api/contact/", hot_views.contact_api, name="apiContactForm"),
+    # ex: /polls/api/contact/bulk/
+    path("api/contact/bulk/", views.contact_bulk_api, name="apiContactBulk"),
+    # ex: /polls/api/contact/uploads/
+    path(
+        "api/contact/uploads/",
+        views.contact_uploads_api,
+        name="apiContactUploads",
+    ),
+    # ex: /polls/api/contact/uploads/0b8a.../
+    path(
+        "api/contact/uploads/<uuid:upload_id>/",
+        views.contact_upload_api,
+        name="apiContactUpload",
+    ),
+    # ex: /polls/api/contact/5/status/
+    path(
+        "api/contact/<int:pk>/status/",
+        hot_views.contact_status,
+        name="apiContactStatus",
+    ),
 ]
@@ -1,55 +1,135 @@
-from django.http import HttpResponseRedirect, JsonResponse
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404, render
 from django.urls import reverse
+from django.utils.cache import get_conditional_response
 from django.db.models import F
 from django.views import generic
-from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from clients.decorators import api_token_required
+from mysite.query_budget import query_budget
+from . import api, page_cache, snapshots, uploads
+from .bulk import create_contacts, parse_records
+from .counters import VOTE_RECORDERS
+from .jobs import enqueue_contact_jobs, submission_accepted, submission_status
 from .forms import ContactForm
 from .models import Choice, Question, Contact
+from .upload_handlers import (
+    discard_uploads,
+    stored_file,
+    streaming_uploads,
+    upload_error,
+)
 
 
+@query_budget(3, max_time_ms=50)
 class IndexView(generic.ListView):
     template_name = "polls/index.html"
     context_object_name = "latest_question_list"
 
     def get_queryset(self):
         """Return the last five published questions."""
+        # Lazy: only evaluated when the cached fragment has to be rebuilt
         return Question.objects.order_by("-pub_date")[:5]
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["index_version"] = page_cache.index_version()
+        context["page_cache_timeout"] = page_cache.PAGE_CACHE_TIMEOUT
+        return context
 
+
+@query_budget(4, max_time_ms=50)
 class DetailView(generic.DetailView):
     model = Question
     template_name = "polls/detail.html"
 
+    def get_object(self, queryset=None):
+        question = page_cache.get_question(self.kwargs["pk"])
+        if question is None:
+            raise Http404("No question found matching the query")
+        return question
 
-class ResultsView(generic.DetailView):
-    model = Question
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(detail_cache_context(self.object))
+        return context
+
+
+def detail_cache_context(question):
+    return {
+        "question_version": page_cache.question_version(question.pk),
+        "page_cache_timeout": page_cache.PAGE_CACHE_TIMEOUT,
+    }
+
+
+@query_budget(4, max_time_ms=50)
+class ResultsView(generic.TemplateView):
     template_name = "polls/results.html"
 
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Served from the precomputed snapshot, without touching the ORM
+        context["snapshot"] = snapshots.get_snapshot(self.kwargs["pk"])
+        if context["snapshot"] is None:
+            raise Http404("No question found matching the query")
+        return context
+
 
+@query_budget(7, max_time_ms=100)
 def vote(request, question_id):
+    record_vote = VOTE_RECORDERS.get(settings.POLLS_VOTE_MODE)
+    if record_vote is not None:
+        try:
+            choice_id = int(request.POST["choice"])
+        except (KeyError, ValueError):
+            choice_id = None
+        if choice_id is not None and record_vote(question_id, choice_id):
+            transaction.on_commit(lambda: snapshots.record_vote(question_id, choice_id))
+            return HttpResponseRedirect(reverse("polls:results", args=(question_id,)))
+        # Fall through so a missing question still 404s and a bad choice
+        # redisplays the form.
+
     question = get_object_or_404(Question, pk=question_id)
     try:
         selected_choice = question.choice_set.get(pk=request.POST["choice"])
-    except (KeyError, Choice.DoesNotExist):
+    except (KeyError, ValueError, Choice.DoesNotExist):
 
         context = {
             "question": question,
             "error_message": "You didn't select a choice.",
+            **detail_cache_context(question),
         }
 
         # Redisplay the question voting form.
         return render(request, "polls/detail.html", context)
     else:
         selected_choice.votes = F("votes") + 1
-        selected_choice.save()
+        selected_choice.save(update_fields=["votes"])
+        transaction.on_commit(
+            lambda: snapshots.record_vote(question.id, selected_choice.id)
+        )
         # Always return an HttpResponseRedirect after successfully dealing
         # with POST data. This prevents data from being posted twice if a
         # user hits the Back button.
         return HttpResponseRedirect(reverse("polls:results", args=(question.id,)))
 
 
+@query_budget(9, max_time_ms=100)
+@csrf_exempt
+@streaming_uploads
+@csrf_protect
 def contact_form(request):
+    error = upload_error(request) if request.method == "POST" else None
+    if error:
+        return render(
+            request,
+            "polls/contactForm.html",
+            {"form": ContactForm(), "upload_error": error},
+            status=request.upload_error_status,
+        )
+
     if request.method == "POST":
         form = ContactForm(request.POST, request.FILES)
         if form.is_valid():
@@ -57,7 +137,7 @@ def contact_form(request):
             name = form.cleaned_data["name"]
             email = form.cleaned_data["email"]
             message = form.cleaned_data["message"]
-            file = request.FILES.get("file")
+            file = stored_file(request.FILES.get("file"))
 
             contact = Contact(
                 name=name,
@@ -66,41 +146,193 @@ def contact_form(request):
                 file=file,
             )
 
-            contact.save()  # Save the contact information to the database
+            with transaction.atomic():
+                contact.save()  # Save the contact information to the database
+                enqueue_contact_jobs(contact)
 
             return HttpResponseRedirect(
                 reverse("polls:contactSuccess")
             )  # Redirect to a success page
+        discard_uploads(request)
     else:
         form = ContactForm()
 
     return render(request, "polls/contactForm.html", {"form": form})
 
 
+@query_budget(2, max_time_ms=50)
 def contact_success(request):
     return render(request, "polls/contactSuccess.html")
 
 
+@query_budget(9, max_time_ms=100)
 @csrf_exempt
+@api_token_required
+@streaming_uploads
 def contact_api(request):
     if request.method == "POST":
+        error = upload_error(request)
+        if error:
+            return JsonResponse({"error": error}, status=request.upload_error_status)
+
         name = request.POST.get("name")
         email = request.POST.get("email")
         message = request.POST.get("message")
-        file = request.FILES.get("file", None)
+        file = stored_file(request.FILES.get("file", None))
 
         if not name or not email or not message:
+            discard_uploads(request)
             return JsonResponse(
                 {"error": "Name, email, and message are required."}, status=400
             )
 
+        # A large attachment sent beforehand through the chunked uploads.
+        upload = None
+        if request.POST.get("upload"):
+            upload = uploads.completed_upload(
+                request.POST["upload"], request.api_claims["sub"]
+            )
+            if upload is None:
+                discard_uploads(request)
+                return JsonResponse(
+                    {"error": "Unknown or unfinished upload."}, status=400
+                )
+            file = upload.file
+
         contact = Contact(
             name=name,
             email=email,
             message=message,
             file=file,
+            submitted_by_id=request.api_claims["sub"],
         )
-        contact.save()  # Save the contact information to the database
+        # The rest of the processing is left to the `run_jobs` workers.
+        with transaction.atomic():
+            if upload is not None and not uploads.consume(upload):
+                return JsonResponse(
+                    {"error": "Unknown or unfinished upload."}, status=400
+                )
+            contact.save()  # Save the contact information to the database
+            enqueue_contact_jobs(contact)
 
-        return JsonResponse({"message": "Contact information submitted successfully!"})
+        return JsonResponse(submission_accepted(contact), status=202)
     return JsonResponse({"error": "Invalid request method."}, status=405)
+
+
+# Grows with the number of chunks: covers a 10k-record import on PostgreSQL.
+@query_budget(50, max_time_ms=10000)
+@csrf_exempt
+@api_token_required
+@streaming_uploads
+def contact_bulk_api(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+    error = upload_error(request)
+    if error:
+        return JsonResponse({"error": error}, status=request.upload_error_status)
+
+    try:
+        records = parse_records(request)
+    except ValueError as e:
+        discard_uploads(request)
+        return JsonResponse({"error": str(e)}, status=400)
+    results = create_contacts(records, request.FILES, request.api_claims["sub"])
+    discard_uploads(request)
+
+    created = sum(1 for result in results if "id" in result)
+    return JsonResponse(
+        {"created": created, "failed": len(results) - created, "results": results}
+    )
+
+
+def _upload_state(request, upload):
+    return {
+        "id": upload.pk,
+        "url": request.build_absolute_uri(
+            reverse("polls:apiContactUpload", args=(upload.pk,))
+        ),
+        "size": upload.size,
+        "offset": upload.offset,
+        "chunk_size": uploads.CHUNK_SIZE,
+        "status": upload.status,
+    }
+
+
+@query_budget(2, max_time_ms=50)
+@csrf_exempt
+@api_token_required
+def contact_uploads_api(request):
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+    try:
+        upload = uploads.create_upload(
+            request.api_claims["sub"],
+            request.POST.get("filename"),
+            request.POST.get("size"),
+            request.POST.get("sha256"),
+        )
+    except uploads.UploadError as e:
+        return JsonResponse({"error": str(e)}, status=e.status)
+    return JsonResponse(_upload_state(request, upload), status=201)
+
+
+# Up to eight more for the last chunk, which completes the upload in a
+# transaction of its own.
+@query_budget(12, max_time_ms=100)
+@csrf_exempt
+@api_token_required
+def contact_upload_api(request, upload_id):
+    owner_id = request.api_claims["sub"]
+    try:
+        if request.method == "GET":
+            upload = uploads.get_upload(upload_id, owner_id)
+        elif request.method == "PUT":
+            try:
+                offset = int(request.headers.get("Upload-Offset", ""))
+                length = int(request.META.get("CONTENT_LENGTH") or 0)
+            except ValueError:
+                return JsonResponse(
+                    {"error": "Upload-Offset and Content-Length are required."},
+                    status=400,
+                )
+            upload = uploads.write_chunk(
+                upload_id,
+                owner_id,
+                offset,
+                uploads.parse_checksum(request.headers.get("Upload-Checksum")),
+                request,
+                length,
+            )
+        else:
+            return JsonResponse({"error": "Invalid request method."}, status=405)
+    except uploads.UploadError as e:
+        error = {"error": str(e)}
+        if e.offset is not None:
+            error["offset"] = e.offset
+        return JsonResponse(error, status=e.status)
+    if upload is None:
+        return JsonResponse({"error": "Upload not found."}, status=404)
+    return JsonResponse(_upload_state(request, upload))
+
+
+@query_budget(4, max_time_ms=50)
+@api_token_required
+def contact_status(request, pk):
+    status = submission_status(pk, request.api_claims["sub"])
+    if status is None:
+        return JsonResponse({"error": "Submission not found."}, status=404)
+    return JsonResponse(status)
+
+
+@query_budget(4, max_time_ms=50)
+@api_token_required
+def questions_api(request):
+    try:
+        cursor, limit = api.parse_page(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    etag = api.page_etag(api.list_version(), cursor, limit)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+    return api.page_response(request, api.question_page(cursor, limit), limit, etag)
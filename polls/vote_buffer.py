@@ -0,0 +1,225 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Case, F, Value, When
+
+from mysite.local_cache import LocalCache
+
+from .models import Choice
+
+logger = logging.getLogger(__name__)
+
+# Seconds a question's choice ids are trusted before being reloaded.
+CHOICE_IDS_TTL = 60
+
+# Questions whose choice ids are kept, least recently voted on dropped first.
+CHOICE_IDS_SIZE = 1024
+
+
+class VoteBuffer:
+    """Per-process accumulator of vote increments.
+
+    Votes are counted in memory, keyed by question and choice, and written
+    out by a background thread with one UPDATE per question. Pending votes
+    are flushed when the buffer holds `max_size` votes, when the oldest one
+    is `max_age` seconds old, and when the process exits, which bounds what
+    a crashed worker can lose. Requests never wait for a flush.
+
+    Until they are flushed, votes are only known to the process that
+    counted them. The shared results snapshot is patched with each vote
+    (see polls.snapshots), but a snapshot rebuilt by another worker misses
+    them: with several workers, results may lag by up to `max_age`.
+
+    Votes whose flush failed are kept for the next one, up to `max_pending`:
+    past that add() refuses them, and the caller writes them directly.
+
+    A question's votes leave pending() only once its UPDATE is done, under
+    a lock pending() waits for, so reading the rows first and pending()
+    second never counts them twice.
+    """
+
+    def __init__(self, flush_interval, max_size, max_age, max_pending):
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.max_age = max_age
+        self.max_pending = max_pending
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._inflight_lock = threading.Lock()
+        self._pending = defaultdict(lambda: defaultdict(int))
+        self._inflight = {}
+        self._size = 0
+        self._oldest = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._wake = threading.Event()
+
+    def add(self, question_id, choice_id):
+        """Count a vote, waking the flusher thread when the buffer is due.
+
+        Returns False, without counting it, when the buffer is full.
+        """
+        with self._lock:
+            if self._size >= self.max_pending:
+                return False
+            self._pending[question_id][choice_id] += 1
+            self._size += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            overdue = (
+                self._size >= self.max_size
+                or time.monotonic() - self._oldest >= self.max_age
+            )
+        self._start()
+        if overdue:
+            self._wake.set()
+        return True
+
+    def pending(self, question_id):
+        """Return {choice_id: votes} not yet committed for the question."""
+        with self._inflight_lock, self._lock:
+            deltas = defaultdict(int, self._inflight.get(question_id, {}))
+            for choice_id, votes in self._pending.get(question_id, {}).items():
+                deltas[choice_id] += votes
+        return dict(deltas)
+
+    def flush(self):
+        """Write the pending votes out. Returns the number of votes written."""
+        with self._flush_lock:
+            with self._inflight_lock, self._lock:
+                self._inflight = dict(self._pending)
+                self._pending = defaultdict(lambda: defaultdict(int))
+                self._size = 0
+                self._oldest = None
+
+            written = 0
+            try:
+                for question_id in list(self._inflight):
+                    with self._inflight_lock:
+                        deltas = self._inflight[question_id]
+                        Choice.objects.filter(
+                            question_id=question_id, pk__in=deltas
+                        ).update(
+                            votes=F("votes")
+                            + Case(
+                                *[
+                                    When(pk=pk, then=Value(n))
+                                    for pk, n in deltas.items()
+                                ],
+                                default=Value(0),
+                            )
+                        )
+                        del self._inflight[question_id]
+                    written += sum(deltas.values())
+            except Exception:  # pylint: disable=broad-exception-caught
+                logger.exception("Flushing buffered votes failed, keeping them")
+                with self._inflight_lock, self._lock:
+                    for question_id, deltas in self._inflight.items():
+                        for choice_id, votes in deltas.items():
+                            self._pending[question_id][choice_id] += votes
+                            self._size += votes
+                    if self._size and self._oldest is None:
+                        self._oldest = time.monotonic()
+                    self._inflight = {}
+            return written
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        self.flush()
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(
+                target=self._run, name="vote-buffer-flusher", daemon=True
+            )
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            close_old_connections()
+            self.flush()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_vote_buffer():
+    global _buffer  # pylint: disable=global-statement
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = VoteBuffer(
+                    flush_interval=settings.POLLS_VOTE_BUFFER_FLUSH_MS / 1000,
+                    max_size=settings.POLLS_VOTE_BUFFER_MAX_SIZE,
+                    max_age=settings.POLLS_VOTE_BUFFER_MAX_AGE_MS / 1000,
+                    max_pending=settings.POLLS_VOTE_BUFFER_MAX_PENDING,
+                )
+    return _buffer
+
+
+# question_id -> choice ids, so buffered votes can be checked without a
+# query per vote.
+choice_ids_cache = LocalCache(CHOICE_IDS_SIZE, CHOICE_IDS_TTL)
+
+
+def _choice_ids(question_id, refresh=False):
+    ids = None if refresh else choice_ids_cache.get(question_id)
+    if ids is None:
+        ids = frozenset(
+            Choice.objects.filter(question_id=question_id).values_list("pk", flat=True)
+        )
+        choice_ids_cache.set(question_id, ids)
+    return ids
+
+
+async def _achoice_ids(question_id, refresh=False):
+    ids = None if refresh else choice_ids_cache.get(question_id)
+    if ids is None:
+        ids = frozenset(
+            [
+                pk
+                async for pk in Choice.objects.filter(
+                    question_id=question_id
+                ).values_list("pk", flat=True)
+            ]
+        )
+        choice_ids_cache.set(question_id, ids)
+    return ids
+
+
+def record_buffered_vote(question_id, choice_id):
+    """Count a vote in the process buffer, or directly if it is full.
+
+    Returns False when the choice does not belong to the question.
+    """
+    if choice_id not in _choice_ids(question_id):
+        # The choice may have been added since the ids were loaded.
+        if choice_id not in _choice_ids(question_id, refresh=True):
+            return False
+    if not get_vote_buffer().add(question_id, choice_id):
+        Choice.objects.filter(pk=choice_id).update(votes=F("votes") + 1)
+    return True
+
+
+async def arecord_buffered_vote(question_id, choice_id):
+    if choice_id not in await _achoice_ids(question_id):
+        if choice_id not in await _achoice_ids(question_id, refresh=True):
+            return False
+    if not get_vote_buffer().add(question_id, choice_id):
+        await Choice.objects.filter(pk=choice_id).aupdate(votes=F("votes") + 1)
+    return True
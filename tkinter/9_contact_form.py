@@ -1,9 +1,30 @@
+import os
 import tkinter as tk
-from tkinter import filedialog, messagebox  # pylint: disable=no-name-in-module
-import requests
+from tkinter import filedialog, messagebox, ttk  # pylint: disable=no-name-in-module
 
-# API URL (replace with your actual Django contact API endpoint)
+from submission_engine import SubmissionEngine
+
+# API URLs (replace with your actual Django endpoints)
 API_URL = "http://127.0.0.1:8000/polls/api/contact/"
+BULK_API_URL = "http://127.0.0.1:8000/polls/api/contact/bulk/"
+UPLOADS_URL = "http://127.0.0.1:8000/polls/api/contact/uploads/"
+TOKEN_URL = "http://127.0.0.1:8000/clients/api/token/"
+
+# The client user the API calls are made as
+API_EMAIL = os.environ.get("CONTACT_API_EMAIL", "")
+API_PASSWORD = os.environ.get("CONTACT_API_PASSWORD", "")
+
+# Where submissions wait until the server accepted them
+OUTBOX_DIR = os.environ.get(
+    "CONTACT_OUTBOX_DIR", os.path.join(os.path.expanduser("~"), ".contact_outbox")
+)
+
+# How often the UI checks on the submissions, in milliseconds
+POLL_INTERVAL = 200
+
+engine = SubmissionEngine(
+    API_URL, BULK_API_URL, UPLOADS_URL, TOKEN_URL, API_EMAIL, API_PASSWORD, OUTBOX_DIR
+)
 
 
 def submit_form():
@@ -11,40 +32,64 @@ def submit_form():
     email = email_entry.get()
     message = message_entry.get("1.0", tk.END).strip()
     file_path = file_label["text"]
+    file_path = file_path if file_path != "No file selected" else None
 
     # Validate inputs
     if not name or not email or not message:
         messagebox.showerror("Validation Error", "All fields except file are required.")
         return
-
-    try:
-        # Prepare data and files for API request
-        data = {
-            "name": name,
-            "email": email,
-            "message": message,
-        }
-        files = (
-            {"file": open(file_path, "rb")}
-            if file_path and file_path != "No file selected"
-            else None
-        )
-
-        # Send data to the Django API
-        response = requests.post(API_URL, data=data, files=files)
-        response.raise_for_status()
-
-        # Handle successful submission
-        messagebox.showinfo("Success", "Contact information submitted successfully!")
-        name_entry.delete(0, tk.END)
-        email_entry.delete(0, tk.END)
-        message_entry.delete("1.0", tk.END)
-        file_label.config(text="No file selected")
-
-    except requests.exceptions.RequestException as e:
-        messagebox.showerror("Error", f"Failed to submit contact information: {e}")
-    except FileNotFoundError:
+    if file_path and not os.path.isfile(file_path):
         messagebox.showerror("Error", "Selected file not found!")
+        return
+
+    # Queue the submission, the engine sends it in the background
+    engine.submit({"name": name, "email": email, "message": message}, file_path)
+    name_entry.delete(0, tk.END)
+    email_entry.delete(0, tk.END)
+    message_entry.delete("1.0", tk.END)
+    file_label.config(text="No file selected")
+    update_status()
+
+
+def update_status(text=None):
+    pending = engine.pending()
+    status = f"{pending} submission(s) pending" if pending else "All submitted"
+    status_label.config(text=f"{status}. {text}" if text else status)
+
+
+def poll_engine():
+    # Runs on the Tk main thread, every POLL_INTERVAL
+    text = None
+    for kind, details in engine.poll():
+        if kind == "rejected":
+            entry = details["entry"]["data"]
+            messagebox.showerror(
+                "Error",
+                f"Submission from {entry['email']} was rejected: {details['error']}",
+            )
+        elif kind == "unauthorized":
+            messagebox.showerror(
+                "Error",
+                f"The server refused the API credentials: {details['error']}. Set "
+                "CONTACT_API_EMAIL and CONTACT_API_PASSWORD, submissions are kept "
+                "until then.",
+            )
+            text = "Not signed in to the server, submissions are kept"
+        elif kind == "retrying":
+            text = f"Server unreachable, retrying in {details['delay']:.0f}s"
+        elif kind == "progress":
+            sent, total = details["sent"], details["total"]
+            progress_bar.config(maximum=total, value=sent)
+            text = f"Uploading attachment, {sent // 2**20} of {total // 2**20} MB"
+        if kind in ("sent", "rejected"):
+            progress_bar.config(value=0)
+    update_status(text)
+    root.after(POLL_INTERVAL, poll_engine)
+
+
+def close():
+    engine.stop()
+    root.destroy()
 
 
 def select_file():
@@ -83,5 +128,16 @@ file_label.grid(row=3, column=1, padx=10, pady=5)
 submit_button = tk.Button(root, text="Submit", command=submit_form)
 submit_button.grid(row=4, column=1, padx=10, pady=10, sticky="e")
 
-# Run the application
+# Submission status
+status_label = tk.Label(root, text="", fg="gray")
+status_label.grid(row=5, column=0, columnspan=2, padx=10, pady=5, sticky="w")
+
+# Upload progress of a large attachment
+progress_bar = ttk.Progressbar(root, length=300)
+progress_bar.grid(row=6, column=0, columnspan=2, padx=10, pady=5, sticky="we")
+
+# Run the application, sending what an earlier run left pending
+root.protocol("WM_DELETE_WINDOW", close)
+engine.start()
+root.after(POLL_INTERVAL, poll_engine)
 root.mainloop()
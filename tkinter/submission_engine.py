@@ -0,0 +1,505 @@
+"""Background submission of contact form entries.
+
+SubmissionEngine keeps the network off the Tk main thread: submit() only
+writes the entry to the outbox directory and wakes a worker thread, which
+sends pending entries over one pooled requests.Session. A single entry goes
+to the contact API, several are sent BATCH_SIZE at a time to the bulk API.
+
+Entries stay in the outbox until the server accepted or rejected them, so
+entries made offline or before a crash are sent once the server can be
+reached again, after the next start at the latest. Failed attempts are
+retried with exponential backoff. The UI learns what happened by calling
+poll() from Tk's after() loop.
+
+Attachments larger than CHUNKED_THRESHOLD go up first as a resumable
+chunked upload (see polls.uploads), then the entry is sent referring to it.
+The upload is recorded in the entry, so a dropped connection or a restart
+only resends the chunk that was in flight. Its progress is reported as
+"progress" events.
+
+When the server refuses the email and password, the engine reports it as
+an "unauthorized" event and waits for the next submission before trying
+again: the entries are kept, but retrying cannot help until the
+credentials are fixed.
+
+A request whose response is lost (a read timeout, say) is sent again,
+so the server may see an entry twice. An entry the engine fails on in an
+unexpected way is moved to the failed entries, so one bad entry never
+stops the outbox from draining.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50
+
+# Attachments sent in one batch, under the server's CONTACT_UPLOAD_MAX_BYTES
+# (20 MB by default) with room for the rest of the request
+MAX_BATCH_BYTES = 16 * 1024 * 1024
+
+RETRY_DELAY = 1
+MAX_RETRY_DELAY = 60
+
+# Seconds to connect, and to wait for the response
+TIMEOUT = (5, 120)
+
+# Attachments above this size are sent in chunks, resumably
+CHUNKED_THRESHOLD = 8 * 1024 * 1024
+
+# Read size when hashing an attachment
+READ_SIZE = 1024 * 1024
+
+# Get a new token when the current one expires in less than this
+TOKEN_MARGIN = 60
+
+
+class TransientError(Exception):
+    """The request may succeed later, keep the entries."""
+
+
+class RejectedError(Exception):
+    """The server refused the request for good."""
+
+
+class CredentialsError(Exception):
+    """The server refused the email and password, keep the entries."""
+
+
+# Errors that leave the entries pending
+KEEP_ENTRIES = (requests.RequestException, TransientError, CredentialsError)
+
+
+def retry_delay(failures):
+    # Jitter keeps clients that went offline together from coming back together
+    delay = min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** (failures - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for piece in iter(lambda: f.read(READ_SIZE), b""):
+            sha256.update(piece)
+    return sha256.hexdigest()
+
+
+class Outbox:
+    """Pending entries, one JSON file each, named in submission order.
+
+    Entries the server rejected are moved to the `failed` subdirectory.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.failed_directory = os.path.join(directory, "failed")
+        os.makedirs(self.failed_directory, exist_ok=True)
+
+    def _path(self, entry_id, directory=None):
+        return os.path.join(directory or self.directory, f"{entry_id}.json")
+
+    def _write(self, path, entry):
+        # Written aside and renamed, a crash never leaves half an entry
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(temporary, path)
+
+    def _names(self):
+        return sorted(
+            name for name in os.listdir(self.directory) if name.endswith(".json")
+        )
+
+    def add(self, data, file_path=None):
+        entry_id = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        entry = {"id": entry_id, "data": data, "file_path": file_path}
+        self._write(self._path(entry_id), entry)
+        return entry
+
+    def pending(self, limit):
+        entries = []
+        for name in self._names()[:limit]:
+            try:
+                with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+                    entries.append(json.load(f))
+            except ValueError:
+                os.replace(
+                    os.path.join(self.directory, name),
+                    os.path.join(self.failed_directory, name),
+                )
+        return entries
+
+    def update(self, entry):
+        self._write(self._path(entry["id"]), entry)
+
+    def count(self):
+        return len(self._names())
+
+    def remove(self, entry):
+        os.remove(self._path(entry["id"]))
+
+    def reject(self, entry, error):
+        self._write(
+            self._path(entry["id"], self.failed_directory), {**entry, "error": error}
+        )
+        self.remove(entry)
+
+
+class SubmissionEngine:
+    def __init__(
+        self, api_url, bulk_url, uploads_url, token_url, email, password, outbox_dir
+    ):
+        self.api_url = api_url
+        self.bulk_url = bulk_url
+        self.uploads_url = uploads_url
+        self.token_url = token_url
+        self.credentials = {"email": email, "password": password}
+        self.outbox = Outbox(outbox_dir)
+        self.events = queue.Queue()
+
+        # One connection is reused for every request
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._token = None
+        self._token_expires_at = 0
+
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="submission-engine", daemon=True
+        )
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        """Stop the worker, pending entries are sent after the next start."""
+        self._stopped.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self.session.close()
+
+    def submit(self, data, file_path=None):
+        """Queue an entry, returns at once."""
+        entry = self.outbox.add(data, file_path)
+        self._wake.set()
+        return entry
+
+    def pending(self):
+        return self.outbox.count()
+
+    def poll(self):
+        """Return the (kind, details) events since the last call.
+
+        Kinds are "sent", "rejected", "retrying", "progress" and
+        "unauthorized".
+        """
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def _run(self):
+        failures = 0
+        while not self._stopped.is_set():
+            # Submissions from here on are read below, or wake the next wait
+            self._wake.clear()
+            try:
+                entries = self.outbox.pending(BATCH_SIZE)
+                if not entries:
+                    self._wake.wait()
+                    self._wake.clear()
+                    continue
+                batch = self._batch(entries)
+                if len(batch) > 1:
+                    self._send_batch_safely(batch)
+                else:
+                    self._send_safely(entries[0])
+                failures = 0
+            except CredentialsError as e:
+                failures = 0
+                self.events.put(("unauthorized", {"error": str(e)}))
+                # Until a new submission, the credentials will not change
+                self._wake.wait()
+                self._wake.clear()
+            except KEEP_ENTRIES as e:
+                failures += 1
+                self._wait_to_retry(failures, e)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # The outbox itself failed (a full disk, say), try again
+                logger.exception("Sending the outbox failed")
+                failures += 1
+                self._wait_to_retry(failures, e)
+
+    def _wait_to_retry(self, failures, error):
+        delay = retry_delay(failures)
+        self.events.put(("retrying", {"delay": delay, "error": str(error)}))
+        # A new submission also ends the wait
+        self._wake.wait(delay)
+        self._wake.clear()
+
+    def _batch(self, entries):
+        """Return the first entries, to send in one request.
+
+        Chunked uploads go alone, in order with the other entries, and the
+        attachments of a batch add up to MAX_BATCH_BYTES at most.
+        """
+        batch = []
+        size = 0
+        for entry in entries:
+            if self._chunked(entry):
+                break
+            size += self._attachment_size(entry)
+            if batch and size > MAX_BATCH_BYTES:
+                break
+            batch.append(entry)
+        return batch
+
+    def _send_safely(self, entry):
+        """Send the entry, moving it to the failed entries on a bug."""
+        try:
+            self._send_one(entry)
+        except KEEP_ENTRIES:
+            raise
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logger.exception("Sending entry %s failed", entry["id"])
+            self._rejected(entry, f"{type(e).__name__}: {e}")
+
+    def _send_batch_safely(self, entries):
+        try:
+            self._send_batch(entries)
+        except KEEP_ENTRIES:
+            raise
+        except Exception:  # pylint: disable=broad-exception-caught
+            # Send the entries still pending one by one, to set aside only
+            # the one at fault
+            logger.exception("Sending a batch failed")
+            pending = {entry["id"] for entry in self.outbox.pending(BATCH_SIZE)}
+            for entry in entries:
+                if entry["id"] in pending:
+                    self._send_safely(entry)
+
+    def _auth_headers(self):
+        if self._token is None or self._token_expires_at - time.time() < TOKEN_MARGIN:
+            if not all(self.credentials.values()):
+                raise CredentialsError("No API email and password are set")
+            response = self.session.post(
+                self.token_url, data=self.credentials, timeout=TIMEOUT
+            )
+            if response.status_code == 401:
+                raise CredentialsError(self._error(response))
+            self._check(response)
+            self._token = response.json()["token"]
+            self._token_expires_at = response.json()["expires_at"]
+        return {"Authorization": f"Bearer {self._token}"}
+
+    def _check(self, response):
+        status = response.status_code
+        if status == 401:
+            # Expired, or signed with a key rotated out since
+            self._token = None
+            raise TransientError("Not authenticated")
+        if status in (408, 429) or status >= 500:
+            raise TransientError(f"Server answered {status}")
+        if status >= 400:
+            raise RejectedError(f"{status}: {self._error(response)}")
+
+    def _error(self, response):
+        try:
+            return response.json().get("error") or response.text
+        except ValueError:
+            return response.text
+
+    def _get(self, url):
+        """Return the JSON at url, None on a 404."""
+        response = self.session.get(url, headers=self._auth_headers(), timeout=TIMEOUT)
+        if response.status_code == 404:
+            return None
+        self._check(response)
+        return response.json()
+
+    def _post(self, url, **kwargs):
+        response = self.session.post(
+            url, headers=self._auth_headers(), timeout=TIMEOUT, **kwargs
+        )
+        self._check(response)
+        return response.json()
+
+    def _sent(self, entry, result):
+        self.outbox.remove(entry)
+        self.events.put(("sent", {"entry": entry, "result": result}))
+
+    def _rejected(self, entry, error):
+        self.outbox.reject(entry, error)
+        self.events.put(("rejected", {"entry": entry, "error": error}))
+
+    def _open(self, stack, entry):
+        """Return the entry's attachment opened, None if it has none."""
+        if not entry["file_path"]:
+            return None
+        handle = stack.enter_context(open(entry["file_path"], "rb"))
+        return (os.path.basename(entry["file_path"]), handle)
+
+    def _attachment_size(self, entry):
+        try:
+            return os.path.getsize(entry["file_path"]) if entry["file_path"] else 0
+        except OSError:
+            # Left to _send_one to reject
+            return 0
+
+    def _chunked(self, entry):
+        return "upload" in entry or self._attachment_size(entry) > CHUNKED_THRESHOLD
+
+    def _progress(self, entry, sent, total):
+        self.events.put(("progress", {"entry": entry, "sent": sent, "total": total}))
+
+    def _start_upload(self, entry):
+        path = entry["file_path"]
+        upload = self._post(
+            self.uploads_url,
+            data={
+                "filename": os.path.basename(path),
+                "size": os.path.getsize(path),
+                "sha256": file_sha256(path),
+            },
+        )
+        entry["upload"] = {"id": upload["id"], "url": upload["url"]}
+        self.outbox.update(entry)
+        return upload
+
+    def _upload(self, entry):
+        """Send the entry's attachment in chunks, return the upload's id.
+
+        Resumes the upload recorded in the entry, from the offset the server
+        has, and starts a new one if the server no longer knows it.
+        """
+        upload = None
+        if "upload" in entry:
+            upload = self._get(entry["upload"]["url"])
+        if upload is None:
+            upload = self._start_upload(entry)
+        with open(entry["file_path"], "rb") as f:
+            while upload["status"] != "complete":
+                offset = upload["offset"]
+                self._progress(entry, offset, upload["size"])
+                f.seek(offset)
+                chunk = f.read(upload["chunk_size"])
+                if not chunk:
+                    raise RejectedError("The attachment shrank since it was queued")
+                digest = hashlib.sha256(chunk).hexdigest()
+                response = self.session.put(
+                    upload["url"],
+                    data=chunk,
+                    headers={
+                        **self._auth_headers(),
+                        "Upload-Offset": str(offset),
+                        "Upload-Checksum": f"sha256 {digest}",
+                    },
+                    timeout=TIMEOUT,
+                )
+                if response.status_code == 409:
+                    # The server has more (or less) than we thought, ask it
+                    upload = self._get(upload["url"])
+                elif response.status_code == 404:
+                    upload = None
+                else:
+                    self._check(response)
+                    upload = response.json()
+                if upload is None:
+                    # Expired meanwhile, start over on the next attempt
+                    del entry["upload"]
+                    self.outbox.update(entry)
+                    raise TransientError("The upload expired")
+        self._progress(entry, upload["size"], upload["size"])
+        return upload["id"]
+
+    def _send_chunked(self, entry):
+        try:
+            data = {**entry["data"], "upload": self._upload(entry)}
+            result = self._post(self.api_url, data=data)
+        except OSError as e:
+            self._rejected(entry, f"Cannot read the attachment: {e}")
+            return
+        except RejectedError as e:
+            self._rejected(entry, str(e))
+            return
+        self._sent(entry, result)
+
+    def _send_one(self, entry):
+        if self._chunked(entry):
+            self._send_chunked(entry)
+            return
+        # The ExitStack closes the attachment whatever happens
+        with ExitStack() as stack:
+            try:
+                attachment = self._open(stack, entry)
+            except OSError as e:
+                self._rejected(entry, f"Cannot read the attachment: {e}")
+                return
+            try:
+                result = self._post(
+                    self.api_url,
+                    data=entry["data"],
+                    files={"file": attachment} if attachment else None,
+                )
+            except RejectedError as e:
+                self._rejected(entry, str(e))
+                return
+        self._sent(entry, result)
+
+    def _send_batch(self, entries):
+        with ExitStack() as stack:
+            sent = []
+            records = []
+            files = {}
+            for entry in entries:
+                record = dict(entry["data"])
+                try:
+                    attachment = self._open(stack, entry)
+                except OSError as e:
+                    self._rejected(entry, f"Cannot read the attachment: {e}")
+                    continue
+                if attachment:
+                    record["file"] = f"file{len(files)}"
+                    files[record["file"]] = attachment
+                records.append(record)
+                sent.append(entry)
+            if not sent:
+                return
+            try:
+                if files:
+                    result = self._post(
+                        self.bulk_url,
+                        data={"contacts": json.dumps(records)},
+                        files=files,
+                    )
+                else:
+                    result = self._post(self.bulk_url, json=records)
+            except RejectedError:
+                # The batch as a whole was refused (too large, say): send the
+                # entries one by one to find out which ones are at fault
+                stack.close()
+                for entry in sent:
+                    self._send_one(entry)
+                return
+        for entry, outcome in zip(sent, result["results"]):
+            if "id" in outcome:
+                self._sent(entry, outcome)
+            else:
+                self._rejected(entry, json.dumps(outcome["errors"]))
@@ -0,0 +1,199 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import submission_engine
+from submission_engine import SubmissionEngine
+
+API_URL = "http://testserver/polls/api/contact/"
+BULK_URL = "http://testserver/polls/api/contacts/bulk/"
+TOKEN_URL = "http://testserver/clients/api/token/"
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self.data = data
+        self.text = "" if data is None else str(data)
+
+    def json(self):
+        if self.data is None:
+            raise ValueError("No JSON in the response")
+        return self.data
+
+
+class FakeSession:
+    """Answers the engine's requests, by URL, without a network."""
+
+    def __init__(self, answer, password="secret"):
+        self.answer = answer
+        self.password = password
+        self.requests = []
+        self.token_requests = 0
+
+    def post(self, url, **kwargs):
+        if url == TOKEN_URL:
+            self.token_requests += 1
+            if kwargs["data"]["password"] != self.password:
+                return FakeResponse(401, {"error": "Invalid email or password"})
+            return FakeResponse(
+                200, {"token": "token", "expires_at": time.time() + 3600}
+            )
+        self.requests.append((url, kwargs))
+        return self.answer(url, kwargs)
+
+    def close(self):
+        pass
+
+
+class SubmissionEngineTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.engine = SubmissionEngine(
+            API_URL,
+            BULK_URL,
+            "http://testserver/polls/api/uploads/",
+            TOKEN_URL,
+            "voter@example.com",
+            "secret",
+            os.path.join(self.directory, "outbox"),
+        )
+
+    def attachment(self, name, size):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        return path
+
+    def drain(self, answer):
+        self.engine.session = FakeSession(answer)
+        self.engine.start()
+        self.addCleanup(self.engine.stop)
+        deadline = time.monotonic() + 5
+        while self.engine.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.engine.pending(), 0)
+        return self.engine.poll()
+
+    def test_sends_one_entry(self):
+        self.engine.submit({"name": "Voter"})
+        events = self.drain(lambda url, kwargs: FakeResponse(201, {"id": 1}))
+        self.assertEqual(self.engine.session.requests[0][0], API_URL)
+        self.assertEqual([kind for kind, _ in events], ["sent"])
+
+    def test_sends_entries_in_batches(self):
+        for name in ("Voter", "Other"):
+            self.engine.submit({"name": name})
+        events = self.drain(
+            lambda url, kwargs: FakeResponse(200, {"results": [{"id": 1}, {"id": 2}]})
+        )
+        self.assertEqual([url for url, _ in self.engine.session.requests], [BULK_URL])
+        self.assertEqual([kind for kind, _ in events], ["sent", "sent"])
+
+    def test_unexpected_error_fails_the_entry_only(self):
+        """An entry the engine chokes on is set aside, the others still go."""
+
+        def answer(url, kwargs):
+            if url == BULK_URL or kwargs["data"]["name"] == "Bad":
+                # 201 with a body that is not JSON
+                return FakeResponse(201)
+            return FakeResponse(201, {"id": 1})
+
+        self.engine.submit({"name": "Bad"})
+        self.engine.submit({"name": "Good"})
+        with self.assertLogs("submission_engine", "ERROR"):
+            events = self.drain(answer)
+        self.assertEqual([kind for kind, _ in events], ["rejected", "sent"])
+        self.assertEqual(events[0][1]["error"], "ValueError: No JSON in the response")
+        self.assertEqual(len(os.listdir(self.engine.outbox.failed_directory)), 1)
+        self.assertTrue(self.engine._thread.is_alive())
+
+    def test_outbox_errors_are_retried(self):
+        self.engine.submit({"name": "Voter"})
+        pending = self.engine.outbox.pending
+        failures = [OSError("No space left on device")]
+
+        def failing_pending(limit):
+            if failures:
+                raise failures.pop()
+            return pending(limit)
+
+        self.engine.outbox.pending = failing_pending
+        with mock.patch.object(submission_engine, "RETRY_DELAY", 0):
+            with self.assertLogs("submission_engine", "ERROR"):
+                events = self.drain(lambda url, kwargs: FakeResponse(201, {"id": 1}))
+        self.assertEqual([kind for kind, _ in events], ["retrying", "sent"])
+
+    def wait_for_event(self):
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            events = self.engine.poll()
+            if events:
+                return events
+            time.sleep(0.01)
+        self.fail("No event")
+
+    def test_refused_credentials_are_not_retried(self):
+        self.engine.session = FakeSession(
+            lambda url, kwargs: FakeResponse(201, {"id": 1}), password="other"
+        )
+        self.engine.submit({"name": "Voter"})
+        self.engine.start()
+        self.addCleanup(self.engine.stop)
+        self.assertEqual(
+            self.wait_for_event(),
+            [("unauthorized", {"error": "Invalid email or password"})],
+        )
+        time.sleep(0.1)
+        self.assertEqual(self.engine.session.token_requests, 1)
+        self.assertEqual(self.engine.poll(), [])
+        self.assertEqual(self.engine.pending(), 1)
+        # A new submission tries again, with the credentials fixed this time
+        self.engine.session.password = "secret"
+        self.engine.submit({"name": "Other"})
+        deadline = time.monotonic() + 5
+        while self.engine.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.engine.pending(), 0)
+
+    def test_missing_credentials(self):
+        self.engine.credentials["password"] = ""
+        self.engine.session = FakeSession(None)
+        self.engine.submit({"name": "Voter"})
+        self.engine.start()
+        self.addCleanup(self.engine.stop)
+        self.assertEqual(
+            self.wait_for_event(),
+            [("unauthorized", {"error": "No API email and password are set"})],
+        )
+        self.assertEqual(self.engine.session.token_requests, 0)
+
+    def test_batches_are_capped_by_size(self):
+        entries = [
+            self.engine.submit({"name": "Voter"}, self.attachment(name, 6))
+            for name in ("a.txt", "b.txt")
+        ] + [self.engine.submit({"name": "Voter"})]
+        with mock.patch.object(submission_engine, "MAX_BATCH_BYTES", 10):
+            self.assertEqual(self.engine._batch(entries), entries[:1])
+            self.assertEqual(self.engine._batch(entries[1:]), entries[1:])
+        with mock.patch.object(submission_engine, "MAX_BATCH_BYTES", 5):
+            # Alone, an entry is sent whatever its size
+            self.assertEqual(self.engine._batch(entries), entries[:1])
+
+    def test_batches_stop_at_chunked_uploads(self):
+        entries = [
+            self.engine.submit({"name": "Voter"}),
+            self.engine.submit({"name": "Voter"}, self.attachment("big.bin", 11)),
+            self.engine.submit({"name": "Voter"}),
+        ]
+        with mock.patch.object(submission_engine, "CHUNKED_THRESHOLD", 10):
+            self.assertEqual(self.engine._batch(entries), entries[:1])
+            self.assertEqual(self.engine._batch(entries[1:]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()